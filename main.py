@@ -0,0 +1,7 @@
+# Точка входа Dockerfile: uvicorn main:app — шлюз для устройств (src/gateway)
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "src"))
+
+from gateway.gateway import app  # noqa: E402,F401
@@ -1,34 +1,124 @@
 # --- commands.py (или в том же файле над main) ---
 import re
-from typing import Iterable
+import threading
+from dataclasses import dataclass
+from typing import Iterable, Optional
 
 # Списки команд
 START_COMMANDS = ["Шаня", "Привет Шаня", "Шанни", "Шань"]
 PAUSE_COMMANDS = ["пауза", "замри", "подожди", "стоп", "останови"]
 RESUME_COMMANDS = ["продолжи", "продолжить", "возобнови", "продолжай"]
 
+# Классы команд
+START = "start"
+PAUSE = "pause"
+RESUME = "resume"
+
+_TOKEN_RE = re.compile(r"\w+")
+_END = object()  # ключ листа в префиксном дереве
+
 
 def _normalize(s: str) -> str:
     return (s or "").strip().lower()
 
 
-def _any_word_in_text(text: str, words: Iterable[str]) -> bool:
-    """Матчим целые слова, а не подстроки (пример: 'стоп' ≠ 'ростопырка')."""
-    text = _normalize(text)
-    for w in words:
-        w = _normalize(w)
-        if not w:
-            continue
-        if re.search(rf"\b{re.escape(w)}\b", text):
-            return True
-    return False
+def _tokens(text: str) -> list[re.Match]:
+    return list(_TOKEN_RE.finditer(_normalize(text)))
+
+
+@dataclass(frozen=True)
+class CommandMatch:
+    intent: str
+    phrase: str
+    start: int  # позиция в нормализованном тексте
+    end: int
+
+
+class CommandRegistry:
+    """
+    Реестр локальных команд: все фразы собраны в одно префиксное дерево по словам.
+
+    Матчим целые слова, а не подстроки (пример: 'стоп' ≠ 'ростопырка').
+    Один проход по тексту находит все команды сразу; стоимость зависит от длины
+    текста и длины фраз, а не от их количества. register() достраивает дерево
+    на месте, без пересборки.
+
+    version растёт при каждой новой фразе: распознаватели (registry=...) и шлюз сверяют её
+    и пересобирают грамматику Vosk из phrases(), не дожидаясь перезапуска.
+    """
+
+    def __init__(self):
+        self._trie: dict = {}
+        self._intents: dict[str, list[str]] = {}  # порядок регистрации = приоритет
+        self._lock = threading.Lock()
+        self.version = 0
+
+    def register(self, intent: str, phrases: Iterable[str]) -> None:
+        with self._lock:
+            known = self._intents.setdefault(intent, [])
+            added = False
+            for phrase in phrases:
+                words = [m.group() for m in _tokens(phrase)]
+                if not words or phrase in known:
+                    continue
+                node = self._trie
+                for w in words:
+                    node = node.setdefault(w, {})
+                node.setdefault(_END, []).append((intent, phrase))
+                known.append(phrase)
+                added = True
+            if added:
+                self.version += 1
+
+    def intents(self) -> list[str]:
+        return list(self._intents)
+
+    def phrases(self, intents: Optional[Iterable[str]] = None) -> list[str]:
+        with self._lock:
+            names = list(self._intents) if intents is None else intents
+            return [p for name in names for p in self._intents.get(name, [])]
+
+    def match_all(self, text: str) -> list[CommandMatch]:
+        """Все вхождения фраз в тексте (за один проход)."""
+        toks = _tokens(text)
+        found: list[CommandMatch] = []
+        for i, first in enumerate(toks):
+            node = self._trie
+            for tok in toks[i:]:
+                node = node.get(tok.group())
+                if node is None:
+                    break
+                for intent, phrase in node.get(_END, ()):
+                    found.append(CommandMatch(intent, phrase, first.start(), tok.end()))
+        return found
+
+    def match(self, text: str, intents: Optional[Iterable[str]] = None) -> Optional[CommandMatch]:
+        """Самая приоритетная команда в тексте (по порядку регистрации классов)."""
+        allowed = list(self._intents) if intents is None else list(intents)
+        best: Optional[CommandMatch] = None
+        for m in self.match_all(text):
+            if m.intent not in allowed:
+                continue
+            if best is None or allowed.index(m.intent) < allowed.index(best.intent):
+                best = m
+        return best
+
+
+REGISTRY = CommandRegistry()
+REGISTRY.register(START, START_COMMANDS)
+REGISTRY.register(PAUSE, PAUSE_COMMANDS)
+REGISTRY.register(RESUME, RESUME_COMMANDS)
+
+
+def match_command(text: str) -> Optional[CommandMatch]:
+    return REGISTRY.match(text)
 
 
 def is_start(text: str) -> bool:
-    return _any_word_in_text(text, START_COMMANDS)
+    return REGISTRY.match(text, (START,)) is not None
 
 def is_pause(text: str) -> bool:
-    return _any_word_in_text(text, PAUSE_COMMANDS)
+    return REGISTRY.match(text, (PAUSE,)) is not None
 
 def is_resume(text: str) -> bool:
-    return _any_word_in_text(text, RESUME_COMMANDS)
+    return REGISTRY.match(text, (RESUME,)) is not None
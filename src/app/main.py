@@ -1,76 +1,165 @@
 import asyncio
-import time
 from pathlib import Path
-import threading
 
+from infrastructure.utils.startup import mark_startup, startup_report  # первым: точка отсчёта запуска
+from common.utils import get_env
+from infrastructure.utils.memory import RSS
+from infrastructure.utils.metrics import METRICS
 from infrastructure.repositories.http.send import SendHttp
+from infrastructure.repositories.local_commands.src.sqlite_impl import SqliteLocalCommandRepository
+from infrastructure.repositories.response_cache.src.file_impl import FileResponseCache
+from infrastructure.repositories.voice_clips.src.pack_impl import PackVoiceClips
+from infrastructure.services.audio_bus.audio_bus import AudioCaptureBus
+from infrastructure.services.vad.vad import FrameVad
+from infrastructure.services.voice_playback.voice_playback import EchoGate, PlaybackEngine
 from infrastructure.services.voice_recording.voice_recording import VoiceRecording
-from src.infrastructure.services.voice_recognition.voice_recognition import VoiceStreamRecognizer
-from commands import is_pause, is_resume, is_start  # ваши функции
-
-send_repository = SendHttp()
+from src.infrastructure.services.voice_recognition.voice_recognition import (
+    MODE_FULL, MODE_KEYWORDS, VoiceStreamRecognizer,
+)
+from commands import PAUSE, REGISTRY, is_start  # ваши функции
+from pipeline import VoicePipeline
+
+# Профиль для плат с 512 МБ (Orange Pi Zero 2W): короче кольцо шины и порог spill записи,
+# загрузка мелкими кусками, без SDK openai, пиковый RSS по этапам реплики — в лог после ответа
+LOW_MEMORY = get_env("APPI_LOW_MEMORY", "0") == "1"
+
+playback = PlaybackEngine(samplerate=24000)
+# Повторяющиеся вопросы («какая погода», приветствия) отвечаются из кэша без генерации
+RESPONSE_CACHE = True
+# Формат загрузки: pcm16 или g711_ulaw / g711_alaw (8 кГц, в 6 раз меньше байт по Wi-Fi)
+UPLOAD_FORMAT = get_env("APPI_UPLOAD_FORMAT", "pcm16")
+send_repository = SendHttp(playback=playback, cache=FileResponseCache() if RESPONSE_CACHE else None,
+                           input_audio_format=UPLOAD_FORMAT, low_memory=LOW_MEMORY)
+local_commands = SqliteLocalCommandRepository()
+# Подтверждения и ошибки озвучиваются локально (espeak, один раз) и играются из mmap-пакета
+voice_clips = PackVoiceClips(samplerate=24000)
+
+# Потоковая отправка: аудио уходит в Realtime API, пока пользователь ещё говорит
+STREAM_UPLOAD = True
+
+# Постоянное прослушивание только по грамматике команд (дешевле по CPU на ARM).
+# Фразы локальной БД команд требуют полного распознавания: после каждой реплики
+# оно включается на FOLLOW_UP_S секунд («Шаня, …» → ответ → «включи свет на кухне»)
+KEYWORD_SPOTTING = True
+FOLLOW_UP_S = 8.0
+
+# Barge-in: во время ответа распознаватель слушает стоп-слова (с гейтом эха динамика)
+BARGE_IN = True
+
+# «Слушаю» после ключевого слова. Выключено: запись уже идёт, и подтверждение
+# из динамика попадёт в вопрос (в one-shot пользователь говорит без паузы)
+ACK_ON_WAKE = False
+
+# Несколько микрофонов: индексы устройств через запятую («1,3»). У каждого — свой
+# декодер Vosk в отдельном процессе; запись идёт с того, кто услышал громче
+MIC_DEVICES = [int(i) for i in get_env("APPI_MIC_DEVICES", "").split(",") if i.strip()]
+
+# Весь голосовой цикл — корутины в одном loop (VoicePipeline). С несколькими микрофонами
+# распознают процессы-воркеры (start(on_command)), но запись и ответ — тот же VoicePipeline
+ASYNC_RECOGNITION = len(MIC_DEVICES) <= 1
+
+mark_startup("imports")
 
 
 async def main():
     SRC_DIR = Path(__file__).resolve().parents[1]  # .../src
-    MODEL_DIR = SRC_DIR / "infrastructure/services/voice_recognition/vosk-model-small-ru-0.22"
-
-    # Важно: внутри вашего VoiceStreamRecognizer должны быть ТОЛЬКО start() и pause(flag)
-    vr = VoiceStreamRecognizer(model_path=str(MODEL_DIR))
-
-    recorder = VoiceRecording(samplerate=24000)
 
-    recording_active = threading.Event()
-    loop = asyncio.get_running_loop()
-
-    def on_file_ready(path: Path):
-        # Отправляем корутину в текущий loop (он запущен asyncio.run(main()))
-        fut = asyncio.run_coroutine_threadsafe(
-            send_repository.send_audio_file(path, samplerate=24000),
-            loop
+    MODEL_DIR = SRC_DIR / "infrastructure/services/voice_recognition/vosk-model-small-ru-0.22"
+    # Vosk читает модель в свою память (mmap не поддерживает) — это основная неизбежная часть RSS
+    bus_capacity_s = 4.0 if LOW_MEMORY else 10.0
+
+    # Один открытый поток микрофона на распознавание и запись: захват на родной частоте
+    # устройства, каждый потребитель получает свою частоту через ресемплер шины
+    if len(MIC_DEVICES) > 1:
+        # процессы-воркеры и numpy-арбитраж нужны только с несколькими микрофонами
+        from infrastructure.services.voice_recognition.multi_source import MultiSourceRecognizer
+
+        buses = [AudioCaptureBus(samplerate=None, device_index=i, block_ms=20, capacity_s=bus_capacity_s)
+                 for i in MIC_DEVICES]
+        # модель грузится один раз и делится между процессами-воркерами (fork/COW)
+        vr = MultiSourceRecognizer(
+            model_path=str(MODEL_DIR),
+            buses=buses,
+            samplerate=16000,
+            mode=MODE_KEYWORDS if KEYWORD_SPOTTING else MODE_FULL,
+            registry=REGISTRY,  # новые команды в REGISTRY пересобирают грамматику на лету
+            wake_on_partial=True,
+            partial_filter=is_start,
+            block_ms=40,
+        )
+        bus = vr.active_bus
+    else:
+        bus = AudioCaptureBus(samplerate=None, device_index=MIC_DEVICES[0] if MIC_DEVICES else None, block_ms=20,
+                              capacity_s=bus_capacity_s)
+
+        # Важно: внутри вашего VoiceStreamRecognizer должны быть ТОЛЬКО start() и pause(flag)
+        vr = VoiceStreamRecognizer(
+            model_path=str(MODEL_DIR),
+            bus=bus,
+            samplerate=16000,  # родная частота модели Vosk
+            mode=MODE_KEYWORDS if KEYWORD_SPOTTING else MODE_FULL,
+            registry=REGISTRY,
+            # ключевое слово ловим по промежуточному результату, блоками по 40 мс
+            wake_on_partial=True,
+            partial_filter=is_start,
+            block_ms=40,
         )
 
-        def _after_send(_):
-            try:
-                fut.result()  #
-            except Exception as e:
-                print(f"[SEND ERROR] {e}")
-            vr.pause(False)
-            recording_active.clear()
-
-        fut.add_done_callback(_after_send)
-
-    def on_command(text: str):
-        print(f"[Распознано] {text}")
-
-        # Старт записи по ключевой фразе
-        if is_start(text):
-            if recording_active.is_set():
-                return  # запись уже идёт
-            print("[CMD] is_start → пауза распознавания и старт записи")
-            recording_active.set()
-
-            vr.pause(True)
-
-            # если бывают конфликты на macOS при открытии второго потока,
-
-            recorder.record_async(on_done=on_file_ready)
-            return
+    # Фоновые потоки — только после распознавателя: MultiSourceRecognizer форкает воркеры
+    # в конструкторе, и fork при уже работающих потоках может унаследовать чужую блокировку.
+    # Метрики реплик: APPI_METRICS_FILE — JSON-файл, APPI_METRICS_PORT — http://127.0.0.1:PORT/metrics
+    METRICS.start_exporter(path=get_env("APPI_METRICS_FILE", "") or None,
+                           port=int(get_env("APPI_METRICS_PORT", "0")))
+    RSS.start()
 
-        # Ручные команды (если нужны)
-        if is_pause(text):
-            print("[CMD] is_pause")
-            vr.pause(True)
-            return
+    # pre-roll: запись начинается чуть раньше срабатывания ключевого слова
+    # конец фразы — по вероятности речи с адаптивным шумовым фоном, а не по жёсткой секунде тишины
+    # в low-memory длинная фраза уходит во временный файл уже после ~20 с, а не ~3 мин
+    recorder = VoiceRecording(bus=bus, samplerate=24000, pre_roll_ms=300,
+                              vad=FrameVad(samplerate=24000, end_silence_s=0.6),
+                              spill_bytes=(1 if LOW_MEMORY else 8) * 1024 * 1024)
 
-        if is_resume(text):
-            print("[CMD] is_resume")
-            vr.pause(False)
-            return
+    loop = asyncio.get_running_loop()
 
-    vr.start(on_command=on_command)
-    # Держим событие, чтобы loop жил (или замените на свою логику завершения)
-    await asyncio.Event().wait()
+    if BARGE_IN:
+        stop_phrases = REGISTRY.phrases(intents=[PAUSE])
+        echo_gate = EchoGate(playback)
+
+        def on_playback(active: bool):
+            vr.barge_in(active, keywords=stop_phrases, gate=echo_gate)
+
+        send_repository.on_playback = on_playback
+
+    # Один диспетчер команд на все пути: с одним микрофоном распознавание — стадия loop
+    # (vr.commands()), с несколькими — воркеры и поток-диспетчер, текст передаётся в loop
+    pipeline = VoicePipeline(vr, recorder, send_repository, local_commands=local_commands,
+                             voice_clips=voice_clips, ack_on_wake=ACK_ON_WAKE,
+                             follow_up_s=FOLLOW_UP_S if KEYWORD_SPOTTING else None,
+                             stream_upload=STREAM_UPLOAD)
+    pipeline_task = None
+    if ASYNC_RECOGNITION:
+        pipeline_task = asyncio.create_task(pipeline.run(), name="voice-pipeline")
+    else:
+        vr.start(on_command=lambda text: pipeline.on_command_threadsafe(loop, text))
+
+    async def warm_up():
+        try:
+            await send_repository.warm_up()
+        except Exception as e:
+            print(f"[WARMUP ERROR] {e}")
+
+    # Прогрев сокета и озвучка локальных фраз (если пакет устарел) идут параллельно с загрузкой модели
+    warm_task = asyncio.create_task(warm_up())
+    clips_task = loop.run_in_executor(None, voice_clips.ensure)
+    await loop.run_in_executor(None, vr.wait_ready)
+    print(startup_report())
+    await warm_task
+    await clips_task
+    if pipeline_task is not None:
+        await pipeline_task
+    else:
+        # Держим событие, чтобы loop жил (или замените на свою логику завершения)
+        await asyncio.Event().wait()
 
 
 if __name__ == "__main__":
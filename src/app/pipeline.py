@@ -0,0 +1,183 @@
+import asyncio
+from typing import Optional
+
+from commands import PAUSE, RESUME, START, match_command
+from infrastructure.repositories.http.send import SendHttp
+from infrastructure.repositories.local_commands.local_commands import ILocalCommandRepository
+from infrastructure.repositories.voice_clips.src.pack_impl import LISTENING, OFFLINE, PAUSED, RESUMED, SEND_ERROR
+from infrastructure.repositories.voice_clips.voice_clips import IVoiceClips
+from infrastructure.services.voice_recognition.voice_recognition import MODE_FULL, VoiceStreamRecognizer
+from infrastructure.services.voice_recording.recording_buffer import RecordingBuffer
+from infrastructure.services.voice_recording.voice_recording import VoiceRecording
+from infrastructure.utils.metrics import METRICS
+
+
+class VoicePipeline:
+    """
+    Голосовой цикл целиком в одном event loop: распознавание → запись → загрузка → ответ.
+
+    Особенности:
+      - Стадии — корутины над общей шиной захвата: vr.commands() (декодирование Vosk
+        в отдельном потоке-исполнителе) и recorder.stream() (VAD прямо в loop);
+        потоков записи, очередей-посредников и run_coroutine_threadsafe нет.
+      - Реплика — отдельная задача (asyncio.Task): распознавание стоп-слов продолжает
+        работать, пока она пишет вопрос и играет ответ; закрытие конвейера её отменяет.
+      - Единственный диспетчер команд: распознаватель на потоках (несколько микрофонов)
+        передаёт текст через on_command_threadsafe — реплика всё равно идёт в loop.
+        Вопрос пишется с vr.active_bus — микрофона, победившего в арбитраже.
+      - stream_upload=False: вопрос сначала записывается целиком, потом отправляется одним буфером.
+      - follow_up_s: после реплики распознавание на столько секунд переходит в полный словарь
+        (set_mode) — фразы локальной БД команд слышны без ключевого слова.
+      - Переполнение явное: распознавание перескакивает к свежему звуку (SKIP_TO_LATEST),
+        запись теряет только перезаписанное кольцом шины (DROP_OLDEST).
+    """
+
+    def __init__(
+        self,
+        vr: VoiceStreamRecognizer,
+        recorder: VoiceRecording,
+        send: SendHttp,
+        local_commands: Optional[ILocalCommandRepository] = None,
+        voice_clips: Optional[IVoiceClips] = None,
+        samplerate: int = 24000,
+        ack_on_wake: bool = False,
+        follow_up_s: Optional[float] = None,
+        stream_upload: bool = True,
+    ):
+        self.vr = vr
+        self.recorder = recorder
+        self.send = send
+        self.local_commands = local_commands
+        self.voice_clips = voice_clips
+        self.samplerate = int(samplerate)
+        self.ack_on_wake = bool(ack_on_wake)
+        self.follow_up_s = follow_up_s
+        self.stream_upload = bool(stream_upload)
+
+        self._turn: Optional[asyncio.Task] = None
+        self._tasks: set[asyncio.Task] = set()
+
+    # ---------------------- API ----------------------
+
+    async def run(self) -> None:
+        """Слушать и отвечать, пока задачу не отменят."""
+        try:
+            async for text in self.vr.commands():
+                self.on_command(text)
+        finally:
+            await self.close()
+
+    def on_command_threadsafe(self, loop: asyncio.AbstractEventLoop, text: str) -> None:
+        """on_command из потока распознавания (vr.start): разбор команды — в loop."""
+        loop.call_soon_threadsafe(self.on_command, text)
+
+    def on_command(self, text: str) -> None:
+        print(f"[Распознано] {text}")
+
+        cmd = match_command(text)
+        if cmd is None:
+            # Локальная БД команд — до любого обращения в облако
+            action = self.local_commands.get_action_by_phrase(text) if self.local_commands else None
+            if action:
+                print(f"[LOCAL CMD] {action}")
+            return
+
+        if cmd.intent == START:
+            if self._turn is not None and not self._turn.done():
+                return  # реплика уже идёт
+            print("[CMD] is_start → пауза распознавания и старт записи")
+            METRICS.begin_turn()
+            # запись — с конца ключевой фразы: уже сказанный вопрос берётся из кольца шины
+            start_pos = self.vr.position_after(cmd.end)
+            self.vr.pause(True)
+            if self.ack_on_wake:
+                self.say(LISTENING)
+            if self.vr.active_bus is not None:
+                self.recorder.bus = self.vr.active_bus  # с нескольких микрофонов — победивший в арбитраже
+            if start_pos is not None:
+                bus = self.recorder.bus
+                print(f"[CMD] one-shot: запись с конца ключевой фразы "
+                      f"({(bus.position - start_pos) / bus.samplerate:.2f} с назад)")
+            self._turn = asyncio.create_task(self._run_turn(start_pos), name="voice-turn")
+            return
+
+        # Стоп-слово во время ответа: замолчать и отменить генерацию
+        if cmd.intent == PAUSE and self.send.responding:
+            print("[CMD] barge-in → стоп ответа")
+            METRICS.count("barge_in")
+            self._spawn(self.send.cancel())
+            self.say(PAUSED)  # прозвучит, как только отменённый ответ замолчит
+            return
+
+        if cmd.intent == PAUSE:
+            print("[CMD] is_pause")
+            self.say(PAUSED)
+            self.vr.pause(True)
+            return
+
+        if cmd.intent == RESUME:
+            print("[CMD] is_resume")
+            self.say(RESUMED)
+            self.vr.pause(False)
+
+    def say(self, name: str) -> None:
+        """Локальная фраза: без сети, звук из памяти."""
+        clip = self.voice_clips.get(name) if self.voice_clips is not None else None
+        if clip is not None:
+            self._spawn(self.send.play_clip(clip, samplerate=self.samplerate))
+
+    async def close(self) -> None:
+        """Отменить текущую реплику и фоновые задачи."""
+        tasks = list(self._tasks)
+        if self._turn is not None:
+            tasks.append(self._turn)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._turn = None
+
+    # ---------------------- внутренняя логика ----------------------
+
+    async def _run_turn(self, start_pos: Optional[int]) -> None:
+        # TLS и session.update идут параллельно с речью пользователя
+        self._spawn(self._warm_up())
+        try:
+            if self.stream_upload:
+                await self.send.send_audio_stream(self.recorder.stream(start_pos), samplerate=self.samplerate)
+            else:
+                buffer = await self._record_buffer(start_pos)
+                if buffer is not None:
+                    await self.send.send_audio_buffer(buffer, samplerate=self.samplerate)
+        except Exception as e:
+            print(f"[SEND ERROR] {e}")
+            self.say(OFFLINE if isinstance(e, (OSError, asyncio.TimeoutError)) else SEND_ERROR)
+        finally:
+            self.vr.pause(False)
+            if self.follow_up_s:
+                self.vr.set_mode(MODE_FULL, timeout=self.follow_up_s)
+
+    async def _record_buffer(self, start_pos: Optional[int]) -> Optional[RecordingBuffer]:
+        rec = self.recorder
+        buffer = RecordingBuffer(rec.samplerate, rec.channels, spill_bytes=rec.spill_bytes)
+        try:
+            async for chunk in rec.stream(start_pos):
+                buffer.write(chunk)
+        except BaseException:
+            buffer.close()
+            raise
+        if len(buffer) == 0:
+            buffer.close()
+            return None
+        return buffer  # закроет send_audio_buffer
+
+    async def _warm_up(self) -> None:
+        try:
+            await self.send.warm_up()
+        except Exception as e:
+            print(f"[WARMUP ERROR] {e}")
+
+    def _spawn(self, coro) -> None:
+        # ссылка на задачу держится до её конца (иначе её может собрать GC)
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
@@ -0,0 +1,170 @@
+"""
+Подмена модуля sounddevice для бенчмарка: вход проигрывает фикстуру, выход пишет в память.
+
+Подключается до импорта приложения:
+    sys.modules["sounddevice"] = fake_sounddevice
+Время — time.monotonic(), как у METRICS: моменты доставки блоков и первого звука
+на выходе сравниваются с метками этапов напрямую.
+"""
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+
+class PortAudioError(Exception):
+    pass
+
+
+class CallbackFlags:
+    def __bool__(self) -> bool:
+        return False
+
+
+class _Default:
+    device = None
+    channels = 1
+    samplerate = None
+
+
+default = _Default()
+
+
+class _Fixture:
+    """Что играет «микрофон» и с какой скоростью (speed > 1 — быстрее реального времени)."""
+
+    def __init__(self):
+        self.pcm = np.zeros(0, dtype=np.int16)
+        self.samplerate = 48000
+        self.speed = 1.0
+        self.input: Optional["RawInputStream"] = None
+        self.output: Optional["RawOutputStream"] = None
+
+
+FIXTURE = _Fixture()
+
+
+def configure(pcm: np.ndarray, samplerate: int, speed: float = 1.0) -> None:
+    FIXTURE.pcm = np.ascontiguousarray(pcm, dtype=np.int16)
+    FIXTURE.samplerate = int(samplerate)
+    FIXTURE.speed = float(speed)
+
+
+def query_devices(device=None, kind=None):
+    dev = {
+        "name": "bench-fixture",
+        "index": 0,
+        "max_input_channels": 1,
+        "max_output_channels": 1,
+        "default_samplerate": float(FIXTURE.samplerate),
+    }
+    if device is None and kind is None:
+        return [dev]
+    return dev
+
+
+class _Stream:
+    """Поток с собственным тактовым потоком: блоки идут по расписанию, без накопления дрейфа."""
+
+    def __init__(self, samplerate=None, blocksize=None, dtype="int16", channels=1, device=None,
+                 callback=None, latency=None, **kwargs):
+        if dtype != "int16":
+            raise PortAudioError(f"bench: поддерживается только int16, запрошен {dtype}")
+        self.samplerate = int(samplerate or FIXTURE.samplerate)
+        self.blocksize = int(blocksize or 1024)
+        self.channels = int(channels or 1)
+        self.callback = callback
+        self.active = False
+        self.t_start: Optional[float] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self.active:
+            return
+        self.active = True
+        if self.callback is not None:
+            self._thread = threading.Thread(target=self._run, name=type(self).__name__, daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self.active = False
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1.0)
+        self._thread = None
+
+    def close(self) -> None:
+        self.stop()
+
+    def _period(self) -> float:
+        return self.blocksize / self.samplerate / FIXTURE.speed
+
+    def _run(self) -> None:
+        self.t_start = time.monotonic()
+        i = 0
+        while self.active:
+            deadline = self.t_start + (i + 1) * self._period()
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self._tick(i)
+            i += 1
+
+    def _tick(self, i: int) -> None:
+        raise NotImplementedError
+
+
+class RawInputStream(_Stream):
+    """Отдаёт фикстуру блоками; после её конца — тишину."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.samplerate != FIXTURE.samplerate:
+            raise PortAudioError(f"bench: устройство работает на {FIXTURE.samplerate} Гц, запрошено {self.samplerate}")
+        self.frames_delivered = 0
+        FIXTURE.input = self
+
+    def delivered_at(self, sample: int) -> float:
+        """Момент, когда блок с этим сэмплом фикстуры попал в колбэк."""
+        block = sample // self.blocksize + 1
+        return self.t_start + block * self._period()
+
+    def _tick(self, i: int) -> None:
+        pcm = FIXTURE.pcm
+        start = i * self.blocksize
+        block = pcm[start:start + self.blocksize]
+        if block.size < self.blocksize:
+            block = np.concatenate((block, np.zeros(self.blocksize - block.size, dtype=np.int16)))
+        self.frames_delivered = start + self.blocksize
+        self.callback(block.tobytes(), self.blocksize, None, CallbackFlags())
+
+
+class RawOutputStream(_Stream):
+    """Забирает звук у колбэка (или через write) и запоминает моменты начала звучания."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.onsets: list[float] = []  # моменты перехода тишина → звук
+        self.frames_played = 0
+        self.frames_audible = 0
+        self._audible = False
+        FIXTURE.output = self
+
+    def write(self, data) -> None:
+        a = np.frombuffer(data, dtype=np.int16)
+        self._account(a)
+        time.sleep(a.size / self.channels / self.samplerate / FIXTURE.speed)
+
+    def _tick(self, i: int) -> None:
+        out = bytearray(self.blocksize * self.channels * 2)
+        self.callback(out, self.blocksize, None, CallbackFlags())
+        self._account(np.frombuffer(out, dtype=np.int16))
+
+    def _account(self, a: np.ndarray) -> None:
+        audible = bool(a.size) and bool(np.any(a))
+        if audible and not self._audible:
+            self.onsets.append(time.monotonic())
+        self._audible = audible
+        self.frames_played += a.size // self.channels
+        if audible:
+            self.frames_audible += a.size // self.channels
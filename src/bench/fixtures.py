@@ -0,0 +1,76 @@
+"""
+Фикстуры для бенчмарка: WAV/PCM с разметкой реплики.
+
+Разметка (секунды от начала фикстуры) лежит рядом, в <фикстура>.json:
+    {"wake_end_s": 1.1, "speech_end_s": 3.2}
+wake_end_s — конец ключевой фразы, speech_end_s — конец вопроса.
+"""
+import json
+import wave
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+
+@dataclass
+class Fixture:
+    pcm: np.ndarray          # int16, моно
+    samplerate: int
+    wake_end_s: float
+    speech_end_s: float
+    name: str
+
+    @property
+    def duration_s(self) -> float:
+        return self.pcm.size / self.samplerate
+
+    def repeated(self, turns: int) -> "Fixture":
+        return Fixture(np.tile(self.pcm, turns), self.samplerate, self.wake_end_s, self.speech_end_s, self.name)
+
+
+def load(path: Path, samplerate: Optional[int] = None) -> Fixture:
+    """WAV (PCM16, моно) или сырой .pcm (s16le; частота — samplerate)."""
+    path = Path(path)
+    if path.suffix.lower() == ".wav":
+        with wave.open(str(path), "rb") as w:
+            if w.getsampwidth() != 2 or w.getnchannels() != 1:
+                raise ValueError(f"{path}: нужен WAV PCM16 моно")
+            rate = w.getframerate()
+            pcm = np.frombuffer(w.readframes(w.getnframes()), dtype=np.int16)
+    else:
+        if samplerate is None:
+            raise ValueError(f"{path}: для .pcm нужна частота (--rate)")
+        rate = samplerate
+        pcm = np.fromfile(path, dtype=np.int16)
+
+    marks_path = path.with_suffix(".json")
+    if not marks_path.exists():
+        raise FileNotFoundError(f"Нет разметки {marks_path} (wake_end_s, speech_end_s)")
+    marks = json.loads(marks_path.read_text())
+    return Fixture(pcm.copy(), rate, float(marks["wake_end_s"]), float(marks["speech_end_s"]), path.name)
+
+
+def synthetic(samplerate: int = 48000, tail_s: float = 4.0, seed: int = 0) -> Fixture:
+    """
+    Детерминированная «реплика» без настоящей речи: фон, «ключевое слово», пауза,
+    «вопрос» (гармонический сигнал с формантной огибающей), тишина на ответ.
+    Годится для всего, кроме распознавания (тогда пробуждение симулируется).
+    """
+    rng = np.random.default_rng(seed)
+
+    def noise(seconds: float) -> np.ndarray:
+        return rng.normal(0, 60, int(samplerate * seconds))
+
+    def speech(seconds: float) -> np.ndarray:
+        t = np.arange(int(samplerate * seconds)) / samplerate
+        f0 = 130 + 25 * np.sin(2 * np.pi * 0.8 * t)
+        phase = 2 * np.pi * np.cumsum(f0) / samplerate
+        voiced = sum(np.sin(k * phase) / k for k in range(1, 15))
+        syllables = np.clip(np.sin(2 * np.pi * 4 * t), 0, None) ** 0.5
+        return voiced * syllables * 3500 + rng.normal(0, 60, t.size)
+
+    parts = [noise(0.5), speech(0.6), noise(0.3), speech(1.8), noise(tail_s)]
+    pcm = np.clip(np.concatenate(parts), -32768, 32767).astype(np.int16)
+    return Fixture(pcm, samplerate, wake_end_s=1.1, speech_end_s=3.2, name=f"synthetic@{samplerate}")
@@ -0,0 +1,135 @@
+"""
+Локальный сервер, повторяющий событийный протокол Realtime API в объёме, который
+использует OpenAiLLMService: session.update, input_audio_buffer.append/commit/clear,
+response.create/cancel, conversation.item.delete. Задержки задаются в ServerConfig.
+"""
+import asyncio
+import base64
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+import numpy as np
+import websockets
+from websockets.exceptions import ConnectionClosed
+
+
+@dataclass
+class ServerConfig:
+    commit_delay_s: float = 0.02        # input_audio_buffer.committed после commit
+    transcript: str = "какая погода"
+    transcript_delay_s: float = 0.3     # транскрипт вопроса после commit
+    first_delta_delay_s: float = 0.35   # первый response.audio.delta после response.create
+    delta_interval_s: float = 0.05      # между дельтами
+    delta_ms: float = 100.0             # звука в одной дельте
+    reply_s: float = 1.5                # длительность ответа
+    reply_rate: int = 24000
+    reply_hz: float = 220.0
+
+
+@dataclass
+class ServerStats:
+    connections: int = 0
+    session_updates: int = 0
+    appended_bytes: int = 0             # байты звука после base64-декодирования
+    appended_wire_bytes: int = 0        # длина base64 в сообщениях
+    commits: int = 0
+    responses: int = 0
+    cancels: int = 0
+    commit_times: list = field(default_factory=list)
+
+
+class FakeRealtimeServer:
+    def __init__(self, config: Optional[ServerConfig] = None):
+        self.config = config or ServerConfig()
+        self.stats = ServerStats()
+        self._server = None
+        self._items = 0
+        self.url: Optional[str] = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._server = await websockets.serve(self._handle, host, port)
+        port = self._server.sockets[0].getsockname()[1]
+        self.url = f"ws://{host}:{port}/v1/realtime?model=bench"
+        return self.url
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    # ---------------------- протокол ----------------------
+
+    def _reply_chunks(self) -> list[bytes]:
+        cfg = self.config
+        t = np.arange(int(cfg.reply_rate * cfg.reply_s)) / cfg.reply_rate
+        pcm = (np.sin(2 * np.pi * cfg.reply_hz * t) * 6000).astype(np.int16).tobytes()
+        step = int(cfg.reply_rate * cfg.delta_ms / 1000) * 2
+        return [pcm[i:i + step] for i in range(0, len(pcm), step)]
+
+    def _item_id(self) -> str:
+        self._items += 1
+        return f"item_{self._items}"
+
+    async def _handle(self, ws) -> None:
+        self.stats.connections += 1
+        cfg = self.config
+        response: Optional[asyncio.Task] = None
+
+        async def send(evt: dict) -> None:
+            await ws.send(json.dumps(evt))
+
+        async def transcribe(item_id: str) -> None:
+            await asyncio.sleep(cfg.transcript_delay_s)
+            await send({"type": "conversation.item.input_audio_transcription.completed",
+                        "item_id": item_id, "transcript": cfg.transcript})
+
+        async def respond() -> None:
+            try:
+                await send({"type": "response.created"})
+                await send({"type": "conversation.item.created", "item": {"id": self._item_id()}})
+                await asyncio.sleep(cfg.first_delta_delay_s)
+                for chunk in self._reply_chunks():
+                    await send({"type": "response.audio.delta", "delta": base64.b64encode(chunk).decode("ascii")})
+                    await asyncio.sleep(cfg.delta_interval_s)
+                await send({"type": "response.done", "response": {"status": "completed"}})
+            except asyncio.CancelledError:
+                await send({"type": "response.done", "response": {"status": "cancelled"}})
+
+        try:
+            async for raw in ws:
+                evt = json.loads(raw)
+                et = evt.get("type")
+                if et == "session.update":
+                    self.stats.session_updates += 1
+                    await send({"type": "session.updated", "session": evt.get("session", {})})
+                elif et == "input_audio_buffer.append":
+                    audio = evt.get("audio", "")
+                    self.stats.appended_wire_bytes += len(audio)
+                    self.stats.appended_bytes += len(base64.b64decode(audio))
+                elif et == "input_audio_buffer.clear":
+                    await send({"type": "input_audio_buffer.cleared"})
+                elif et == "input_audio_buffer.commit":
+                    self.stats.commits += 1
+                    self.stats.commit_times.append(time.monotonic())
+                    await asyncio.sleep(cfg.commit_delay_s)
+                    item_id = self._item_id()
+                    await send({"type": "input_audio_buffer.committed", "item_id": item_id})
+                    await send({"type": "conversation.item.created", "item": {"id": item_id}})
+                    asyncio.create_task(transcribe(item_id))
+                elif et == "response.create":
+                    self.stats.responses += 1
+                    response = asyncio.create_task(respond())
+                elif et == "response.cancel":
+                    self.stats.cancels += 1
+                    if response is not None and not response.done():
+                        response.cancel()
+                elif et == "conversation.item.delete":
+                    await send({"type": "conversation.item.deleted", "item_id": evt.get("item_id")})
+        except ConnectionClosed:
+            pass  # клиент закрыл сокет — для бенчмарка это штатно
+        finally:
+            if response is not None and not response.done():
+                response.cancel()
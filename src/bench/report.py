@@ -0,0 +1,26 @@
+"""Общее для отчётов бенчмарков: версия кода и сводка задержек."""
+import subprocess
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parents[2]
+
+
+def git_info() -> dict:
+    def git(*args: str) -> str:
+        try:
+            return subprocess.run(["git", *args], cwd=REPO_DIR, capture_output=True, text=True,
+                                  timeout=10).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return ""
+
+    return {"commit": git("rev-parse", "--short", "HEAD") or None,
+            "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def summarize(values: list[float]) -> dict:
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return {"count": 0}
+    n = len(values)
+    return {"count": n, "mean": round(sum(values) / n, 1), "p50": round(values[n // 2], 1),
+            "p90": round(values[min(n - 1, int(n * 0.9))], 1), "max": round(values[-1], 1)}
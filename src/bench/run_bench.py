@@ -0,0 +1,245 @@
+"""
+Сквозной бенчмарк голосового конвейера без микрофона и без OpenAI.
+
+Фикстура проигрывается через подменённый sounddevice, Realtime API — локальный сервер
+(bench.realtime_server). Работают настоящие AudioCaptureBus, VoiceStreamRecognizer,
+VoiceRecording, SendHttp и PlaybackEngine.
+
+Запуск из src/:
+    python -m bench.run_bench                                  # синтетическая фикстура
+    python -m bench.run_bench --fixture turn.wav --model <vosk-model> --turns 5
+    python -m bench.run_bench --out bench/results.jsonl        # дописать строку JSON
+
+Без модели Vosk (или если она не загрузилась) пробуждение симулируется по разметке
+фикстуры: задержка пробуждения и RTF распознавания тогда не измеряются.
+Результат — один JSON с хэшем коммита: строки из разных коммитов сравнимы при
+одинаковых фикстуре, --speed и задержках сервера.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from bench import fake_sounddevice
+
+sys.modules["sounddevice"] = fake_sounddevice  # до импорта приложения
+
+from bench import fixtures  # noqa: E402
+from bench.report import git_info, summarize  # noqa: E402
+from bench.realtime_server import FakeRealtimeServer, ServerConfig  # noqa: E402
+from infrastructure.repositories.http.send import SendHttp  # noqa: E402
+from infrastructure.services.audio_bus.audio_bus import AudioCaptureBus  # noqa: E402
+from infrastructure.services.vad.vad import FrameVad  # noqa: E402
+from infrastructure.services.voice_playback.voice_playback import PlaybackEngine  # noqa: E402
+from infrastructure.services.voice_recognition.voice_recognition import (  # noqa: E402
+    MODE_KEYWORDS, VoiceStreamRecognizer,
+)
+from infrastructure.services.voice_recording.voice_recording import VoiceRecording  # noqa: E402
+from infrastructure.utils.metrics import END_OF_SPEECH, METRICS  # noqa: E402
+
+
+def vm_hwm_mb() -> Optional[float]:
+    try:
+        for line in Path("/proc/self/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+class Bench:
+    def __init__(self, args: argparse.Namespace, fx: fixtures.Fixture):
+        self.args = args
+        self.fx = fx
+        self.turns: list[dict] = []
+        self.active = threading.Event()
+        self.finished = 0
+        self.vr: Optional[VoiceStreamRecognizer] = None
+        self.wake_mode = "simulated"
+
+    async def run(self) -> dict:
+        args, fx = self.args, self.fx
+        fake_sounddevice.configure(fx.repeated(args.turns).pcm, fx.samplerate, args.speed)
+        server = FakeRealtimeServer(ServerConfig(
+            transcript_delay_s=args.transcript_delay, first_delta_delay_s=args.first_delta_delay,
+            delta_interval_s=args.delta_interval, reply_s=args.reply_s,
+        ))
+        url = await server.start()
+        os.environ.setdefault("OPENAI_API_KEY", "bench")
+        self.loop = asyncio.get_running_loop()
+        self.all_done = asyncio.Event()
+
+        self.bus = AudioCaptureBus(samplerate=None, block_ms=20)
+        self.playback = PlaybackEngine(samplerate=24000)
+        self.send = SendHttp(playback=self.playback, realtime_url=url, input_audio_format=args.upload_format)
+        self.recorder = VoiceRecording(bus=self.bus, samplerate=24000, pre_roll_ms=300,
+                                       vad=FrameVad(samplerate=24000, end_silence_s=0.6), debug_rms=False)
+
+        if args.model:
+            from app.commands import REGISTRY, is_start
+
+            self.vr = VoiceStreamRecognizer(
+                model_path=args.model, bus=self.bus, samplerate=16000, mode=MODE_KEYWORDS,
+                keywords=REGISTRY.phrases(), wake_on_partial=True, partial_filter=is_start, block_ms=40,
+            )
+            await self.loop.run_in_executor(None, self.vr.wait_ready)
+            if self.vr.model is None:
+                print("[BENCH] Модель Vosk не загрузилась — пробуждение симулируется", file=sys.stderr)
+                self.vr = None
+
+        cpu0, wall0 = resource.getrusage(resource.RUSAGE_SELF), time.monotonic()
+        if self.vr is not None:
+            self.wake_mode = "vosk"
+            self.vr.start(on_command=lambda text: self.start_turn() if is_start(text) else None)
+        else:
+            self.bus.start()
+            threading.Thread(target=self._simulate_wake, name="bench-wake", daemon=True).start()
+
+        timeout = fx.duration_s * args.turns / args.speed + 15.0
+        try:
+            await asyncio.wait_for(self.all_done.wait(), timeout)
+        except asyncio.TimeoutError:
+            print(f"[BENCH] Таймаут: завершено реплик {self.finished} из {args.turns}", file=sys.stderr)
+        wall = time.monotonic() - wall0
+        cpu1 = resource.getrusage(resource.RUSAGE_SELF)
+
+        if self.vr is not None:
+            self.vr.pause(True)
+        self.bus.stop()
+        await self.send.close()
+        await server.stop()
+
+        return self.report(server, wall, (cpu1.ru_utime - cpu0.ru_utime) + (cpu1.ru_stime - cpu0.ru_stime), cpu1)
+
+    # ---------------------- реплика ----------------------
+
+    def start_turn(self) -> None:
+        if self.active.is_set():
+            return
+        self.active.set()
+        self.turns.append({"wake_at": time.monotonic()})
+        METRICS.begin_turn()
+        self.send.warm_up_threadsafe(self.loop)
+        if self.vr is not None:
+            self.vr.pause(True)
+        chunks = self.recorder.record_stream(self.loop)
+        fut = asyncio.run_coroutine_threadsafe(self.send.send_audio_stream(chunks, samplerate=24000), self.loop)
+        fut.add_done_callback(self._after_turn)
+
+    def _after_turn(self, fut) -> None:
+        turn = self.turns[-1]
+        turn["error"] = repr(fut.exception()) if fut.exception() else None
+        turn["stages_ms"] = METRICS.snapshot()["last_turn_ms"]
+        if self.vr is not None:
+            self.vr.pause(False)
+        self.active.clear()
+        self.finished += 1
+        if self.finished >= self.args.turns:
+            self.loop.call_soon_threadsafe(self.all_done.set)
+
+    def _simulate_wake(self) -> None:
+        wake_sample = int(self.fx.wake_end_s * self.fx.samplerate)
+        for k in range(self.args.turns):
+            target = k * self.fx.pcm.size + wake_sample
+            while True:
+                inp = fake_sounddevice.FIXTURE.input
+                if inp is not None and inp.frames_delivered > target:
+                    break
+                time.sleep(0.002)
+            while self.active.is_set():
+                time.sleep(0.002)  # прошлая реплика ещё звучит — ждём, как и распознаватель на паузе
+            self.start_turn()
+
+    # ---------------------- отчёт ----------------------
+
+    def report(self, server: FakeRealtimeServer, wall: float, cpu_s: float, usage) -> dict:
+        fx, args = self.fx, self.args
+        inp = fake_sounddevice.FIXTURE.input
+        out = fake_sounddevice.FIXTURE.output
+        onsets = out.onsets if out is not None else []
+
+        wake, eos, ttfa = [], [], []
+        for k, turn in enumerate(self.turns):
+            base = k * fx.pcm.size
+            wake_audio = inp.delivered_at(base + int(fx.wake_end_s * fx.samplerate))
+            speech_end = inp.delivered_at(base + int(fx.speech_end_s * fx.samplerate))
+            if self.wake_mode == "vosk":
+                wake.append((turn["wake_at"] - wake_audio) * 1000.0)
+            eos_ms = (turn.get("stages_ms") or {}).get(END_OF_SPEECH)
+            if eos_ms is not None:
+                eos.append((turn["wake_at"] + eos_ms / 1000.0 - speech_end) * 1000.0)
+            heard = next((t for t in onsets if t > speech_end), None)
+            if heard is not None:
+                ttfa.append((heard - speech_end) * 1000.0)
+
+        snap = METRICS.snapshot()
+        rtf = None
+        if self.vr is not None:
+            rtf = self.vr.stats()
+        return {
+            "git": git_info(),
+            "machine": platform.machine(),
+            "python": platform.python_version(),
+            "config": {
+                "fixture": fx.name, "samplerate": fx.samplerate, "turns": args.turns, "speed": args.speed,
+                "wake": self.wake_mode, "upload_format": args.upload_format,
+                "server": {"transcript_delay_s": args.transcript_delay, "first_delta_delay_s": args.first_delta_delay,
+                           "delta_interval_s": args.delta_interval, "reply_s": args.reply_s},
+            },
+            "results": {
+                "turns_completed": self.finished,
+                "errors": [t["error"] for t in self.turns if t.get("error")],
+                "wake_latency_ms": summarize(wake),
+                "end_of_speech_latency_ms": summarize(eos),
+                "time_to_first_audio_ms": summarize(ttfa),
+                "stages_ms_since_wake": snap["stages_ms_since_wake"],
+                "recognizer": rtf,
+                "cpu_s": round(cpu_s, 3),
+                "cpu_pct": round(100.0 * cpu_s / wall, 1) if wall else None,
+                "wall_s": round(wall, 3),
+                "peak_rss_mb": round(usage.ru_maxrss / 1024, 1),
+                "vm_hwm_mb": vm_hwm_mb(),
+                "upload_wire_bytes": server.stats.appended_wire_bytes,
+                "playback_underruns": self.playback.underruns,
+                "counters": snap["counters"],
+            },
+        }
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Сквозной бенчмарк голосового конвейера")
+    p.add_argument("--fixture", type=Path, help="WAV/PCM с разметкой <имя>.json; по умолчанию — синтетика")
+    p.add_argument("--rate", type=int, default=48000, help="частота .pcm-фикстуры и синтетики")
+    p.add_argument("--model", help="путь к модели Vosk (иначе пробуждение симулируется)")
+    p.add_argument("--turns", type=int, default=3)
+    p.add_argument("--speed", type=float, default=1.0, help="скорость проигрывания фикстуры (>1 — быстрее)")
+    p.add_argument("--upload-format", default="pcm16", choices=["pcm16", "g711_ulaw", "g711_alaw"])
+    p.add_argument("--transcript-delay", type=float, default=0.3)
+    p.add_argument("--first-delta-delay", type=float, default=0.35)
+    p.add_argument("--delta-interval", type=float, default=0.05)
+    p.add_argument("--reply-s", type=float, default=1.5)
+    p.add_argument("--out", type=Path, help="дописать результат строкой JSON (JSONL) в файл")
+    return p.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    fx = fixtures.load(args.fixture, args.rate) if args.fixture else fixtures.synthetic(args.rate)
+    result = asyncio.run(Bench(args, fx).run())
+    text = json.dumps(result, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "a", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,509 @@
+"""
+Шлюз для «тонких» устройств: микрофон и динамик остаются на Orange Pi, а модель Vosk
+и ключ OpenAI — на одном сервере.
+
+Протокол (websocket /ws/{device_id}[?token=...]):
+  устройство → шлюз:
+    текст {"type": "hello", "samplerate": 16000}  — частота PCM16 (моно) с устройства, 8000–48000;
+    бинарные кадры                                  — PCM16 с микрофона, по 20–100 мс (чётной длины);
+    текст {"type": "wake"}                          — пробуждение на устройстве (кнопка и т.п.);
+    текст {"type": "stop"}                          — прервать ответ.
+  шлюз → устройство:
+    текст {"type": "command", "text", "intent"}     — распознанная команда;
+    текст {"type": "turn.started" / "turn.recorded" / "response.done" / "error" / "busy"};
+    бинарные кадры                                  — PCM16 24 кГц ответа.
+
+Запуск: uvicorn main:app (main.py в корне репозитория) или из src/:
+    uvicorn gateway.gateway:app --host 0.0.0.0 --port 8000
+Настройки — переменные окружения APPI_GATEWAY_* (см. GatewayConfig.from_env).
+"""
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing, asynccontextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from app.commands import PAUSE, REGISTRY, START, is_start, match_command
+from common.utils import get_env
+from infrastructure.repositories.response_cache.src.file_impl import FileResponseCache
+from infrastructure.services.audio_bus.resample import PolyphaseResampler
+from infrastructure.services.codec.g711 import PCM16
+from infrastructure.services.llm.src.openai_impl import OpenAiLLMService
+from infrastructure.services.vad.vad import FrameVad
+from infrastructure.services.voice_recognition.grammar import clean_text, grammar_json, grammar_words
+from infrastructure.utils.metrics import METRICS
+
+SRC_DIR = Path(__file__).resolve().parents[1]
+DEFAULT_MODEL_DIR = SRC_DIR / "infrastructure/services/voice_recognition/vosk-model-small-ru-0.22"
+
+RECOGNIZER_RATE = 16000  # родная частота модели Vosk
+UPLOAD_RATE = 24000      # Realtime API (pcm16) и ответ устройству
+MIN_DEVICE_RATE, MAX_DEVICE_RATE = 8000, 48000  # допустимая частота в hello
+
+LISTENING = "listening"
+RECORDING = "recording"
+RESPONDING = "responding"
+
+
+@dataclass
+class GatewayConfig:
+    model_path: Optional[str] = str(DEFAULT_MODEL_DIR)  # None — только пробуждение с устройства
+    workers: int = max(1, (os.cpu_count() or 2) - 1)  # потоки декодирования Vosk на всех
+    max_sessions: int = 4              # одновременных ответов Realtime API
+    queue_ms: float = 2000.0           # очередь входящего звука устройства; сверх — старое отбрасывается
+    pre_roll_ms: float = 300.0
+    max_turn_s: float = 15.0
+    realtime_model: str = "gpt-4o-realtime-preview"
+    realtime_url: Optional[str] = None
+    input_audio_format: str = PCM16
+    response_cache: bool = True
+    token: Optional[str] = None        # общий токен устройств (?token=...)
+
+    @classmethod
+    def from_env(cls) -> "GatewayConfig":
+        model = get_env("APPI_GATEWAY_MODEL", str(DEFAULT_MODEL_DIR))
+        return cls(
+            model_path=None if model == "none" else model,
+            workers=int(get_env("APPI_GATEWAY_WORKERS", str(cls.workers))),
+            max_sessions=int(get_env("APPI_GATEWAY_SESSIONS", str(cls.max_sessions))),
+            realtime_url=get_env("APPI_GATEWAY_REALTIME_URL", "") or None,
+            input_audio_format=get_env("APPI_UPLOAD_FORMAT", PCM16),
+            response_cache=get_env("APPI_GATEWAY_CACHE", "1") != "0",
+            token=get_env("APPI_GATEWAY_TOKEN", "") or None,
+        )
+
+
+class SharedRecognizer:
+    """
+    Одна модель Vosk на все устройства (грузится один раз, в фоне) и ограниченный пул
+    потоков декодирования. У каждого устройства свой KaldiRecognizer, но блоки одного
+    устройства идут строго по очереди; параллелизм — между устройствами, не больше workers.
+    """
+
+    def __init__(self, model_path: Optional[str], workers: int):
+        self.model_path = model_path
+        self.model = None
+        self.error: Optional[BaseException] = None
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="vosk")
+        self._ready = asyncio.Event()
+
+    @property
+    def enabled(self) -> bool:
+        return self.model is not None
+
+    async def load(self) -> None:
+        if self.model_path is None:
+            self._ready.set()
+            return
+        try:
+            self.model = await asyncio.get_running_loop().run_in_executor(self._pool, self._load)
+            print(f"✔️ Модель Vosk загружена: {self.model_path}")
+        except BaseException as e:
+            self.error = e
+            print(f"[MODEL ERROR] {e} — пробуждение только с устройства")
+        finally:
+            self._ready.set()
+
+    def _load(self):
+        from vosk import Model
+
+        return Model(self.model_path)
+
+    def make(self, phrases: list[str]):
+        from vosk import KaldiRecognizer
+
+        return KaldiRecognizer(self.model, RECOGNIZER_RATE, grammar_json(grammar_words(phrases)))
+
+    async def prepare(self, recognizer, phrases: Optional[list[str]]):
+        """
+        Распознаватель к новому высказыванию (в пуле — построение грамматики не тормозит loop):
+        phrases=None — тот же словарь, достаточно Reset(); иначе — новый KaldiRecognizer.
+        """
+        if recognizer is not None and phrases is None:
+            await asyncio.get_running_loop().run_in_executor(self._pool, recognizer.Reset)
+            return recognizer
+        return await asyncio.get_running_loop().run_in_executor(self._pool, self.make, phrases or [])
+
+    async def accept(self, recognizer, pcm: bytes) -> tuple[bool, str]:
+        """Блок в декодер (в пуле); возвращает (финал?, JSON результата или промежуточного результата)."""
+        return await asyncio.get_running_loop().run_in_executor(self._pool, self._accept, recognizer, pcm)
+
+    @staticmethod
+    def _accept(recognizer, pcm: bytes) -> tuple[bool, str]:
+        if recognizer.AcceptWaveform(pcm):
+            return True, recognizer.Result()
+        return False, recognizer.PartialResult()
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class SessionPool:
+    """
+    Мультиплексирование Realtime API: max_sessions сервисов (у каждого своё тёплое
+    соединение) на все устройства. Реплика берёт свободный сервис и возвращает его;
+    ключ OpenAI и кэш ответов — только здесь.
+    """
+
+    def __init__(self, config: GatewayConfig):
+        cache = FileResponseCache() if config.response_cache else None
+        self._free: "asyncio.Queue[OpenAiLLMService]" = asyncio.Queue()
+        self._all = [
+            OpenAiLLMService(model=config.realtime_model, cache=cache, input_audio_format=config.input_audio_format,
+                             realtime_url=config.realtime_url)
+            for _ in range(max(1, config.max_sessions))
+        ]
+        for svc in self._all:
+            self._free.put_nowait(svc)
+
+    @property
+    def free(self) -> int:
+        return self._free.qsize()
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[OpenAiLLMService]:
+        svc = await self._free.get()
+        METRICS.gauge("gateway_sessions_free", self._free.qsize())
+        try:
+            yield svc
+        finally:
+            self._free.put_nowait(svc)
+            METRICS.gauge("gateway_sessions_free", self._free.qsize())
+
+    async def close(self) -> None:
+        for svc in self._all:
+            await svc.close()
+
+
+class DeviceSession:
+    """
+    Одно подключённое устройство: приём звука, распознавание команд, запись вопроса
+    и ответ. Входящий звук идёт через ограниченную очередь: если шлюз не успевает
+    (пул распознавания занят), отбрасываются самые старые блоки этого устройства —
+    отставание не копится и не задерживает других.
+
+    Нарушение протокола (нечётный бинарный кадр, неверный hello, битый JSON) и любая ошибка
+    обработки закрывают сокет с {"type": "error"} — сессия не умирает молча.
+    """
+
+    def __init__(self, ws: WebSocket, device_id: str, config: GatewayConfig,
+                 recognizer: SharedRecognizer, sessions: SessionPool):
+        self.ws = ws
+        self.device_id = device_id
+        self.config = config
+        self.recognizer = recognizer
+        self.sessions = sessions
+        self.samplerate = RECOGNIZER_RATE
+
+        self.state = LISTENING
+        self.dropped_blocks = 0
+        self._queue: deque = deque()
+        self._queue_bytes = 0
+        self._queue_event = asyncio.Event()
+        self._closed = False
+
+        self._decoder = None
+        self._decoder_version: Optional[int] = None  # версия REGISTRY, по которой построена грамматика
+        self._decoder_stale = True  # сбросить/пересобрать перед следующим блоком
+        self._fired = False
+        self._last_partial = ""
+        self._to_vosk: Optional[PolyphaseResampler] = None
+        self._to_upload: Optional[PolyphaseResampler] = None
+        self._pre_roll: deque = deque()
+        self._pre_roll_bytes = 0
+        self._vad: Optional[FrameVad] = None
+        self._turn_queue: Optional[asyncio.Queue] = None
+        self._turn_bytes = 0
+        self._turn_task: Optional[asyncio.Task] = None
+        self._svc: Optional[OpenAiLLMService] = None
+
+    # ---------------------- приём ----------------------
+
+    async def run(self) -> None:
+        self._configure(RECOGNIZER_RATE)
+        worker = asyncio.create_task(self._process())
+        try:
+            while True:
+                msg = await self.ws.receive()
+                if msg["type"] == "websocket.disconnect":
+                    break
+                try:
+                    if msg.get("bytes") is not None:
+                        self._enqueue(msg["bytes"])
+                    elif msg.get("text") is not None:
+                        await self._control(json.loads(msg["text"]))
+                except (ValueError, TypeError) as e:
+                    METRICS.count("gateway_protocol_errors")
+                    await self._fail(f"протокол: {e}", code=1007)
+                    break
+        except WebSocketDisconnect:
+            pass
+        finally:
+            self._closed = True
+            self._queue_event.set()
+            worker.cancel()
+            if self._turn_task is not None:
+                self._turn_task.cancel()
+            if self.dropped_blocks:
+                print(f"[GATEWAY] {self.device_id}: отброшено блоков {self.dropped_blocks}")
+
+    def _configure(self, samplerate: int) -> None:
+        self.samplerate = int(samplerate)
+        self._to_vosk = PolyphaseResampler(self.samplerate, RECOGNIZER_RATE) \
+            if self.samplerate != RECOGNIZER_RATE else None
+        self._to_upload = PolyphaseResampler(self.samplerate, UPLOAD_RATE) \
+            if self.samplerate != UPLOAD_RATE else None
+        self._reset_decoder()
+
+    def _enqueue(self, data: bytes) -> None:
+        if len(data) % 2:
+            raise ValueError(f"кадр {len(data)} байт — не целое число отсчётов PCM16")
+        limit = int(self.samplerate * 2 * self.config.queue_ms / 1000)
+        self._queue.append(data)
+        self._queue_bytes += len(data)
+        while self._queue_bytes > limit and len(self._queue) > 1:
+            self._queue_bytes -= len(self._queue.popleft())
+            self.dropped_blocks += 1
+            METRICS.count("gateway_dropped_blocks")
+        self._queue_event.set()
+
+    async def _control(self, msg: dict) -> None:
+        kind = msg.get("type")
+        if kind == "hello":
+            samplerate = msg.get("samplerate", RECOGNIZER_RATE)
+            if not isinstance(samplerate, int) or not MIN_DEVICE_RATE <= samplerate <= MAX_DEVICE_RATE:
+                raise ValueError(f"samplerate {samplerate!r} вне {MIN_DEVICE_RATE}..{MAX_DEVICE_RATE} Гц")
+            self._configure(samplerate)
+        elif kind == "wake":
+            await self._start_turn()
+        elif kind == "stop":
+            await self._stop_response()
+
+    # ---------------------- обработка ----------------------
+
+    async def _process(self) -> None:
+        try:
+            await self._process_queue()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            METRICS.count("gateway_session_errors")
+            print(f"[GATEWAY ERROR] {self.device_id}: {e!r}")
+            await self._fail(f"ошибка обработки звука: {e}")
+
+    async def _process_queue(self) -> None:
+        while not self._closed:
+            if not self._queue:
+                self._queue_event.clear()
+                await self._queue_event.wait()
+                continue
+            data = self._queue.popleft()
+            self._queue_bytes -= len(data)
+            # одна метрика на все устройства: gateway_queue_ms_max — худшее отставание
+            METRICS.gauge("gateway_queue_ms", round(self._queue_bytes / (2 * self.samplerate) * 1000, 1))
+
+            upload = self._to_upload.process(data).tobytes() if self._to_upload else bytes(data)
+            if self.state == RECORDING:
+                self._record(upload)
+            else:
+                self._keep_pre_roll(upload)
+
+            if self.recognizer.enabled and self.state != RECORDING:
+                if self._decoder_version != REGISTRY.version:
+                    self._reset_decoder()  # в REGISTRY новые фразы — грамматика пересобирается
+                if self._decoder_stale:
+                    await self._prepare_decoder()
+                pcm = self._to_vosk.process(data).tobytes() if self._to_vosk else bytes(data)
+                final, raw = await self.recognizer.accept(self._decoder, pcm)
+                await self._on_result(final, raw)
+
+    def _keep_pre_roll(self, chunk: bytes) -> None:
+        self._pre_roll.append(chunk)
+        self._pre_roll_bytes += len(chunk)
+        limit = int(UPLOAD_RATE * 2 * self.config.pre_roll_ms / 1000)
+        while self._pre_roll and self._pre_roll_bytes - len(self._pre_roll[0]) >= limit:
+            self._pre_roll_bytes -= len(self._pre_roll.popleft())
+
+    def _reset_decoder(self) -> None:
+        # сам сброс — в _process, между блоками: декодер не трогается, пока он в пуле
+        self._decoder_stale = True
+        self._fired = False
+        self._last_partial = ""
+
+    async def _prepare_decoder(self) -> None:
+        version = REGISTRY.version
+        phrases = None if self._decoder_version == version else REGISTRY.phrases()
+        self._decoder = await self.recognizer.prepare(self._decoder, phrases)
+        self._decoder_version = version
+        self._decoder_stale = False
+
+    async def _on_result(self, final: bool, raw: str) -> None:
+        try:
+            result = json.loads(raw or "{}")
+        except json.JSONDecodeError:
+            return
+        if final:
+            fired, self._fired, self._last_partial = self._fired, False, ""
+            text = clean_text(result.get("text"))
+            if text and not fired:
+                await self._on_command(text)
+            return
+        partial = clean_text(result.get("partial"))
+        if self._fired or not partial or partial == self._last_partial:
+            return
+        self._last_partial = partial
+        # пробуждение — по промежуточному результату; стоп-слово во время ответа — тоже
+        if is_start(partial) or (self.state == RESPONDING and match_command(partial) is not None):
+            self._fired = True
+            await self._on_command(partial)
+
+    async def _on_command(self, text: str) -> None:
+        cmd = match_command(text)
+        await self._send_json({"type": "command", "text": text, "intent": cmd.intent if cmd else None})
+        if cmd is None:
+            return
+        if cmd.intent == START and self.state == LISTENING:
+            await self._start_turn()
+        elif cmd.intent == PAUSE and self.state == RESPONDING:
+            METRICS.count("barge_in")
+            await self._stop_response()
+
+    # ---------------------- реплика ----------------------
+
+    async def _start_turn(self) -> None:
+        if self.state != LISTENING:
+            return
+        self.state = RECORDING
+        METRICS.count("gateway_turns")
+        self._vad = FrameVad(samplerate=UPLOAD_RATE, end_silence_s=0.6)
+        self._turn_queue = asyncio.Queue()
+        self._turn_bytes = 0
+        for chunk in self._pre_roll:
+            self._record(chunk)
+        self._pre_roll.clear()
+        self._pre_roll_bytes = 0
+        if self.sessions.free == 0:
+            await self._send_json({"type": "busy"})  # запись идёт, ответ — когда освободится сессия
+        await self._send_json({"type": "turn.started"})
+        self._turn_task = asyncio.create_task(self._respond(self._turn_queue))
+
+    def _record(self, chunk: bytes) -> None:
+        if self._turn_queue is None:
+            return
+        self._turn_queue.put_nowait(chunk)
+        self._turn_bytes += len(chunk)
+        res = self._vad.process(chunk)
+        if res.end_of_speech or self._turn_bytes >= UPLOAD_RATE * 2 * self.config.max_turn_s:
+            self._turn_queue.put_nowait(None)
+            self._turn_queue = None
+            self.state = RESPONDING
+            self._reset_decoder()  # во время ответа слушаем стоп-слова
+            asyncio.create_task(self._send_json({"type": "turn.recorded"}))
+
+    async def _respond(self, chunks: asyncio.Queue) -> None:
+        async def source() -> AsyncIterator[bytes]:
+            while True:
+                chunk = await chunks.get()
+                if chunk is None:
+                    return
+                yield chunk
+
+        started = time.monotonic()
+        try:
+            async with self.sessions.acquire() as svc:
+                self._svc = svc
+                METRICS.observe("gateway_session_wait_ms", (time.monotonic() - started) * 1000.0)
+                # aclosing: сессия Realtime освобождается (или сбрасывается) до возврата svc в пул,
+                # даже если send_bytes упал или реплику отменили
+                async with aclosing(svc.audio_stream(source())) as stream:
+                    async for chunk in stream:
+                        if chunk:
+                            # медленное устройство тормозит только свою реплику (send ждёт сокет)
+                            await self.ws.send_bytes(bytes(chunk))
+            await self._send_json({"type": "response.done"})
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            METRICS.count("gateway_turn_errors")
+            await self._send_json({"type": "error", "message": str(e)})
+        finally:
+            self._svc = None
+            self._turn_queue = None
+            self.state = LISTENING
+            self._reset_decoder()
+
+    async def _stop_response(self) -> None:
+        svc = self._svc
+        if svc is not None:
+            await svc.cancel()
+
+    async def _fail(self, message: str, code: int = 1011) -> None:
+        # ошибка — устройству и закрытие сокета: run() получит disconnect и завершит сессию
+        await self._send_json({"type": "error", "message": message})
+        try:
+            await self.ws.close(code=code)
+        except (RuntimeError, WebSocketDisconnect):
+            pass
+
+    async def _send_json(self, payload: dict) -> None:
+        try:
+            await self.ws.send_text(json.dumps(payload, ensure_ascii=False))
+        except (RuntimeError, WebSocketDisconnect):
+            pass  # устройство уже отключилось
+
+
+def create_app(config: Optional[GatewayConfig] = None) -> FastAPI:
+    config = config or GatewayConfig.from_env()
+    state: dict = {}
+
+    @asynccontextmanager
+    async def lifespan(_app: FastAPI):
+        recognizer = SharedRecognizer(config.model_path, config.workers)
+        state["recognizer"] = recognizer
+        state["sessions"] = SessionPool(config)
+        state["devices"] = {}
+        await recognizer.load()
+        yield
+        await state["sessions"].close()
+        recognizer.close()
+
+    app = FastAPI(title="appi gateway", lifespan=lifespan)
+
+    @app.get("/healthz")
+    async def healthz():
+        return JSONResponse({"model": state["recognizer"].enabled, "devices": len(state["devices"]),
+                             "sessions_free": state["sessions"].free})
+
+    @app.get("/metrics")
+    async def metrics():
+        return PlainTextResponse(METRICS.render_text())
+
+    @app.websocket("/ws/{device_id}")
+    async def device_ws(ws: WebSocket, device_id: str):
+        if config.token and ws.query_params.get("token") != config.token:
+            await ws.close(code=1008)
+            return
+        await ws.accept()
+        devices = state["devices"]
+        session = DeviceSession(ws, device_id, config, state["recognizer"], state["sessions"])
+        devices[device_id] = session
+        METRICS.gauge("gateway_devices", len(devices))
+        try:
+            await session.run()
+        finally:
+            if devices.get(device_id) is session:
+                devices.pop(device_id)
+            METRICS.gauge("gateway_devices", len(devices))
+
+    return app
+
+
+app = create_app()
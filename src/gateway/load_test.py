@@ -0,0 +1,216 @@
+"""
+Нагрузочный тест шлюза: N имитируемых устройств стримят фикстуру в реальном времени.
+
+По умолчанию всё поднимается в процессе: локальный Realtime-сервер (bench.realtime_server)
+и шлюз (uvicorn) на свободном порту. С --url тест идёт к уже запущенному шлюзу.
+
+Запуск из src/:
+    python -m gateway.load_test --clients 20 --turns 3
+    python -m gateway.load_test --clients 50 --model <vosk-model>         # пробуждение голосом
+    python -m gateway.load_test --clients 50 --url ws://server:8000 --out load.jsonl
+
+Без модели устройства сами присылают {"type": "wake"} в момент конца ключевой фразы
+(по разметке фикстуры) — нагружаются приём, VAD, загрузка и ответ, но не Vosk.
+Результат — один JSON: задержки по всем устройствам, отброшенные блоки, ошибки, CPU шлюза.
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+import websockets
+
+from bench import fixtures
+from bench.realtime_server import FakeRealtimeServer, ServerConfig
+from bench.report import git_info, summarize
+
+
+class Client:
+    """Одно устройство: шлёт фикстуру блоками по block_ms, принимает ответ."""
+
+    def __init__(self, index: int, url: str, fx: fixtures.Fixture, args: argparse.Namespace):
+        self.index = index
+        self.url = f"{url}/ws/dev-{index}"
+        self.fx = fx
+        self.args = args
+        self.ttfa_ms: list[float] = []      # конец вопроса → первый звук ответа
+        self.turn_ms: list[float] = []      # конец вопроса → response.done
+        self.errors: list[str] = []
+        self.busy = 0
+        self.bytes_received = 0
+        self._speech_end: Optional[float] = None
+        self._first_audio = False
+        self._done = asyncio.Event()
+
+    async def run(self) -> None:
+        fx, args = self.fx, self.args
+        block = int(fx.samplerate * args.block_ms / 1000)
+        pcm = fx.pcm.tobytes()
+        turn_len = fx.pcm.size
+        # устройства стартуют вразнобой, как в жизни
+        await asyncio.sleep((self.index * 0.137) % 1.0)
+        try:
+            async with websockets.connect(self.url, max_size=None) as ws:
+                await ws.send(json.dumps({"type": "hello", "samplerate": fx.samplerate}))
+                receiver = asyncio.create_task(self._receive(ws))
+                for turn in range(args.turns):
+                    self._done.clear()
+                    wake_sent = False
+                    t0 = time.monotonic()
+                    for start in range(0, turn_len, block):
+                        deadline = t0 + start / fx.samplerate / args.speed
+                        delay = deadline - time.monotonic()
+                        if delay > 0:
+                            await asyncio.sleep(delay)
+                        await ws.send(pcm[start * 2:(start + block) * 2])
+                        pos_s = (start + block) / fx.samplerate
+                        if not args.model and not wake_sent and pos_s >= fx.wake_end_s:
+                            wake_sent = True
+                            await ws.send(json.dumps({"type": "wake"}))
+                        if self._speech_end is None and pos_s >= fx.speech_end_s:
+                            self._speech_end = time.monotonic()
+                            self._first_audio = False
+                    try:
+                        await asyncio.wait_for(self._done.wait(), timeout=15.0)
+                    except asyncio.TimeoutError:
+                        self.errors.append(f"turn {turn}: нет response.done")
+                    self._speech_end = None
+                receiver.cancel()
+        except (OSError, websockets.exceptions.WebSocketException) as e:
+            self.errors.append(repr(e))
+
+    async def _receive(self, ws) -> None:
+        async for msg in ws:
+            now = time.monotonic()
+            if isinstance(msg, bytes):
+                self.bytes_received += len(msg)
+                if not self._first_audio and self._speech_end is not None:
+                    self._first_audio = True
+                    self.ttfa_ms.append((now - self._speech_end) * 1000.0)
+                continue
+            evt = json.loads(msg)
+            if evt["type"] == "response.done":
+                if self._speech_end is not None:
+                    self.turn_ms.append((now - self._speech_end) * 1000.0)
+                self._done.set()
+            elif evt["type"] == "error":
+                self.errors.append(evt.get("message", "error"))
+                self._done.set()
+            elif evt["type"] == "busy":
+                self.busy += 1
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def start_local_gateway(args: argparse.Namespace, realtime_url: str):
+    """Шлюз в этом же процессе (uvicorn в отдельном потоке со своим loop)."""
+    import uvicorn
+
+    from gateway.gateway import GatewayConfig, create_app
+
+    os.environ.setdefault("OPENAI_API_KEY", "load-test")
+    config = GatewayConfig(model_path=args.model, workers=args.workers, max_sessions=args.sessions,
+                           realtime_url=realtime_url, response_cache=False)
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(create_app(config), host="127.0.0.1", port=port,
+                                           log_level="warning", ws_max_size=16 * 1024 * 1024))
+    thread = threading.Thread(target=server.run, name="gateway", daemon=True)
+    thread.start()
+    while not server.started:
+        await asyncio.sleep(0.05)
+    return server, thread, f"ws://127.0.0.1:{port}"
+
+
+async def run(args: argparse.Namespace) -> dict:
+    fx = fixtures.load(args.fixture, args.rate) if args.fixture else fixtures.synthetic(args.rate)
+    fake = gateway = thread = None
+    url = args.url
+    if url is None:
+        fake = FakeRealtimeServer(ServerConfig(transcript_delay_s=args.transcript_delay,
+                                               first_delta_delay_s=args.first_delta_delay,
+                                               reply_s=args.reply_s))
+        realtime_url = await fake.start()
+        gateway, thread, url = await start_local_gateway(args, realtime_url)
+
+    cpu0, wall0 = resource.getrusage(resource.RUSAGE_SELF), time.monotonic()
+    clients = [Client(i, url, fx, args) for i in range(args.clients)]
+    await asyncio.gather(*(c.run() for c in clients))
+    wall = time.monotonic() - wall0
+    cpu1 = resource.getrusage(resource.RUSAGE_SELF)
+    cpu_s = (cpu1.ru_utime - cpu0.ru_utime) + (cpu1.ru_stime - cpu0.ru_stime)
+
+    if gateway is not None:
+        gateway.should_exit = True
+        thread.join(timeout=5)
+    if fake is not None:
+        await fake.stop()
+
+    from infrastructure.utils.metrics import METRICS
+
+    counters = METRICS.snapshot()["counters"]
+    return {
+        "git": git_info(),
+        "config": {"clients": args.clients, "turns": args.turns, "speed": args.speed, "fixture": fx.name,
+                   "samplerate": fx.samplerate, "block_ms": args.block_ms, "wake": "vosk" if args.model else "device",
+                   "workers": args.workers, "sessions": args.sessions, "url": args.url or "local"},
+        "results": {
+            "turns_completed": sum(len(c.turn_ms) for c in clients),
+            "turns_expected": args.clients * args.turns,
+            "time_to_first_audio_ms": summarize([v for c in clients for v in c.ttfa_ms]),
+            "turn_ms": summarize([v for c in clients for v in c.turn_ms]),
+            "busy_events": sum(c.busy for c in clients),
+            "errors": [e for c in clients for e in c.errors][:20],
+            "response_bytes": sum(c.bytes_received for c in clients),
+            "dropped_blocks": counters.get("gateway_dropped_blocks", 0) if args.url is None else None,
+            # при локальном шлюзе CPU — это шлюз + клиенты + фейковый Realtime-сервер
+            "cpu_s": round(cpu_s, 3),
+            "cpu_pct": round(100.0 * cpu_s / wall, 1) if wall else None,
+            "wall_s": round(wall, 3),
+            "peak_rss_mb": round(cpu1.ru_maxrss / 1024, 1),
+        },
+    }
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Нагрузочный тест шлюза устройств")
+    p.add_argument("--clients", type=int, default=10)
+    p.add_argument("--turns", type=int, default=2)
+    p.add_argument("--fixture", type=Path, help="WAV/PCM с разметкой <имя>.json; по умолчанию — синтетика")
+    p.add_argument("--rate", type=int, default=16000, help="частота .pcm-фикстуры и синтетики (частота устройства)")
+    p.add_argument("--block-ms", type=float, default=40.0)
+    p.add_argument("--speed", type=float, default=1.0)
+    p.add_argument("--url", help="адрес запущенного шлюза (ws://host:port); иначе — локальный")
+    p.add_argument("--model", help="модель Vosk для локального шлюза (иначе пробуждение с устройства)")
+    p.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    p.add_argument("--sessions", type=int, default=4)
+    p.add_argument("--transcript-delay", type=float, default=0.3)
+    p.add_argument("--first-delta-delay", type=float, default=0.35)
+    p.add_argument("--reply-s", type=float, default=1.5)
+    p.add_argument("--out", type=Path, help="дописать результат строкой JSON (JSONL) в файл")
+    return p.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    result = asyncio.run(run(args))
+    if args.out:
+        with open(args.out, "a", encoding="utf-8") as f:
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if result["results"]["errors"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,39 +1,164 @@
+import asyncio
+from contextlib import aclosing
 from pathlib import Path
-import sounddevice as sd
+from typing import AsyncIterable, Callable, Optional, Union
 import os
 
+from infrastructure.repositories.response_cache.response_cache import IResponseCache
+from infrastructure.services.codec.g711 import PCM16
 from infrastructure.services.llm.src.openai_impl import OpenAiLLMService
+from infrastructure.services.voice_playback.voice_playback import PlaybackEngine
+from infrastructure.services.voice_recording.recording_buffer import RecordingBuffer
+from infrastructure.utils.memory import RSS, trim_heap
+from infrastructure.utils.metrics import METRICS, PLAYBACK_FINISHED
+
+# low_memory: append по 0,5 с PCM16 24 кГц; ответ для кэша — не больше ~20 с
+_LOW_MEMORY_APPEND_CHUNK = 24000
+_LOW_MEMORY_CACHE_MAX = 1024 * 1024
 
 
 class SendHttp:
+    def __init__(self, model: str = "gpt-4o-realtime-preview", playback: Optional[PlaybackEngine] = None,
+                 on_playback: Optional[Callable[[bool], None]] = None, cache: Optional[IResponseCache] = None,
+                 input_audio_format: str = PCM16, realtime_url: Optional[str] = None, low_memory: bool = False):
+        """
+        playback — общий движок воспроизведения (нужен снаружи, например для гейта эха);
+        on_playback(True/False) — ответ начал звучать / закончился (для barge-in);
+        cache — кэш ответов по транскрипту вопроса;
+        input_audio_format — формат загрузки записи (pcm16 / g711_ulaw / g711_alaw);
+        realtime_url — другой адрес Realtime API (например, локальный сервер бенчмарка);
+        low_memory — профиль для плат с 512 МБ: запись уходит кусками по 0,5 с, ответ длиннее
+        ~20 с не копится для кэша, text() идёт без SDK openai, после реплики куча возвращается ОС.
+        """
+        self._model = model
+        self._cache = cache
+        self._input_audio_format = input_audio_format
+        self._realtime_url = realtime_url
+        self._low_memory = low_memory
+        self._svc: Optional[OpenAiLLMService] = None
+        self._engine: Optional[PlaybackEngine] = playback
+        self.on_playback = on_playback
+        self._responding = False
+
+    def _service(self) -> OpenAiLLMService:
+        # Один сервис (и одно тёплое Realtime-соединение) на все реплики
+        if self._svc is None:
+            options = {}
+            if self._low_memory:
+                options = {"append_chunk_bytes": _LOW_MEMORY_APPEND_CHUNK, "cache_max_bytes": _LOW_MEMORY_CACHE_MAX,
+                           "http_text": True}
+            self._svc = OpenAiLLMService(model=self._model, cache=self._cache,
+                                         input_audio_format=self._input_audio_format,
+                                         realtime_url=self._realtime_url, **options)
+        return self._svc
+
+    def _playback(self, samplerate: int) -> PlaybackEngine:
+        # Поток вывода открыт между репликами; пересоздаётся только при смене частоты
+        if self._engine is None or self._engine.samplerate != samplerate:
+            if self._engine is not None:
+                self._engine.stop()
+            self._engine = PlaybackEngine(samplerate=samplerate)
+        return self._engine
+
+    @property
+    def responding(self) -> bool:
+        """Идёт ответ ассистента (приём или воспроизведение)."""
+        return self._responding
+
+    async def cancel(self) -> None:
+        """Barge-in: сразу замолчать и отменить генерацию ответа."""
+        if self._engine is not None:
+            self._engine.flush()
+        if self._svc is not None:
+            await self._svc.cancel()
+
+    def cancel_threadsafe(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Отмена из потока распознавания: буфер сбрасывается сразу, response.cancel — в loop."""
+        if self._engine is not None:
+            self._engine.flush()
+        asyncio.run_coroutine_threadsafe(self.cancel(), loop)
+
+    async def close(self) -> None:
+        """Закрыть Realtime-соединение, текстовый клиент и поток вывода."""
+        if self._svc is not None:
+            await self._svc.close()
+        if self._engine is not None:
+            self._engine.stop()
+
+    async def play_clip(self, pcm, samplerate: int = 24000) -> None:
+        """Локальная фраза (подтверждение, ошибка) через тот же поток вывода; ответ модели доигрывается первым."""
+        engine = self._playback(samplerate)
+        while self._responding:
+            await asyncio.sleep(engine.blocksize / engine.samplerate)
+        await engine.play(pcm)
+
+    def play_clip_threadsafe(self, loop: asyncio.AbstractEventLoop, pcm, samplerate: int = 24000) -> None:
+        """play_clip из потока распознавания."""
+        asyncio.run_coroutine_threadsafe(self.play_clip(pcm, samplerate), loop)
+
+    async def warm_up(self) -> None:
+        """Заранее открыть Realtime-соединение."""
+        await self._service().sessions.warm()
+
+    def warm_up_threadsafe(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Спекулятивный прогрев из потока распознавания (по is_start)."""
+        asyncio.run_coroutine_threadsafe(self.warm_up(), loop)
+
     async def send_audio_file(self, path: Path, samplerate: int):
-        svc = OpenAiLLMService(model="gpt-4o-realtime-preview")
-        rate = samplerate
-        sd.default.channels = 1
-        print(sd.query_devices())
-
-        stream = sd.RawOutputStream(
-            samplerate=rate,
-            channels=1,
-            dtype="int16",
-            blocksize=1024,
-            latency="low"
-        )
-        stream.start()
+        await self._send_audio(path, samplerate)
+
+    async def send_audio_buffer(self, buffer: RecordingBuffer, samplerate: int):
+        """Отправка записи из памяти (без файла); буфер закрывается после ответа."""
+        try:
+            with buffer.view() as pcm:
+                await self._send_audio(pcm, samplerate)
+        finally:
+            buffer.close()
+
+    async def send_audio_stream(self, chunks: AsyncIterable[bytes], samplerate: int):
+        """Отправка записи по мере захвата (чанки дописываются, пока пользователь говорит)."""
+        await self._send_audio(chunks, samplerate)
+
+    async def _send_audio(self, source: Union[Path, memoryview, AsyncIterable[bytes]], samplerate: int):
+        svc = self._service()
+        engine = self._playback(samplerate)
+        engine.begin()
+        underruns = engine.underruns
+        ok = False
+        got = 0
+        self._responding = True
         try:
-            got = 0
-            async for chunk in svc.audio_stream(path):
-                if chunk:
-                    stream.write(chunk)
-                    got += len(chunk)
+            # feed() не блокирует: приём следующих кадров идёт, пока звучат предыдущие.
+            # aclosing: если воспроизведение упало или реплику отменили, finally генератора
+            # (возврат/сброс сессии Realtime) выполняется сразу, а не при сборке мусора
+            async with aclosing(svc.audio_stream(source)) as stream:
+                async for chunk in stream:
+                    if chunk:
+                        if got == 0 and self.on_playback is not None:
+                            self.on_playback(True)
+                        await engine.feed(chunk)
+                        got += len(chunk)
             if got == 0:
-                print("[WARN] Не пришло ни одного аудио-чанка. Посмотрите лог EVENT.")
+                print("[WARN] Не пришло ни одного аудио-чанка. Посмотрите лог EVENT (APPI_LOG_LEVEL=DEBUG).")
+            await engine.drain()
+            ok = True
         finally:
-            stream.stop()
-            stream.close()
-            try:
-                if path.exists():
-                    os.remove(path)
-                    print(f"[CLEANUP] Файл {path} удалён.")
-            except Exception as e:
-                print(f"[CLEANUP ERROR] Не удалось удалить {path}: {e}")
+            self._responding = False
+            if not ok:
+                engine.flush()
+            if got and self.on_playback is not None:
+                self.on_playback(False)
+            if engine.underruns > underruns:
+                print(f"[PLAYBACK] Опустошений буфера за ответ: {engine.underruns - underruns}")
+            METRICS.mark(PLAYBACK_FINISHED)
+            METRICS.end_turn()
+            if self._low_memory:
+                trim_heap()  # base64-строки и кадры ответа освобождены — RSS опускается до следующей реплики
+                print(RSS.report())
+            if isinstance(source, Path):
+                try:
+                    if source.exists():
+                        os.remove(source)
+                        print(f"[CLEANUP] Файл {source} удалён.")
+                except Exception as e:
+                    print(f"[CLEANUP ERROR] Не удалось удалить {source}: {e}")
@@ -0,0 +1,211 @@
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterable, Optional, Union
+
+import numpy as np
+
+from infrastructure.repositories.local_commands.local_commands import ILocalCommandRepository
+from infrastructure.storage.db.src.sqlite3 import DEFAULT_DB_PATH, connect
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS commands (
+    id        INTEGER PRIMARY KEY,
+    phrase    TEXT    NOT NULL,
+    norm      TEXT    NOT NULL UNIQUE,
+    action    TEXT    NOT NULL,
+    tri_count INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS command_trigrams (
+    tri        TEXT    NOT NULL,
+    command_id INTEGER NOT NULL REFERENCES commands(id) ON DELETE CASCADE,
+    PRIMARY KEY (tri, command_id)
+) WITHOUT ROWID;
+"""
+
+# Тексты запросов постоянны — sqlite3 держит их скомпилированными в кэше соединения
+_SQL_EXACT = "SELECT action FROM commands WHERE norm = ?"
+_SQL_UPSERT = (
+    "INSERT INTO commands (phrase, norm, action, tri_count) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT(norm) DO UPDATE SET phrase = excluded.phrase, action = excluded.action"
+)
+_SQL_DROP_TRIGRAMS = "DELETE FROM command_trigrams WHERE command_id = (SELECT id FROM commands WHERE norm = ?)"
+_SQL_ADD_TRIGRAM = "INSERT OR IGNORE INTO command_trigrams (tri, command_id) SELECT ?, id FROM commands WHERE norm = ?"
+_SQL_ALL_TRIGRAMS = "SELECT tri, group_concat(command_id) FROM command_trigrams GROUP BY tri"
+_SQL_ALL_LENGTHS = "SELECT id, tri_count FROM commands"
+_SQL_VERIFY = "SELECT id, action, norm FROM commands WHERE id IN ({ids})"
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def normalize_phrase(phrase: str) -> str:
+    """Нижний регистр, ё → е, без пунктуации и лишних пробелов."""
+    return " ".join(_WORD_RE.findall((phrase or "").lower().replace("ё", "е")))
+
+
+def trigrams(norm: str) -> set[str]:
+    padded = f" {norm} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# Приставки с противоположным смыслом: «включи»/«выключи» различаются одной-двумя буквами
+# и по триграммам почти совпадают (Дайс 0.88), но для устройства это обратные действия
+_OPPOSITE_PREFIXES = (("в", "вы"), ("в", "от"), ("под", "от"), ("за", "от"))
+_NEGATION = "не"
+
+
+def _opposite_words(a: str, b: str) -> bool:
+    if a == b:
+        return False
+    if a == _NEGATION + b or b == _NEGATION + a:
+        return True
+    for p, q in _OPPOSITE_PREFIXES:
+        for x, y in ((a, b), (b, a)):
+            if x.startswith(p) and y.startswith(q) and len(x) - len(p) >= 3 and x[len(p):] == y[len(q):]:
+                return True
+    return False
+
+
+def opposite_phrases(query: str, candidate: str) -> bool:
+    """Фразы различаются отрицанием («не» лишнее/пропущено) или приставкой-антонимом в одном из слов."""
+    qw, cw = query.split(), candidate.split()
+    if qw.count(_NEGATION) != cw.count(_NEGATION):
+        return True
+    return any(_opposite_words(a, b) for a in qw for b in cw)
+
+
+class SqliteLocalCommandRepository(ILocalCommandRepository):
+    """
+    Локальные команды в SQLite: точный поиск по нормализованной фразе и
+    нечёткий — по общим триграммам (ошибки распознавания в отдельных буквах/словах).
+
+    Особенности:
+      - Уникальный индекс по нормализованной фразе: точное совпадение — один поиск по B-дереву.
+      - Таблица триграмм с первичным ключом (tri, command_id) — источник для нечёткого поиска.
+        Сам поиск идёт по индексу в памяти (триграмма → массив id, NumPy): общие триграммы
+        считаются для всех фраз сразу (bincount), Дайс — вектором; ранжирования «наугад» нет.
+        Индекс строится при первом нечётком поиске и после записи (5k фраз — ~125k постингов, ~0,6 МБ, ~30 мс).
+      - Фразы с противоположным смыслом (отрицание, «включи»/«выключи») нечётко не совпадают.
+      - LRU-кэш результатов (включая промахи) перед базой; сбрасывается при записи.
+      - add_commands() — пакетный импорт тысяч фраз одной транзакцией.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path] = DEFAULT_DB_PATH,
+        cache_size: int = 1024,
+        min_similarity: float = 0.6,
+        fuzzy_candidates: int = 8,
+    ):
+        self.cache_size = int(cache_size)
+        self.min_similarity = float(min_similarity)
+        self.fuzzy_candidates = int(fuzzy_candidates)
+
+        self._conn = connect(path)
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[str, Optional[str]]" = OrderedDict()
+        self._postings: Optional[dict[str, np.ndarray]] = None  # None — индекс устарел
+        self._lengths = np.zeros(0, dtype=np.int32)  # число триграмм фразы по id
+
+    # ---------------------- API ----------------------
+
+    def get_action_by_phrase(self, phrase: str) -> Optional[str]:
+        norm = normalize_phrase(phrase)
+        if not norm:
+            return None
+
+        with self._lock:
+            if norm in self._cache:
+                self._cache.move_to_end(norm)
+                return self._cache[norm]
+
+            action = self._lookup(norm)
+
+            self._cache[norm] = action
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return action
+
+    def add_command(self, phrase: str, action: str) -> None:
+        self.add_commands([(phrase, action)])
+
+    def add_commands(self, items: Iterable[tuple[str, str]]) -> int:
+        """Пакетный импорт пар (фраза, действие); возвращает число загруженных фраз."""
+        rows = []
+        for phrase, action in items:
+            norm = normalize_phrase(phrase)
+            if norm:
+                rows.append((phrase, norm, action, trigrams(norm)))
+        if not rows:
+            return 0
+
+        with self._lock:
+            cur = self._conn.cursor()
+            cur.execute("BEGIN")
+            try:
+                cur.executemany(_SQL_UPSERT, ((p, n, a, len(t)) for p, n, a, t in rows))
+                cur.executemany(_SQL_DROP_TRIGRAMS, ((n,) for _, n, _, _ in rows))
+                cur.executemany(_SQL_ADD_TRIGRAM, ((tri, n) for _, n, _, t in rows for tri in t))
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+            self._cache.clear()
+            self._postings = None
+        return len(rows)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    # ---------------------- внутренняя логика ----------------------
+
+    def _lookup(self, norm: str) -> Optional[str]:
+        row = self._conn.execute(_SQL_EXACT, (norm,)).fetchone()
+        if row:
+            return row[0]
+
+        postings = self._postings if self._postings is not None else self._build_index()
+        tris = trigrams(norm)
+        hits = [postings[tri] for tri in tris if tri in postings]
+        if not hits:
+            return None
+
+        # общие триграммы со всеми фразами сразу, затем Дайс: 2·shared / (|q| + |c|)
+        shared = np.bincount(np.concatenate(hits), minlength=len(self._lengths))
+        ids = np.flatnonzero(shared)
+        scores = 2.0 * shared[ids] / (len(tris) + self._lengths[ids])
+        keep = scores >= self.min_similarity
+        ids, scores = ids[keep], scores[keep]
+        if ids.size == 0:
+            return None
+        order = np.argsort(-scores, kind="stable")[:self.fuzzy_candidates]
+        ranked = [int(i) for i in ids[order]]
+
+        sql = _SQL_VERIFY.format(ids=_marks(len(ranked)))
+        found = {cid: (action, cand_norm) for cid, action, cand_norm in self._conn.execute(sql, ranked)}
+        for cid in ranked:  # по убыванию сходства
+            action, cand_norm = found[cid]
+            if not opposite_phrases(norm, cand_norm):
+                return action
+        return None
+
+    def _build_index(self) -> dict[str, np.ndarray]:
+        """Постинги триграмм из базы в память (вызывается под self._lock)."""
+        lengths = self._conn.execute(_SQL_ALL_LENGTHS).fetchall()
+        size = max((cid for cid, _ in lengths), default=-1) + 1
+        self._lengths = np.zeros(size, dtype=np.int32)
+        for cid, count in lengths:
+            self._lengths[cid] = count
+
+        # постинги одной строкой на триграмму: разбор в NumPy, без цикла по строкам в Python
+        postings = {tri: np.fromstring(ids, dtype=np.int32, sep=",")
+                    for tri, ids in self._conn.execute(_SQL_ALL_TRIGRAMS)}
+        self._postings = postings
+        return postings
+
+
+def _marks(n: int) -> str:
+    return ",".join("?" * n)
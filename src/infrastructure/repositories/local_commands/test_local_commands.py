@@ -0,0 +1,45 @@
+# test_local_commands.py
+import tempfile
+from pathlib import Path
+
+from infrastructure.repositories.local_commands.src.sqlite_impl import SqliteLocalCommandRepository, opposite_phrases
+
+
+def _repo(tmp: str, items) -> SqliteLocalCommandRepository:
+    repo = SqliteLocalCommandRepository(Path(tmp) / "commands.db")
+    repo.add_commands(items)
+    return repo
+
+
+def test_fuzzy_does_not_flip_action():
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = _repo(tmp, [("включи свет на кухне", "light_kitchen_on")])
+        assert repo.get_action_by_phrase("включи свеет на кухне") == "light_kitchen_on"
+        # противоположное действие не должно совпасть нечётко, хотя Дайс ≈ 0.88
+        assert repo.get_action_by_phrase("выключи свет на кухне") is None
+        assert repo.get_action_by_phrase("не включай свет на кухне") is None
+        repo.close()
+
+
+def test_fuzzy_picks_same_polarity():
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = _repo(tmp, [("включи свет на кухне", "light_kitchen_on"),
+                           ("выключи свет на кухне", "light_kitchen_off")])
+        assert repo.get_action_by_phrase("выключи свеет на кухне") == "light_kitchen_off"
+        assert repo.get_action_by_phrase("включи свеет на кухне") == "light_kitchen_on"
+        repo.close()
+
+
+def test_opposite_phrases():
+    assert opposite_phrases("выключи свет", "включи свет")
+    assert opposite_phrases("закрой шторы", "открой шторы")
+    assert opposite_phrases("не включай", "включай")
+    assert not opposite_phrases("включи свеет", "включи свет")
+    assert not opposite_phrases("выключи свет", "отключи свет")
+
+
+if __name__ == "__main__":
+    test_fuzzy_does_not_flip_action()
+    test_fuzzy_picks_same_polarity()
+    test_opposite_phrases()
+    print("ok")
@@ -0,0 +1,15 @@
+import mmap
+from abc import ABC, abstractmethod
+from typing import Optional
+
+
+class IResponseCache(ABC):
+    @abstractmethod
+    def get(self, transcript: str, voice: str, prompt: str) -> Optional[mmap.mmap]:
+        """Вернуть закэшированный PCM16-ответ (отображение файла; закрыть после воспроизведения)"""
+        pass
+
+    @abstractmethod
+    def put(self, transcript: str, voice: str, prompt: str, pcm: bytes) -> None:
+        """Сохранить PCM16-ответ (если вопрос можно кэшировать)"""
+        pass
@@ -0,0 +1,170 @@
+import hashlib
+import json
+import mmap
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Mapping, Optional, Union
+
+from infrastructure.repositories.local_commands.src.sqlite_impl import normalize_phrase
+from infrastructure.repositories.response_cache.response_cache import IResponseCache
+from infrastructure.utils.metrics import METRICS
+
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parents[3] / "storage" / "cache" / "responses"
+
+# Фраза в вопросе → TTL ответа, с; 0 — не кэшировать (ответ зависит от момента)
+DEFAULT_TTL_RULES: dict[str, float] = {
+    "который час": 0,
+    "сколько времени": 0,
+    "какое сегодня число": 0,
+    "какой сегодня день": 0,
+    "новости": 0,
+    "погода": 30 * 60,
+}
+
+
+class FileResponseCache(IResponseCache):
+    """
+    Кэш голосовых ответов: нормализованный транскрипт вопроса (+ голос и промпт) → PCM16.
+
+    Особенности:
+      - Каждый ответ — отдельный .pcm-файл; get() отдаёт его через mmap, без чтения в память.
+      - Индекс (ключ → размер, время создания/обращения, TTL) лежит в index.json рядом
+        и перезаписывается атомарно; порядок в индексе — LRU.
+      - Вытеснение по суммарному размеру (max_bytes, LRU) и по TTL.
+      - ttl_rules: вопросы, зависящие от момента («который час»), не кэшируются (TTL 0)
+        или живут меньше обычного.
+      - Попадания/промахи/пропуски считаются в hits/misses/skipped и в METRICS.
+    """
+
+    def __init__(
+        self,
+        root: Union[str, Path] = DEFAULT_CACHE_DIR,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl_s: float = 7 * 24 * 3600.0,
+        ttl_rules: Optional[Mapping[str, float]] = None,
+    ):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = int(max_bytes)
+        self.ttl_s = float(ttl_s)
+        self.ttl_rules = {normalize_phrase(k): float(v)
+                          for k, v in (DEFAULT_TTL_RULES if ttl_rules is None else ttl_rules).items()}
+
+        self._lock = threading.Lock()
+        self._index: "OrderedDict[str, dict]" = self._load_index()
+        self._total = sum(e["size"] for e in self._index.values())
+        self.hits = self.misses = self.skipped = 0
+
+    # ---------------------- API ----------------------
+
+    def ttl_for(self, transcript: str) -> float:
+        """TTL ответа на вопрос; 0 — вопрос кэшировать нельзя."""
+        norm = f" {normalize_phrase(transcript)} "
+        ttls = [ttl for phrase, ttl in self.ttl_rules.items() if f" {phrase} " in norm]
+        return min(ttls) if ttls else self.ttl_s
+
+    def get(self, transcript: str, voice: str, prompt: str) -> Optional[mmap.mmap]:
+        if not self.ttl_for(transcript):
+            self._count("skipped")
+            return None
+        key = self._key(transcript, voice, prompt)
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is not None and time.time() - entry["created"] > entry["ttl"]:
+                self._drop(key)
+                self._save_index()
+                entry = None
+            if entry is None:
+                self._count("misses")
+                return None
+            try:
+                with open(self._path(key), "rb") as f:
+                    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                self._drop(key)
+                self._save_index()
+                self._count("misses")
+                return None
+            entry["used"] = time.time()
+            self._index.move_to_end(key)
+            self._count("hits")
+            return mm
+
+    def put(self, transcript: str, voice: str, prompt: str, pcm: bytes) -> None:
+        ttl = self.ttl_for(transcript)
+        if not ttl or not pcm or len(pcm) > self.max_bytes:
+            return
+        key = self._key(transcript, voice, prompt)
+        path = self._path(key)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_bytes(pcm)
+        os.replace(tmp, path)
+        now = time.time()
+        with self._lock:
+            if key in self._index:
+                self._total -= self._index.pop(key)["size"]
+            self._index[key] = {"transcript": normalize_phrase(transcript), "size": len(pcm),
+                                "created": now, "used": now, "ttl": ttl}
+            self._total += len(pcm)
+            self._evict(now)
+            self._save_index()
+        METRICS.gauge("response_cache_bytes", self._total)
+
+    def clear(self) -> None:
+        with self._lock:
+            for key in list(self._index):
+                self._drop(key)
+            self._save_index()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._index), "bytes": self._total,
+                    "hits": self.hits, "misses": self.misses, "skipped": self.skipped}
+
+    # ---------------------- внутренняя логика ----------------------
+
+    @staticmethod
+    def _key(transcript: str, voice: str, prompt: str) -> str:
+        raw = "\0".join((normalize_phrase(transcript), voice, prompt))
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.root / f"{key}.pcm"
+
+    def _count(self, name: str) -> None:
+        setattr(self, name, getattr(self, name) + 1)
+        METRICS.count(f"response_cache_{name}")
+
+    def _evict(self, now: float) -> None:
+        for key in [k for k, e in self._index.items() if now - e["created"] > e["ttl"]]:
+            self._drop(key)
+        while self._total > self.max_bytes and self._index:
+            self._drop(next(iter(self._index)))
+            METRICS.count("response_cache_evicted")
+
+    def _drop(self, key: str) -> None:
+        entry = self._index.pop(key, None)
+        if entry is not None:
+            self._total -= entry["size"]
+        try:
+            self._path(key).unlink()
+        except FileNotFoundError:
+            pass
+
+    def _load_index(self) -> "OrderedDict[str, dict]":
+        try:
+            raw = json.loads((self.root / "index.json").read_text())
+        except (OSError, ValueError):
+            return OrderedDict()
+        entries = sorted(((k, e) for k, e in raw.items() if self._path(k).exists()),
+                         key=lambda item: item[1]["used"])
+        return OrderedDict(entries)
+
+    def _save_index(self) -> None:
+        path = self.root / "index.json"
+        tmp = path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(self._index, ensure_ascii=False))
+        os.replace(tmp, path)  # атомарно: при сбое остаётся прежний индекс
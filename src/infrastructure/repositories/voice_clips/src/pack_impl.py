@@ -0,0 +1,148 @@
+import hashlib
+import json
+import mmap
+import os
+import threading
+from pathlib import Path
+from typing import Mapping, Optional, Union
+
+from infrastructure.repositories.voice_clips.voice_clips import IVoiceClips
+from infrastructure.services.tts.tts import EspeakTts, ITts
+from infrastructure.utils.metrics import METRICS
+
+DEFAULT_CLIPS_DIR = Path(__file__).resolve().parents[3] / "storage" / "cache" / "clips"
+
+# Имя клипа → фраза
+LISTENING = "listening"
+PAUSED = "paused"
+RESUMED = "resumed"
+SEND_ERROR = "send_error"
+OFFLINE = "offline"
+
+DEFAULT_PHRASES: dict[str, str] = {
+    LISTENING: "Слушаю",
+    PAUSED: "Поставила на паузу",
+    RESUMED: "Продолжаю",
+    SEND_ERROR: "Не получилось получить ответ. Попробуйте ещё раз.",
+    OFFLINE: "Нет связи с сервером.",
+}
+
+
+class PackVoiceClips(IVoiceClips):
+    """
+    Короткие фиксированные фразы (подтверждения, ошибки), озвученные локально один раз.
+
+    Особенности:
+      - Все клипы — PCM16 на частоте вывода, подряд в одном файле clips-<rate>.pcm;
+        смещения и длины — в индексе clips-<rate>.json рядом.
+      - Файл отображается через mmap один раз; get() отдаёт memoryview на кусок
+        отображения — ни чтения с диска, ни копии, ни сети: звук начинается в ближайшем блоке.
+      - Пакет пересобирается (ensure()), только если поменялись фразы или голос
+        (отпечаток в индексе); запись атомарная — при сбое остаётся прежний пакет.
+      - Нет espeak — клипов нет (get() → None), приложение работает как раньше.
+    """
+
+    def __init__(
+        self,
+        tts: Optional[ITts] = None,
+        root: Union[str, Path] = DEFAULT_CLIPS_DIR,
+        phrases: Optional[Mapping[str, str]] = None,
+        samplerate: int = 24000,
+    ):
+        self.tts = tts or EspeakTts(samplerate=samplerate)
+        if self.tts.samplerate != samplerate:
+            raise ValueError(f"Частота синтеза {self.tts.samplerate} ≠ частоте вывода {samplerate}")
+        self.root = Path(root)
+        self.phrases = dict(DEFAULT_PHRASES if phrases is None else phrases)
+        self.samplerate = int(samplerate)
+
+        self._lock = threading.Lock()
+        self._index: dict[str, dict] = {}
+        self._mmap: Optional[mmap.mmap] = None
+        self._open()
+
+    # ---------------------- API ----------------------
+
+    def get(self, name: str) -> Optional[memoryview]:
+        mm = self._mmap
+        entry = self._index.get(name)
+        if mm is None or entry is None:
+            METRICS.count("voice_clips_missing")
+            return None
+        return memoryview(mm)[entry["offset"]:entry["offset"] + entry["size"]]
+
+    def names(self) -> list[str]:
+        return list(self._index)
+
+    def ensure(self) -> bool:
+        """Пересобрать пакет, если он устарел (блокирующий вызов — из executor-а). True — клипы готовы."""
+        with self._lock:
+            if self._index and self._current():
+                return True
+            if not self.tts.available():
+                print("[CLIPS] espeak не найден — локальные фразы отключены")
+                return False
+            try:
+                self._build()
+            except Exception as e:
+                print(f"[CLIPS ERROR] {e}")
+                return False
+            self._open()
+            return bool(self._index)
+
+    # ---------------------- внутренняя логика ----------------------
+
+    @property
+    def _pack_path(self) -> Path:
+        return self.root / f"clips-{self.samplerate}.pcm"
+
+    @property
+    def _index_path(self) -> Path:
+        return self.root / f"clips-{self.samplerate}.json"
+
+    def _fingerprint(self) -> str:
+        raw = json.dumps([self.tts.fingerprint(), sorted(self.phrases.items())], ensure_ascii=False)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def _current(self) -> bool:
+        try:
+            meta = json.loads(self._index_path.read_text())
+        except (OSError, ValueError):
+            return False
+        return meta.get("fingerprint") == self._fingerprint()
+
+    def _open(self) -> None:
+        """Отобразить пакет, если он соответствует текущим фразам и голосу."""
+        if not self._current():
+            return
+        meta = json.loads(self._index_path.read_text())
+        try:
+            with open(self._pack_path, "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return
+        old, self._mmap, self._index = self._mmap, mm, meta["clips"]
+        if old is not None:
+            try:
+                old.close()
+            except BufferError:
+                pass  # старый клип ещё звучит — отображение закроет сборщик мусора
+        METRICS.gauge("voice_clips_bytes", len(mm))
+
+    def _build(self) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        clips: dict[str, dict] = {}
+        pack_tmp = self._pack_path.with_suffix(".pcm.tmp")
+        offset = 0
+        with open(pack_tmp, "wb") as f:
+            for name, text in self.phrases.items():
+                pcm = self.tts.render(text)
+                f.write(pcm)
+                clips[name] = {"text": text, "offset": offset, "size": len(pcm)}
+                offset += len(pcm)
+        index_tmp = self._index_path.with_suffix(".json.tmp")
+        index_tmp.write_text(json.dumps({"fingerprint": self._fingerprint(), "samplerate": self.samplerate,
+                                         "clips": clips}, ensure_ascii=False))
+        os.replace(pack_tmp, self._pack_path)
+        os.replace(index_tmp, self._index_path)  # индекс — последним: он подтверждает пакет
+        print(f"[CLIPS] Озвучено фраз: {len(clips)}, {offset / 1024:.0f} КБ")
@@ -0,0 +1,14 @@
+from abc import ABC, abstractmethod
+from typing import Optional
+
+
+class IVoiceClips(ABC):
+    @abstractmethod
+    def get(self, name: str) -> Optional[memoryview]:
+        """Готовая фраза (PCM16 на частоте вывода) без копирования; None — клипа нет"""
+        pass
+
+    @abstractmethod
+    def names(self) -> list[str]:
+        """Имена доступных клипов"""
+        pass
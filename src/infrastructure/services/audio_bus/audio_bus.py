@@ -0,0 +1,317 @@
+import asyncio
+import sys
+import threading
+from typing import Optional
+
+import numpy as np
+import sounddevice as sd
+
+from infrastructure.services.audio_bus.resample import PolyphaseResampler
+from infrastructure.utils.metrics import METRICS
+
+# Политика переполнения для асинхронных потребителей (AsyncBusReader)
+DROP_OLDEST = "drop_oldest"        # отставший больше ёмкости кольца теряет самое старое (как BusReader)
+SKIP_TO_LATEST = "skip_to_latest"  # отставший больше max_lag_ms перескакивает к свежему звуку
+
+
+def native_samplerate(device_index: Optional[int] = None) -> int:
+    """Родная частота входного устройства (на ней устройство открывается без отказов)."""
+    dev = sd.query_devices(device_index, kind="input") if device_index is None else sd.query_devices(device_index)
+    return int(dev["default_samplerate"])
+
+
+class AudioCaptureBus:
+    """
+    Единый, всегда открытый поток захвата микрофона с раздачей нескольким потребителям.
+
+    Особенности:
+      - Один sd.RawInputStream на всё приложение: распознавание и запись больше
+        не переоткрывают устройство, звук на границе «ключевое слово → запись» не теряется.
+      - Кольцевой буфер фиксированного размера (PCM16), выделяется один раз.
+      - Каждый потребитель читает через свой BusReader со своим курсором; чтение
+        возвращает memoryview прямо в кольцо, без копирования.
+      - Reader можно открыть «N мс в прошлом» (pre-roll), пока данные ещё в кольце.
+      - Если потребитель отстал больше, чем на ёмкость кольца, его курсор
+        перескакивает вперёд, а пропуск учитывается в reader.dropped_frames.
+      - samplerate=None — устройство открывается на родной частоте, а каждый
+        потребитель получает звук на своей частоте через reader(samplerate=...)
+        (16 кГц для Vosk, 24 кГц для отправки); устройство не переоткрывается.
+      - async_reader(...) — потребитель-корутина: колбэк PortAudio только будит его
+        loop через call_soon_threadsafe (и только если он ждёт), без потоков-посредников.
+    """
+
+    def __init__(
+        self,
+        samplerate: Optional[int] = 24000,
+        device_index: Optional[int] = None,
+        channels: int = 1,
+        blocksize: int = 1024,
+        capacity_s: float = 10.0,
+        block_ms: Optional[float] = None,
+    ):
+        if samplerate is None:
+            samplerate = native_samplerate(device_index)
+        self.samplerate = int(samplerate)
+        self.device_index = device_index
+        self.channels = int(channels)
+        self.blocksize = int(self.samplerate * block_ms / 1000) if block_ms else int(blocksize)
+
+        # ёмкость в кадрах; кадр = channels сэмплов int16
+        self.capacity = int(self.samplerate * capacity_s)
+        self._ring = np.zeros(self.capacity * self.channels, dtype=np.int16)
+        self._write_pos = 0  # всего записано кадров с момента старта
+
+        self._cond = threading.Condition()
+        self._stream: Optional[sd.RawInputStream] = None
+        self._async_readers: list["AsyncBusReader"] = []
+
+    # ---------------------- API ----------------------
+
+    def start(self) -> None:
+        if self._stream is not None:
+            return
+        self._stream = sd.RawInputStream(
+            samplerate=self.samplerate,
+            blocksize=self.blocksize,
+            dtype="int16",
+            channels=self.channels,
+            device=self.device_index,
+            callback=self._cb,
+        )
+        self._stream.start()
+        print(f"▶️ Захват запущен: device={self.device_index}, rate={self.samplerate}")
+
+    def stop(self) -> None:
+        stream, self._stream = self._stream, None
+        if stream is not None:
+            stream.stop()
+            stream.close()
+        with self._cond:
+            self._cond.notify_all()
+            readers = list(self._async_readers)
+        for r in readers:
+            r._wake()
+
+    @property
+    def position(self) -> int:
+        """Абсолютная позиция записи (кадры с момента старта)."""
+        return self._write_pos
+
+    def reader(self, start_ms_ago: float = 0.0, samplerate: Optional[int] = None):
+        """
+        Новый потребитель; start_ms_ago > 0 — начать с уже захваченного звука.
+        samplerate — частота, на которой потребитель хочет получать звук.
+        """
+        r = BusReader(self)
+        r.seek_ms_ago(start_ms_ago)
+        if samplerate is None or int(samplerate) == self.samplerate:
+            return r
+        return ResampledReader(r, int(samplerate))
+
+    def async_reader(self, start_ms_ago: float = 0.0, samplerate: Optional[int] = None,
+                     overflow: str = DROP_OLDEST, max_lag_ms: float = 500.0) -> "AsyncBusReader":
+        """Потребитель для asyncio (вызывать из работающего loop); закрыть через close()."""
+        r = AsyncBusReader(self, self.reader(start_ms_ago, samplerate), asyncio.get_running_loop(),
+                           overflow=overflow, max_lag_ms=max_lag_ms)
+        with self._cond:
+            self._async_readers.append(r)
+        return r
+
+    def _remove_async_reader(self, r: "AsyncBusReader") -> None:
+        with self._cond:
+            if r in self._async_readers:
+                self._async_readers.remove(r)
+
+    # ---------------------- внутренняя логика ----------------------
+
+    def _cb(self, indata, frames, time_info, status):
+        if status:
+            METRICS.count("audio_input_status")
+            print(f"[AudioStatus] {status}", file=sys.stderr)
+        src = np.frombuffer(indata, dtype=np.int16)
+        n = src.size
+        cap = self._ring.size
+        start = (self._write_pos * self.channels) % cap
+        first = min(n, cap - start)
+        self._ring[start:start + first] = src[:first]
+        if first < n:
+            self._ring[:n - first] = src[first:]
+        with self._cond:
+            self._write_pos += frames
+            self._cond.notify_all()
+            waiting = [r for r in self._async_readers if r._waiting]
+        for r in waiting:
+            r._wake()
+
+
+class BusReader:
+    """Курсор одного потребителя AudioCaptureBus."""
+
+    def __init__(self, bus: AudioCaptureBus):
+        self._bus = bus
+        self.pos = bus.position
+        self.dropped_frames = 0
+
+    def seek_ms_ago(self, ms: float) -> None:
+        back = int(self._bus.samplerate * max(0.0, ms) / 1000.0)
+        self.seek(self._bus.position - back)
+
+    def seek(self, pos: int) -> None:
+        """Перейти на абсолютную позицию (не раньше, чем позволяет кольцо)."""
+        bus = self._bus
+        self.pos = max(pos, bus.position - bus.capacity + bus.blocksize, 0)
+
+    def available(self) -> int:
+        return self._bus.position - self.pos
+
+    def read(self, frames: int, timeout: Optional[float] = None) -> Optional[memoryview]:
+        """
+        Дождаться frames кадров и вернуть их как memoryview (байты PCM16) без копирования.
+        На стыке кольца возвращается более короткий непрерывный кусок, остаток — следующим вызовом.
+        None — таймаут или остановленный поток захвата.
+        Данные действительны, пока их не перезапишет кольцо (≈ capacity_s), поэтому
+        сохранять их надолго нужно копией (bytes(view)).
+        """
+        bus = self._bus
+        with bus._cond:
+            if not bus._cond.wait_for(lambda: bus.position - self.pos >= frames or bus._stream is None,
+                                      timeout=timeout):
+                return None
+            if bus.position - self.pos < frames:
+                return None
+            behind = bus.position - self.pos
+            if behind > bus.capacity - bus.blocksize:
+                # потребитель отстал — данные под курсором уже перезаписаны
+                skip = behind - (bus.capacity - bus.blocksize)
+                self.pos += skip
+                self.dropped_frames += skip
+                METRICS.count("bus_dropped_frames", skip)
+
+        ch = bus.channels
+        cap = bus._ring.size
+        start = (self.pos * ch) % cap
+        n = min(frames * ch, cap - start)
+        self.pos += n // ch
+        return memoryview(bus._ring[start:start + n]).cast("B")
+
+
+class ResampledReader:
+    """
+    BusReader с пересчётом частоты: тот же интерфейс, но frames и данные — на частоте потребителя.
+    Позиции (pos, seek) остаются в кадрах шины.
+    """
+
+    def __init__(self, reader: BusReader, samplerate: int):
+        if reader._bus.channels != 1:
+            raise ValueError("Ресемплинг поддерживается только для моно")
+        self._reader = reader
+        self.samplerate = samplerate
+        self._ratio = reader._bus.samplerate / samplerate
+        self._resampler = PolyphaseResampler(reader._bus.samplerate, samplerate,
+                                             max_block=reader._bus.blocksize * 4)
+
+    @property
+    def pos(self) -> int:
+        return self._reader.pos
+
+    @property
+    def dropped_frames(self) -> int:
+        return self._reader.dropped_frames
+
+    def seek_ms_ago(self, ms: float) -> None:
+        self._reader.seek_ms_ago(ms)
+        self._resampler.reset()
+
+    def seek(self, pos: int) -> None:
+        self._reader.seek(pos)
+        self._resampler.reset()
+
+    def available(self) -> int:
+        return int(self._reader.available() / self._ratio)
+
+    def read(self, frames: int, timeout: Optional[float] = None) -> Optional[memoryview]:
+        data = self._reader.read(max(1, round(frames * self._ratio)), timeout=timeout)
+        if data is None:
+            return None
+        return memoryview(self._resampler.process(data)).cast("B")
+
+
+class AsyncBusReader:
+    """
+    Курсор шины для корутин: await read(frames) вместо блокирующего ожидания в потоке.
+
+    Данные остаются в кольце шины (memoryview, без копий); колбэк захвата лишь ставит
+    в loop пробуждение (call_soon_threadsafe), когда потребитель действительно ждёт.
+    Переполнение задаётся явно:
+      - DROP_OLDEST — как у BusReader: теряется только перезаписанное кольцом;
+      - SKIP_TO_LATEST — отставание больше max_lag_ms сбрасывается сразу (распознаванию
+        важнее свежий звук, чем полный); пропуск — в dropped_frames и METRICS.
+    """
+
+    def __init__(self, bus: AudioCaptureBus, reader, loop: asyncio.AbstractEventLoop,
+                 overflow: str = DROP_OLDEST, max_lag_ms: float = 500.0):
+        if overflow not in (DROP_OLDEST, SKIP_TO_LATEST):
+            raise ValueError(f"Неизвестная политика переполнения: {overflow}")
+        self._bus = bus
+        self._reader = reader
+        self._loop = loop
+        self.overflow = overflow
+        self.max_lag_frames = int(bus.samplerate * max_lag_ms / 1000)
+        self.skipped_frames = 0
+        self._event = asyncio.Event()
+        self._waiting = False
+        self._closed = False
+
+    @property
+    def pos(self) -> int:
+        return self._reader.pos
+
+    @property
+    def dropped_frames(self) -> int:
+        return self._reader.dropped_frames + self.skipped_frames
+
+    def seek(self, pos: int) -> None:
+        self._reader.seek(pos)
+
+    def seek_ms_ago(self, ms: float) -> None:
+        self._reader.seek_ms_ago(ms)
+
+    def available(self) -> int:
+        return self._reader.available()
+
+    async def read(self, frames: int) -> Optional[memoryview]:
+        """Следующий блок (частота — как у reader); None — захват остановлен или reader закрыт."""
+        while not self._closed:
+            if self.overflow == SKIP_TO_LATEST:
+                lag = self._bus.position - self._reader.pos
+                if lag > self.max_lag_frames:
+                    skip = lag - self.max_lag_frames // 2
+                    self._reader.seek(self._reader.pos + skip)
+                    self.skipped_frames += skip
+                    METRICS.count("bus_skipped_frames", skip)
+            mark = self._bus.position
+            data = self._reader.read(frames, timeout=0)
+            if data is not None:
+                return data
+            if self._bus._stream is None:
+                return None
+            self._event.clear()
+            self._waiting = True
+            try:
+                # колбэк мог записать блок между read и _waiting — тогда не ждём
+                if self._bus.position == mark:
+                    await self._event.wait()
+            finally:
+                self._waiting = False
+        return None
+
+    def close(self) -> None:
+        self._closed = True
+        self._bus._remove_async_reader(self)
+        self._wake()
+
+    def _wake(self) -> None:
+        try:
+            self._loop.call_soon_threadsafe(self._event.set)
+        except RuntimeError:
+            pass  # loop уже закрыт
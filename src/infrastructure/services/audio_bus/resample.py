@@ -0,0 +1,103 @@
+from math import ceil, gcd
+from typing import Optional
+
+import numpy as np
+
+
+class PolyphaseResampler:
+    """
+    Потоковый ресемплер PCM16 (моно) с рациональным коэффициентом out_rate / in_rate.
+
+      - Коэффициент сокращается до up / down; фильтр-прототип — windowed-sinc (Кайзер)
+        на «повышенной» частоте, разложенный на up фаз по taps_per_phase отводов
+        (при понижении частоты — в ceil(down / up) раз больше).
+      - Каждый блок считается целиком в NumPy: для всех выходных отсчётов сразу
+        собирается матрица окон входа [n_out, taps] и свёртывается с фазами; при up == 1
+        фаза одна — матрица фаз не нужна.
+      - Между блоками хранится хвост входа (taps - 1 отсчётов) и фаза — на стыках нет щелчков.
+      - Все рабочие массивы (вход, индексы, окна, фазы, сумма, выход) выделяются один раз
+        под max_block и заполняются через out=; если блок больше, они расширяются (один раз),
+        так что на блок нет новых аллокаций и стоимость ограничена и предсказуема.
+    Возвращаемый массив — представление внутреннего буфера: действительно до следующего process().
+    """
+
+    def __init__(self, in_rate: int, out_rate: int, taps_per_phase: int = 16, rolloff: float = 0.92,
+                 kaiser_beta: float = 8.0, max_block: int = 4096):
+        g = gcd(int(in_rate), int(out_rate))
+        self.in_rate, self.out_rate = int(in_rate), int(out_rate)
+        self.up, self.down = self.out_rate // g, self.in_rate // g
+        # при понижении частоты фильтр должен быть длиннее во столько же раз
+        self.taps = int(taps_per_phase) * max(1, ceil(self.down / self.up))
+
+        n = self.taps * self.up
+        cutoff = rolloff / max(self.up, self.down)  # доля от Найквиста повышенной частоты
+        m = np.arange(n) - (n - 1) / 2.0
+        proto = cutoff * np.sinc(cutoff * m) * np.kaiser(n, kaiser_beta) * self.up
+        # фаза p: отводы proto[p + k*up], k = 0..taps-1 (k — задержка по входу); отводы
+        # развёрнуты по k, чтобы умножаться на окно входа в прямом порядке (старый отсчёт — первый)
+        self._phases = proto.reshape(self.taps, self.up).T[:, ::-1].astype(np.float32).copy()
+
+        self._hist = self.taps - 1
+        self._alloc(max_block)
+        self.reset()
+
+    def reset(self) -> None:
+        self._ext[:self._hist] = 0.0
+        self._t = 0  # индекс следующего выходного отсчёта на повышенной частоте, от начала блока
+
+    def output_size(self, n_in: int) -> int:
+        """Верхняя граница числа выходных отсчётов для блока из n_in входных."""
+        return (n_in * self.up + self.down - 1) // self.down + 1
+
+    def process(self, block) -> np.ndarray:
+        x = np.frombuffer(block, dtype=np.int16) if not isinstance(block, np.ndarray) else block
+        n_in = x.size
+        if n_in == 0:
+            return self._out[:0]
+        if n_in > self._max_block:
+            self._alloc(n_in)
+
+        ext = self._ext
+        ext[self._hist:self._hist + n_in] = x
+
+        limit = n_in * self.up
+        count = max(0, (limit - self._t + self.down - 1) // self.down)
+        # окно выходного отсчёта i — ext[ts_i // up + k], k = 0..taps-1 (хвост hist = taps - 1 уже впереди);
+        # (t + grid) // up даёт его сразу: grid[i, k] = down*i + up*k, без broadcast-временных массивов
+        idx = np.add(self._grid[:count], self._t, out=self._idx[:count])
+        if self.up > 1:
+            np.floor_divide(idx, self.up, out=idx)
+        win = np.take(ext, idx, out=self._win[:count], mode="clip")  # mode="raise" буферизует out
+        y = self._y[:count]
+        if self.up == 1:
+            np.dot(win, self._phases[0], out=y)
+        else:
+            ts = np.add(self._steps[:count], self._t, out=self._ts[:count])
+            phases = np.take(self._phases, np.remainder(ts, self.up, out=ts), axis=0,
+                             out=self._ph[:count], mode="clip")
+            np.einsum("ij,ij->i", win, phases, out=y)
+
+        out = self._out[:count]
+        np.rint(y, out=y)
+        np.clip(y, -32768, 32767, out=y)
+        out[:] = y
+
+        self._t = self._t + self.down * count - limit
+        ext[:self._hist] = ext[n_in:n_in + self._hist]  # хвост для следующего блока
+        return out
+
+    def _alloc(self, max_block: int) -> None:
+        old: Optional[np.ndarray] = getattr(self, "_ext", None)
+        self._max_block = int(max_block)
+        self._ext = np.zeros(self._hist + self._max_block, dtype=np.float32)
+        if old is not None:
+            self._ext[:self._hist] = old[:self._hist]
+        n_out = self.output_size(self._max_block)
+        self._out = np.zeros(n_out, dtype=np.int16)
+        self._steps = self.down * np.arange(n_out, dtype=np.intp)
+        self._grid = self._steps[:, None] + self.up * np.arange(self.taps, dtype=np.intp)
+        self._ts = np.empty(n_out, dtype=np.intp)
+        self._idx = np.empty((n_out, self.taps), dtype=np.intp)
+        self._win = np.empty((n_out, self.taps), dtype=np.float32)
+        self._ph = np.empty((n_out, self.taps), dtype=np.float32) if self.up > 1 else None
+        self._y = np.empty(n_out, dtype=np.float32)
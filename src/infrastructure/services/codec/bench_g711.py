@@ -0,0 +1,61 @@
+# bench_g711.py — стоимость кодирования G.711 против экономии трафика.
+# Запуск из src/: python -m infrastructure.services.codec.bench_g711 [секунд_звука]
+import base64
+import platform
+import sys
+import time
+
+import numpy as np
+
+from infrastructure.services.codec.g711 import G711_ALAW, G711_ULAW, G711Encoder
+
+RATE = 24000
+BLOCK = 480  # 20 мс — блок потоковой записи
+
+
+def speech_like(seconds: float) -> np.ndarray:
+    t = np.arange(int(RATE * seconds)) / RATE
+    f0 = 140 + 30 * np.sin(2 * np.pi * 0.7 * t)
+    voiced = sum(np.sin(2 * np.pi * k * np.cumsum(f0) / RATE) / k for k in range(1, 12))
+    env = 0.5 + 0.5 * np.sin(2 * np.pi * 3 * t) ** 2
+    noise = np.random.default_rng(0).normal(0, 0.05, t.size)
+    return (np.clip(voiced * env / 3 + noise, -1, 1) * 12000).astype(np.int16)
+
+
+def bench(law: str, pcm: np.ndarray, block: int) -> dict:
+    enc = G711Encoder(law, in_rate=RATE)
+    enc.encode(pcm[:block].tobytes())  # прогрев: таблица и буферы
+    enc.reset()
+    raw = pcm.tobytes()
+    step = block * 2
+    out_bytes = 0
+    started = time.perf_counter()
+    for i in range(0, len(raw), step):
+        out_bytes += len(enc.encode(raw[i:i + step]))
+    elapsed = time.perf_counter() - started
+    seconds = pcm.size / RATE
+    return {
+        "law": law,
+        "block_ms": block * 1000 // RATE,
+        "encode_ms_per_audio_s": round(elapsed * 1000 / seconds, 3),
+        "rtf": round(elapsed / seconds, 5),
+        "wire_bytes_per_s": round(4 * ((out_bytes + 2) // 3) / seconds),
+    }
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 30.0
+    pcm = speech_like(seconds)
+    pcm16_wire = len(base64.b64encode(pcm.tobytes())) / seconds
+    print(f"machine={platform.machine()} python={platform.python_version()} numpy={np.__version__}")
+    print(f"pcm16 24 кГц: {pcm16_wire:.0f} байт/с в base64")
+    for law in (G711_ULAW, G711_ALAW):
+        for block in (BLOCK, RATE * 2):
+            r = bench(law, pcm, block)
+            print(f"{r['law']:10s} блок {r['block_ms']:5d} мс: кодирование {r['encode_ms_per_audio_s']:7.3f} мс "
+                  f"на 1 с звука (RTF {r['rtf']}), {r['wire_bytes_per_s']} байт/с "
+                  f"(−{100 * (1 - r['wire_bytes_per_s'] / pcm16_wire):.0f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+from typing import Optional
+
+import numpy as np
+
+from infrastructure.services.audio_bus.resample import PolyphaseResampler
+
+# Значения input_audio_format в Realtime API
+PCM16 = "pcm16"
+G711_ULAW = "g711_ulaw"
+G711_ALAW = "g711_alaw"
+
+G711_RATE = 8000
+
+_ULAW_BIAS = 0x84
+_ULAW_CLIP = 8159
+_ULAW_SEG_END = np.array([0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF, 0x1FFF])
+_ALAW_SEG_END = np.array([0x1F, 0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF])
+
+_tables: dict[str, np.ndarray] = {}
+
+
+def _all_int16() -> np.ndarray:
+    # индекс таблицы — сэмпл int16, прочитанный как uint16
+    return np.arange(65536, dtype=np.uint16).view(np.int16).astype(np.int32)
+
+
+def _build_ulaw() -> np.ndarray:
+    # как в эталонном g711.c: 14 бит, знак отдельно от модуля
+    x = _all_int16() >> 2
+    mask = np.where(x < 0, 0x7F, 0xFF)
+    mag = np.minimum(np.where(x < 0, -x, x), _ULAW_CLIP) + (_ULAW_BIAS >> 2)
+    seg = np.searchsorted(_ULAW_SEG_END, mag, side="left")
+    uval = (np.minimum(seg, 7) << 4) | ((mag >> (seg + 1)) & 0x0F)
+    uval = np.where(seg >= 8, 0x7F, uval)
+    return ((uval ^ mask) & 0xFF).astype(np.uint8)
+
+
+def _build_alaw() -> np.ndarray:
+    x = _all_int16() >> 3  # 13 бит
+    mask = np.where(x >= 0, 0xD5, 0x55)
+    mag = np.where(x >= 0, x, -x - 1)
+    seg = np.searchsorted(_ALAW_SEG_END, mag, side="left")
+    shift = np.where(seg < 2, 1, seg)
+    aval = (np.minimum(seg, 7) << 4) | ((mag >> shift) & 0x0F)
+    aval = np.where(seg >= 8, 0x7F, aval)
+    return ((aval ^ mask) & 0xFF).astype(np.uint8)
+
+
+def encode_table(law: str) -> np.ndarray:
+    """Таблица кодирования на все 65536 значений int16 (64 КБ, строится один раз)."""
+    table = _tables.get(law)
+    if table is None:
+        if law == G711_ULAW:
+            table = _build_ulaw()
+        elif law == G711_ALAW:
+            table = _build_alaw()
+        else:
+            raise ValueError(f"Неизвестный формат G.711: {law}")
+        _tables[law] = table
+    return table
+
+
+def decode_table(law: str) -> np.ndarray:
+    """Обратная таблица: 256 кодов → int16 (для проверки и отладки)."""
+    code = np.arange(256, dtype=np.int32)
+    if law == G711_ULAW:
+        u = ~code & 0xFF
+        t = (((u & 0x0F) << 3) + _ULAW_BIAS) << ((u & 0x70) >> 4)
+        return np.where(u & 0x80, _ULAW_BIAS - t, t - _ULAW_BIAS).astype(np.int16)
+    if law == G711_ALAW:
+        a = code ^ 0x55
+        seg = (a & 0x70) >> 4
+        t = (a & 0x0F) << 4
+        t = np.where(seg == 0, t + 8, (t + 0x108) << np.maximum(seg - 1, 0))
+        return np.where(a & 0x80, t, -t).astype(np.int16)
+    raise ValueError(f"Неизвестный формат G.711: {law}")
+
+
+class G711Encoder:
+    """
+    Потоковый кодер PCM16 → G.711 (µ-law / A-law) с понижением частоты до 8 кГц.
+
+      - Частота понижается PolyphaseResampler-ом (состояние фильтра живёт между блоками).
+      - Кодирование — одна выборка из таблицы на весь блок (np.take по сэмплам как uint16).
+      - Выход — 1 байт на сэмпл 8 кГц: в 6 раз меньше PCM16 24 кГц.
+    Возвращаемый memoryview ссылается на внутренний буфер: действителен до следующего encode().
+    """
+
+    def __init__(self, law: str, in_rate: int = 24000, max_block: int = 48000):
+        self.law = law
+        self.in_rate = int(in_rate)
+        self._table = encode_table(law)
+        self._resampler: Optional[PolyphaseResampler] = (
+            PolyphaseResampler(self.in_rate, G711_RATE, max_block=max_block)
+            if self.in_rate != G711_RATE else None
+        )
+        self._out = np.empty(0, dtype=np.uint8)
+
+    def encode(self, block) -> memoryview:
+        x = self._resampler.process(block) if self._resampler is not None else np.frombuffer(block, dtype=np.int16)
+        if self._out.size < x.size:
+            self._out = np.empty(x.size, dtype=np.uint8)
+        out = self._out[:x.size]
+        np.take(self._table, x.view(np.uint16), out=out)
+        return memoryview(out)
+
+    def reset(self) -> None:
+        if self._resampler is not None:
+            self._resampler.reset()
@@ -1,7 +1,8 @@
+import asyncio
 from abc import abstractmethod, ABC
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Optional
+from typing import AsyncIterable, AsyncIterator, Iterable, Optional, Union
 
 
 @dataclass
@@ -16,15 +17,48 @@ class LLMService(ABC):
     @abstractmethod
     def audio_stream(
             self,
-            path: Path,
+            source: Union[Path, bytes, memoryview, AsyncIterable[bytes]],
             *,
             voice: str,
             prompt: str
     ):
-        """Отправляет WAV в модель и сохраняет голосовой ответ в reply_path."""
+        """
+        Отправляет аудио в модель и стримит голосовой ответ.
+        source — файл PCM16, запись в памяти (bytes / memoryview) или
+        async-итератор PCM16-чанков (потоковая запись).
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def cancel(self) -> None:
+        """Прервать генерацию текущего ответа (barge-in)."""
         raise NotImplementedError
 
     @abstractmethod
     def text(self, prompt: str):
-        """Отправляет текст в модель"""
+        """Отправляет текст в модель (блокирующий вызов — не для event loop)"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def text_stream(self, prompt: str, *, instructions: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Текст → текст без блокировки loop: async-итератор фрагментов ответа
+        по мере генерации (можно действовать по первым токенам).
+        """
         raise NotImplementedError
+
+    async def text_async(self, prompt: str, *, instructions: Optional[str] = None) -> str:
+        """Ответ целиком, но без блокировки loop."""
+        parts = [piece async for piece in self.text_stream(prompt, instructions=instructions)]
+        return "".join(parts).strip()
+
+    async def text_many(self, prompts: Iterable[str], *, instructions: Optional[str] = None,
+                        limit: int = 4) -> list[str]:
+        """Несколько независимых запросов параллельно, не больше limit одновременно; порядок ответов — как у prompts."""
+        sem = asyncio.BoundedSemaphore(max(1, limit))
+
+        async def one(prompt: str) -> str:
+            async with sem:
+                return await self.text_async(prompt, instructions=instructions)
+
+        return list(await asyncio.gather(*(one(p) for p in prompts)))
@@ -1,17 +1,31 @@
+import asyncio
 import base64
 import json
-import ssl
+import logging
+import time
 from abc import ABC
 from pathlib import Path
-from typing import Optional, AsyncIterator
-
-import certifi
-import websockets
-from openai import OpenAI, APIConnectionError, APIStatusError, RateLimitError
+from typing import AsyncIterable, AsyncIterator, Optional, Union
 
+from infrastructure.utils.log import Sampler, get_logger
+from infrastructure.utils.metrics import FIRST_AUDIO, METRICS, UPLOAD_COMMITTED, WS_OPEN
 from infrastructure.utils.utils import api_key_openai
 
+from infrastructure.repositories.response_cache.response_cache import IResponseCache
+from infrastructure.services.codec.g711 import PCM16, G711Encoder, encode_table
 from infrastructure.services.llm.llm import LLMService
+from infrastructure.services.llm.src.realtime_session import RealtimeSessionManager
+
+log = get_logger(__name__)
+# audio.delta приходят десятками в секунду — в debug-лог попадает каждое N-е
+_event_sampler = Sampler(every=50)
+# ответ из кэша отдаётся кусками по 200 мс PCM16 24 кГц
+_CACHE_CHUNK = 9600
+# запись целиком уходит append-ами по ~2 с (кратно 3 байтам — base64 без «хвостов»)
+_APPEND_CHUNK = 96000
+_APPEND_PREFIX = '{"type": "input_audio_buffer.append", "audio": "'
+_APPEND_SUFFIX = '"}'
+_API_URL = "https://api.openai.com/v1"
 
 
 class OpenAiLLMService(LLMService):
@@ -19,51 +33,104 @@ class OpenAiLLMService(LLMService):
             self,
             system_message: Optional[str] = None,
             model: str = "gpt-5",
+            sessions: Optional[RealtimeSessionManager] = None,
+            keep_history: bool = False,
+            cache: Optional[IResponseCache] = None,
+            cache_hold_s: float = 0.5,
+            input_audio_format: str = PCM16,
+            input_samplerate: int = 24000,
+            realtime_url: Optional[str] = None,
+            text_model: str = "gpt-4o-mini",
+            append_chunk_bytes: int = _APPEND_CHUNK,
+            cache_max_bytes: Optional[int] = None,
+            http_text: bool = False,
     ):
         super().__init__(system_message=system_message, model=model)
-        self._client = OpenAI(api_key=api_key_openai())
+        self._api_key = api_key_openai()
+        # SDK openai нужен только для текстового пути — импортируется лениво
+        self._client = None
+        self._async_client = None  # один клиент (и пул keep-alive соединений) на все text_stream()
+        self.text_model = text_model
         self._model = model
+        self._sessions = sessions or RealtimeSessionManager(model=model, api_key=self._api_key, url=realtime_url)
+        self.keep_history = keep_history
+        # Кэш ответов по транскрипту вопроса: дельты придерживаются до транскрипта,
+        # но не дольше cache_hold_s — на промахе задержка ограничена
+        self.cache = cache
+        self.cache_hold_s = float(cache_hold_s)
+        # g711_ulaw / g711_alaw: запись кодируется в 8 кГц G.711 — в 6 раз меньше байт, чем PCM16 24 кГц
+        self.input_audio_format = input_audio_format
+        self.input_samplerate = int(input_samplerate)
+        if input_audio_format != PCM16:
+            encode_table(input_audio_format)  # неизвестный формат — ошибка сразу, таблица — заранее
+        # Память на реплику: запись уходит append-ами по append_chunk_bytes (кадр JSON — ~4/3 куска),
+        # ответ для кэша копится не больше cache_max_bytes (длиннее — не кэшируется)
+        # кратно 6: целые сэмплы PCM16 (для G.711) и base64 без «хвостов» (кратно 3)
+        self.append_chunk_bytes = max(6, int(append_chunk_bytes) // 6 * 6)
+        self.cache_max_bytes = cache_max_bytes
+        # http_text: text() — одним запросом через urllib, без импорта SDK openai (десятки МБ RSS)
+        self.http_text = bool(http_text)
+        self._response_ws = None  # сокет, на котором сейчас генерируется ответ
+        self._cancelled = False
+
+    @property
+    def sessions(self) -> RealtimeSessionManager:
+        return self._sessions
 
     async def audio_stream(
             self,
-            path: Path,
+            source: Union[Path, bytes, memoryview, AsyncIterable[bytes]],
             *,
             voice: str = "ash",
             prompt: str = "answer strictly the questions from the transmitted audio file",
     ) -> AsyncIterator[bytes]:
-        """Отправляет локальный аудиофайл целиком в Realtime API и стримит PCM16 чанки (bytes)."""
-        if not path.exists():
-            raise FileNotFoundError(path)
+        """
+        Отправляет аудио в Realtime API и стримит PCM16 чанки (bytes) ответа.
 
-        url = f"wss://api.openai.com/v1/realtime?model={self._model}"
-        headers_list = [
-            ("Authorization", f"Bearer {self._client.api_key}"),
-            ("OpenAI-Beta", "realtime=v1"),
-        ]
+        source:
+          - Path — локальный PCM16-файл, отправляется целиком;
+          - bytes / memoryview — запись в памяти (RecordingBuffer.view()), без копии;
+          - async-итератор PCM16-чанков — каждый чанк дописывается в input_audio_buffer
+            по мере поступления по уже открытому сокету, commit — по завершении итератора.
 
-        ssl_ctx = ssl.create_default_context()
-        ssl_ctx.load_verify_locations(cafile=certifi.where())
+        С кэшем (cache): ответ запрашивается сразу, но его дельты придерживаются, пока
+        не придёт транскрипт вопроса (input_audio_transcription), не дольше cache_hold_s.
+        Попадание — генерация отменяется (response.cancel), звучит сохранённый ответ;
+        промах — придержанные дельты отдаются, а полный ответ сохраняется в кэш.
+        """
+        if isinstance(source, Path) and not source.exists():
+            raise FileNotFoundError(source)
 
-        ws_ctx = websockets.connect(url, additional_headers=headers_list, max_size=None, ssl=ssl_ctx)
-
-        async with ws_ctx as ws:
-            # 0) настройка сессии: голос + «безопасный» VAD
-            await ws.send(json.dumps({
-                "type": "session.update",
-                "session": {
-                    "instructions": self._system_message or prompt,
-                    "voice": voice,
-                    "output_audio_format": "pcm16",
-                    "input_audio_format": "pcm16",
-                    "turn_detection": None,
-                    "input_audio_transcription": {"model": "whisper-1", "language": "ru"}
-                }
-            }))
+        instructions = self._system_message or prompt
+        ws = await self._sessions.acquire({
+            "instructions": instructions,
+            "voice": voice,
+            "output_audio_format": "pcm16",
+            "input_audio_format": self.input_audio_format,
+            "turn_detection": None,
+            "input_audio_transcription": {"model": "whisper-1", "language": "ru"}
+        })
+        METRICS.mark(WS_OPEN)
+        completed = False
+        try:
+            # 0) сокет переиспользуется: сбрасываем возможный хвост прошлой реплики
+            await ws.send(json.dumps({"type": "input_audio_buffer.clear"}))
 
-            # 1) отправка ВЕСЬ файл одним append
-            audio_b64 = base64.b64encode(path.read_bytes()).decode("ascii")
-            await ws.send(json.dumps({"type": "input_audio_buffer.append", "audio": audio_b64}))
+            # 1) отправка аудио: запись целиком — кусками по append_chunk_bytes, поток — append на каждый чанк
+            encoder = (G711Encoder(self.input_audio_format, in_rate=self.input_samplerate)
+                       if self.input_audio_format != PCM16 else None)
+            if isinstance(source, Path):
+                # файл читается кусками: в памяти не бывает записи целиком
+                with open(source, "rb") as f:
+                    while piece := f.read(self.append_chunk_bytes):
+                        await self._append_audio(ws, piece, encoder)
+            elif isinstance(source, (bytes, bytearray, memoryview)):
+                await self._append_audio(ws, source, encoder)
+            else:
+                async for chunk in source:
+                    await self._append_audio(ws, chunk, encoder)
             await ws.send(json.dumps({"type": "input_audio_buffer.commit"}))
+            METRICS.mark(UPLOAD_COMMITTED)
 
             # 2) запрос ответа (разрешены только ["text"] или ["audio","text"])
             await ws.send(json.dumps({
@@ -72,36 +139,244 @@ class OpenAiLLMService(LLMService):
                     "modalities": ["audio", "text"]
                 }
             }))
+            self._cancelled = False
+            self._response_ws = ws
+
+            # 3) читаем события до response.done (сокет остаётся открытым)
+            turn_items: list[str] = []
+            input_item: Optional[str] = None  # элемент записи этой реплики (input_audio_buffer.committed)
+            first_audio = True
+            cache = self.cache
+            held: Optional[list[bytes]] = [] if cache is not None else None  # дельты до транскрипта
+            answer: Optional[list[bytes]] = [] if cache is not None else None  # весь ответ для кэша
+            answer_bytes = 0
+            transcript: Optional[str] = None
+            hold_until: Optional[float] = time.monotonic() + self.cache_hold_s if cache is not None else None
+            done = False
+            while True:
+                waiting = hold_until is not None and (held is not None or (done and transcript is None))
+                try:
+                    raw = await asyncio.wait_for(
+                        ws.recv(), max(0.0, hold_until - time.monotonic()) if waiting else None)
+                except asyncio.TimeoutError:
+                    # транскрипт не успел: отдаём придержанное и дальше стримим как обычно
+                    for chunk in held or ():
+                        if first_audio:
+                            first_audio = False
+                            METRICS.mark(FIRST_AUDIO)
+                        yield chunk
+                    held = None
+                    hold_until = None
+                    if done:
+                        break
+                    continue
 
-            # 3) читаем события с логом
-            async for raw in ws:
                 evt = json.loads(raw)
                 et = evt.get("type")
-                print("EVENT:", et, {k: v for k, v in evt.items() if k not in ("audio", "delta")})
+                if log.isEnabledFor(logging.DEBUG) and _event_sampler.take(et):
+                    log.debug("EVENT: %s %s", et, {k: v for k, v in evt.items() if k not in ("audio", "delta")})
 
                 if et == "response.audio.delta":
+                    if self._cancelled:
+                        continue  # ответ отменён: догоняющие дельты не воспроизводим
                     b64 = evt.get("audio") or evt.get("delta") or evt.get("chunk")
                     if not b64:
                         continue
-                    yield base64.b64decode(b64)
-                elif et == "response.audio.done":
-                    break
-                elif et == "response.done":
-                    if evt.get("response", {}).get("status") == "cancelled":
+                    chunk = base64.b64decode(b64)
+                    if answer is not None:
+                        answer.append(chunk)
+                        answer_bytes += len(chunk)
+                        if self.cache_max_bytes is not None and answer_bytes > self.cache_max_bytes:
+                            answer = None  # длинный ответ в кэш не идёт и не держится в памяти
+                            METRICS.count("cache_skipped_long_answer")
+                    if held is not None:
+                        held.append(chunk)
                         continue
+                    if first_audio:
+                        first_audio = False
+                        METRICS.mark(FIRST_AUDIO)
+                    yield chunk
+                elif et == "input_audio_buffer.committed":
+                    input_item = evt.get("item_id")
+                elif et == "conversation.item.input_audio_transcription.completed" and cache is not None:
+                    if input_item is None or evt.get("item_id") != input_item:
+                        # транскрипт прошлой реплики на переиспользованном сокете — не ключ для этой
+                        log.debug("Чужой транскрипт (item %s, ждём %s)", evt.get("item_id"), input_item)
+                        continue
+                    transcript = evt.get("transcript") or ""
+                    if held is None:
+                        # ответ уже звучит — подменять поздно, транскрипт нужен только для cache.put
+                        if done:
+                            break
+                        continue
+                    cached = cache.get(transcript, voice, instructions)
+                    if cached is not None:
+                        print(f"[CACHE] Ответ из кэша: {transcript.strip()}")
+                        held = answer = None
+                        if not done:
+                            await self.cancel()
+                        with cached:
+                            for i in range(0, len(cached), _CACHE_CHUNK):
+                                if first_audio:
+                                    first_audio = False
+                                    METRICS.mark(FIRST_AUDIO)
+                                yield cached[i:i + _CACHE_CHUNK]
+                    else:
+                        for chunk in held or ():
+                            if first_audio:
+                                first_audio = False
+                                METRICS.mark(FIRST_AUDIO)
+                            yield chunk
+                        held = None
+                    if done:
+                        break
+                elif et == "conversation.item.created":
+                    item_id = (evt.get("item") or {}).get("id")
+                    if item_id:
+                        turn_items.append(item_id)
+                elif et == "response.done":
+                    done = True
+                    status = (evt.get("response") or {}).get("status", "completed")
+                    if status != "completed":
+                        answer = None
+                    if cache is None or transcript is not None or hold_until is None:
+                        break
+                    # ответ короткий и пришёл раньше транскрипта — ждём его до hold_until
 
                 elif et == "error":
+                    if self._cancelled:
+                        # отмена могла разминуться с завершением ответа
+                        log.debug("Ошибка после response.cancel: %s", evt)
+                        continue
                     raise RuntimeError(f"Realtime error: {evt}")
 
+            if cache is not None and transcript and answer and not self._cancelled:
+                cache.put(transcript, voice, instructions, b"".join(answer))
+
+            # 4) каждая реплика независима, как и при отдельном соединении на запрос
+            if not self.keep_history:
+                for item_id in turn_items:
+                    await ws.send(json.dumps({"type": "conversation.item.delete", "item_id": item_id}))
+            completed = True
+        finally:
+            self._response_ws = None
+            if completed:
+                self._sessions.release()
+            else:
+                await self._sessions.discard()
+
+    async def cancel(self) -> None:
+        """Отправить response.cancel; остаток ответа дочитывается до response.done и отбрасывается."""
+        ws = self._response_ws
+        if ws is None or self._cancelled:
+            return
+        self._cancelled = True
+        METRICS.count("responses_cancelled")
+        await ws.send(json.dumps({"type": "response.cancel"}))
+
+    async def _append_audio(self, ws, pcm, encoder: Optional[G711Encoder] = None) -> None:
+        # base64 считается по кускам memoryview: вся запись в base64 целиком не собирается
+        view = memoryview(pcm).cast("B")
+        step = self.append_chunk_bytes
+        for i in range(0, len(view), step):
+            piece = view[i:i + step]
+            if encoder is not None:
+                piece = encoder.encode(piece)
+                if not len(piece):
+                    continue
+            # алфавит base64 не требует экранирования — кадр собирается без json.dumps (одна копия меньше)
+            audio_b64 = base64.b64encode(piece).decode("ascii")
+            await ws.send(_APPEND_PREFIX + audio_b64 + _APPEND_SUFFIX)
+
+    def _get_client(self):
+        if self._client is None:
+            from openai import OpenAI
+
+            self._client = OpenAI(api_key=self._api_key)
+        return self._client
+
+    def _get_async_client(self):
+        if self._async_client is None:
+            from openai import AsyncOpenAI
+
+            self._async_client = AsyncOpenAI(api_key=self._api_key)
+        return self._async_client
+
+    def _instructions(self, instructions: Optional[str]) -> str:
+        return instructions or self._system_message or "Отвечай кратко и по делу."
+
     def text(self, prompt: str) -> str:
         """Текст → текст (через Responses API)."""
+        if self.http_text:
+            return self._text_http(prompt)
+
+        from openai import APIConnectionError, APIStatusError, RateLimitError
+
         try:
-            resp = self._client.responses.create(
-                model="gpt-4o-mini",  # используйте обычную текстовую модель
+            resp = self._get_client().responses.create(
+                model=self.text_model,  # обычная текстовая модель, не realtime
                 input=prompt,
-                instructions=self._system_message or "Отвечай кратко и по делу.",
+                instructions=self._instructions(None),
                 temperature=0.2,
             )
             return resp.output_text.strip()
         except (APIConnectionError, APIStatusError, RateLimitError) as e:
             raise RuntimeError(f"OpenAI API error (send_text): {e}") from e
+
+    def _text_http(self, prompt: str, timeout: float = 30.0) -> str:
+        """Тот же запрос к /v1/responses через urllib: для одного вызова SDK не нужен."""
+        import urllib.error
+        import urllib.request
+
+        body = json.dumps({"model": self.text_model, "input": prompt,
+                           "instructions": self._instructions(None), "temperature": 0.2}).encode("utf-8")
+        request = urllib.request.Request(f"{_API_URL}/responses", data=body, method="POST", headers={
+            "Authorization": f"Bearer {self._api_key}",
+            "Content-Type": "application/json",
+        })
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as resp:
+                data = json.load(resp)
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            raise RuntimeError(f"OpenAI API error (send_text): {e}") from e
+        # output_text SDK собирает так же: все output_text всех сообщений ответа
+        parts = [c.get("text", "") for item in data.get("output") or () if item.get("type") == "message"
+                 for c in item.get("content") or () if c.get("type") == "output_text"]
+        return "".join(parts).strip()
+
+    async def text_stream(self, prompt: str, *, instructions: Optional[str] = None) -> AsyncIterator[str]:
+        """Текст → текст потоком (Responses API, stream=True) через общий пул соединений."""
+        from openai import APIConnectionError, APIStatusError, RateLimitError
+
+        started = time.monotonic()
+        first = True
+        try:
+            stream = await self._get_async_client().responses.create(
+                model=self.text_model,
+                input=prompt,
+                instructions=self._instructions(instructions),
+                temperature=0.2,
+                stream=True,
+            )
+            try:
+                async for event in stream:
+                    if event.type == "response.output_text.delta":
+                        if first:
+                            first = False
+                            METRICS.observe("llm_text_first_token_ms", (time.monotonic() - started) * 1000.0)
+                        yield event.delta
+                    elif event.type in ("response.failed", "error"):
+                        raise RuntimeError(f"OpenAI API error (text_stream): {event}")
+            finally:
+                # потребитель мог выйти раньше — соединение возвращается в пул
+                await stream.close()
+        except (APIConnectionError, APIStatusError, RateLimitError) as e:
+            raise RuntimeError(f"OpenAI API error (text_stream): {e}") from e
+        METRICS.observe("llm_text_total_ms", (time.monotonic() - started) * 1000.0)
+
+    async def close(self) -> None:
+        """Закрыть Realtime-соединение и пул текстового клиента."""
+        await self._sessions.close()
+        if self._async_client is not None:
+            client, self._async_client = self._async_client, None
+            await client.close()
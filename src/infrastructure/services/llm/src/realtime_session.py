@@ -0,0 +1,164 @@
+import asyncio
+import json
+import ssl
+import time
+from typing import Optional
+
+REALTIME_URL = "wss://api.openai.com/v1/realtime?model={model}"
+
+
+class RealtimeSessionManager:
+    """
+    Держит одно авторизованное Realtime-соединение «тёплым» между репликами.
+
+    Особенности:
+      - TLS-контекст (с certifi) создаётся один раз.
+      - warm() / warm_threadsafe() открывают сокет заранее (например, сразу по is_start),
+        чтобы TLS-рукопожатие и session.update шли параллельно с речью пользователя.
+      - acquire() возвращает открытый сокет; мёртвое соединение прозрачно переоткрывается.
+      - session.update отправляется только при изменении настроек сессии.
+      - keepalive: ping на уровне websockets + фоновая задача, переоткрывающая
+        закрытое или слишком старое соединение, пока сокет простаивает.
+      - url можно подменить локальной заглушкой (ws://127.0.0.1:...), тогда TLS не используется.
+      - websockets и certifi импортируются при первом подключении, а не при старте приложения.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        api_key: str,
+        url: Optional[str] = None,
+        ping_interval: float = 20.0,
+        ping_timeout: float = 20.0,
+        keepalive_interval: float = 5.0,
+        max_session_age: float = 25 * 60.0,
+    ):
+        self._url = url or REALTIME_URL.format(model=model)
+        self._headers = [
+            ("Authorization", f"Bearer {api_key}"),
+            ("OpenAI-Beta", "realtime=v1"),
+        ]
+        self.ping_interval = float(ping_interval)
+        self.ping_timeout = float(ping_timeout)
+        self.keepalive_interval = float(keepalive_interval)
+        self.max_session_age = float(max_session_age)
+
+        self._ssl_ctx: Optional[ssl.SSLContext] = None
+        self._ws = None
+        self._connected_at = 0.0
+        self._session: Optional[dict] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._busy = False
+        self._keepalive_task: Optional[asyncio.Task] = None
+
+        self.connects = 0
+
+    # ---------------------- API ----------------------
+
+    async def warm(self) -> None:
+        """Открыть соединение заранее (если оно ещё не открыто)."""
+        async with self._get_lock():
+            await self._ensure_open()
+
+    def warm_threadsafe(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Спекулятивный прогрев из чужого потока (например, из потока распознавания)."""
+        asyncio.run_coroutine_threadsafe(self.warm(), loop)
+
+    async def acquire(self, session: dict):
+        """Вернуть открытый сокет с применёнными настройками сессии."""
+        async with self._get_lock():
+            ws = await self._ensure_open()
+            if session != self._session:
+                await ws.send(json.dumps({"type": "session.update", "session": session}))
+                self._session = session
+            self._busy = True
+            return ws
+
+    def release(self) -> None:
+        """Реплика завершена штатно — сокет можно переиспользовать."""
+        self._busy = False
+
+    async def discard(self) -> None:
+        """Реплика прервана — состояние сокета неизвестно, закрываем его."""
+        self._busy = False
+        await self._close_ws()
+
+    async def close(self) -> None:
+        if self._keepalive_task:
+            self._keepalive_task.cancel()
+            self._keepalive_task = None
+        await self._close_ws()
+
+    # ---------------------- внутренняя логика ----------------------
+
+    def _get_lock(self) -> asyncio.Lock:
+        # Lock создаётся лениво, внутри работающего loop
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    def _is_open(self) -> bool:
+        if self._ws is None:
+            return False
+        from websockets.protocol import State
+
+        return self._ws.state is State.OPEN
+
+    async def _ensure_open(self):
+        if self._is_open():
+            return self._ws
+        await self._close_ws()
+
+        import websockets
+
+        ssl_ctx = None
+        if self._url.startswith("wss://"):
+            if self._ssl_ctx is None:
+                import certifi
+
+                self._ssl_ctx = ssl.create_default_context()
+                self._ssl_ctx.load_verify_locations(cafile=certifi.where())
+            ssl_ctx = self._ssl_ctx
+
+        self._ws = await websockets.connect(
+            self._url,
+            additional_headers=self._headers,
+            max_size=None,
+            ssl=ssl_ctx,
+            ping_interval=self.ping_interval,
+            ping_timeout=self.ping_timeout,
+        )
+        self._connected_at = time.monotonic()
+        self._session = None
+        self.connects += 1
+
+        if self._keepalive_task is None or self._keepalive_task.done():
+            self._keepalive_task = asyncio.create_task(self._keepalive())
+        return self._ws
+
+    async def _close_ws(self) -> None:
+        ws, self._ws = self._ws, None
+        self._session = None
+        if ws is not None:
+            try:
+                await ws.close()
+            except Exception:
+                pass
+
+    async def _keepalive(self) -> None:
+        while True:
+            await asyncio.sleep(self.keepalive_interval)
+            if self._busy:
+                continue
+            too_old = time.monotonic() - self._connected_at >= self.max_session_age
+            if self._is_open() and not too_old:
+                continue
+            async with self._get_lock():
+                if self._busy:
+                    continue
+                try:
+                    if too_old:
+                        await self._close_ws()
+                    await self._ensure_open()
+                except Exception as e:
+                    print(f"[REALTIME] Переподключение не удалось: {e}")
@@ -0,0 +1,75 @@
+import shutil
+import subprocess
+import tempfile
+import wave
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from infrastructure.services.audio_bus.resample import PolyphaseResampler
+
+
+class ITts(ABC):
+    """Локальный синтез речи: текст → PCM16 моно на частоте samplerate."""
+
+    samplerate: int
+
+    @abstractmethod
+    def available(self) -> bool:
+        """Синтезатор установлен и может работать."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def render(self, text: str) -> bytes:
+        """Озвучить текст целиком (блокирующий вызов)."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def fingerprint(self) -> str:
+        """Строка настроек голоса: поменялась — готовые клипы нужно перерендерить."""
+        raise NotImplementedError
+
+
+class EspeakTts(ITts):
+    """
+    espeak / espeak-ng (ставится по README: apt install espeak).
+    WAV пишется во временный файл (у --stdout заголовок без длины), затем
+    пересчитывается на частоту вывода PolyphaseResampler-ом.
+    """
+
+    def __init__(self, voice: str = "ru", speed_wpm: int = 160, pitch: int = 50,
+                 samplerate: int = 24000, binary: Optional[str] = None):
+        self.voice = voice
+        self.speed_wpm = int(speed_wpm)
+        self.pitch = int(pitch)
+        self.samplerate = int(samplerate)
+        self.binary = binary or shutil.which("espeak-ng") or shutil.which("espeak")
+
+    def available(self) -> bool:
+        return self.binary is not None
+
+    def fingerprint(self) -> str:
+        name = Path(self.binary).name if self.binary else "espeak"
+        return f"{name}:{self.voice}:{self.speed_wpm}:{self.pitch}:{self.samplerate}"
+
+    def render(self, text: str) -> bytes:
+        if self.binary is None:
+            raise RuntimeError("espeak не установлен (sudo apt install espeak)")
+        with tempfile.TemporaryDirectory(prefix="appi-tts-") as tmp:
+            path = Path(tmp) / "clip.wav"
+            subprocess.run(
+                [self.binary, "-v", self.voice, "-s", str(self.speed_wpm), "-p", str(self.pitch),
+                 "-w", str(path), text],
+                check=True, capture_output=True, timeout=30,
+            )
+            with wave.open(str(path), "rb") as w:
+                if w.getsampwidth() != 2 or w.getnchannels() != 1:
+                    raise RuntimeError(f"espeak: ожидался WAV PCM16 моно, получено "
+                                       f"{w.getsampwidth()} байт × {w.getnchannels()} к.")
+                rate = w.getframerate()
+                pcm = np.frombuffer(w.readframes(w.getnframes()), dtype=np.int16)
+        if rate != self.samplerate:
+            pcm = PolyphaseResampler(rate, self.samplerate, max_block=max(1, pcm.size)).process(pcm)
+        return pcm.tobytes()
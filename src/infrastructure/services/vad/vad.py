@@ -0,0 +1,169 @@
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+
+import numpy as np
+
+
+@dataclass
+class VadResult:
+    speech: bool          # в блоке есть речь
+    probability: float    # сглаженная вероятность речи на конец блока
+    end_of_speech: bool   # фраза закончилась — запись можно останавливать
+
+
+class IVad(ABC):
+    """Детектор речи для VoiceRecording: блок PCM16 на вход, решение на выход."""
+
+    @abstractmethod
+    def process(self, block) -> VadResult:
+        """Обработать очередной блок PCM16 (bytes / memoryview)."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def reset(self) -> None:
+        """Начать новую фразу (адаптивное состояние, например шумовой фон, сохраняется)."""
+        raise NotImplementedError
+
+
+class RmsVad(IVad):
+    """
+    Прежняя логика VoiceRecording: RMS блока с гистерезисом порогов
+    и фиксированным таймером тишины (время считается по длительности звука).
+    """
+
+    def __init__(self, samplerate: int, voice_on_rms: float = 350.0, voice_off_rms: float = 250.0,
+                 silence_duration: float = 1.0):
+        self.samplerate = int(samplerate)
+        self.voice_on_rms = float(voice_on_rms)
+        self.voice_off_rms = float(voice_off_rms)
+        self.silence_duration = float(silence_duration)
+        self._silence_s = 0.0
+
+    def reset(self) -> None:
+        self._silence_s = 0.0
+
+    def process(self, block) -> VadResult:
+        a = np.frombuffer(block, dtype=np.int16)
+        rms = float(np.sqrt(np.mean(a.astype(np.float32) ** 2))) if a.size else 0.0
+        if rms >= self.voice_on_rms:
+            self._silence_s = 0.0
+            return VadResult(True, 1.0, False)
+        if rms <= self.voice_off_rms:
+            self._silence_s += a.size / self.samplerate
+        else:
+            self._silence_s = 0.0
+        return VadResult(False, 0.0, self._silence_s >= self.silence_duration)
+
+
+class FrameVad(IVad):
+    """
+    Покадровый VAD (кадры 10–30 мс), все признаки блока считаются пакетно в NumPy:
+      - энергия кадра (дБ) относительно шумового фона;
+      - zero-crossing rate (шипение/ветер дают высокий ZCR);
+      - спектральная «плоскость» (шум — плоский спектр, речь — гармоники и форманты).
+
+    Шумовой фон адаптируется непрерывно: быстро опускается к самым тихим кадрам
+    и медленно поднимается (noise_rise_db_s), так что постоянный шум со временем
+    перестаёт считаться речью.
+
+    Признаки сводятся в вероятность речи (логистическая функция), вероятность
+    сглаживается. Конец фразы — когда накопленная «уверенность в тишине»
+    (сумма (1 − p) по кадрам) достигает end_silence_s. До первой речи ждём дольше
+    (leading_silence_s): пользователь может сделать паузу после ключевого слова.
+    """
+
+    def __init__(
+        self,
+        samplerate: int,
+        frame_ms: float = 20.0,
+        end_silence_s: float = 0.6,
+        leading_silence_s: float = 3.0,
+        speech_on: float = 0.6,
+        speech_off: float = 0.35,
+        smoothing: float = 0.35,
+        snr_mid_db: float = 9.0,
+        noise_rise_db_s: float = 3.0,
+        initial_noise_db: float = 40.0,
+    ):
+        if not 10.0 <= frame_ms <= 30.0:
+            raise ValueError("frame_ms должен быть в диапазоне 10–30 мс")
+        self.samplerate = int(samplerate)
+        self.frame_len = int(self.samplerate * frame_ms / 1000)
+        self.frame_s = self.frame_len / self.samplerate
+        self.end_silence_s = float(end_silence_s)
+        self.leading_silence_s = float(leading_silence_s)
+        self.speech_on = float(speech_on)
+        self.speech_off = float(speech_off)
+        self.smoothing = float(smoothing)
+        self.snr_mid_db = float(snr_mid_db)
+        self.noise_rise_db = float(noise_rise_db_s) * self.frame_s  # за кадр
+
+        self._window = np.hanning(self.frame_len).astype(np.float32)
+        self._tail = np.zeros(self.frame_len, dtype=np.float32)  # недобранный кадр с прошлого блока
+        self._tail_len = 0
+
+        self.noise_db = float(initial_noise_db)
+        self.probability = 0.0
+        self.reset()
+
+    def reset(self) -> None:
+        self._in_speech = False
+        self._speech_seen = False
+        self._silence_evidence = 0.0
+
+    def features(self, frames: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(энергия дБ, ZCR, спектральная плоскость) для матрицы кадров [n, frame_len]."""
+        energy_db = 10.0 * np.log10(np.mean(frames * frames, axis=1) + 1.0)
+        signs = np.signbit(frames)
+        zcr = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+        power = np.abs(np.fft.rfft(frames * self._window, axis=1)) ** 2 + 1e-3
+        flatness = np.exp(np.mean(np.log(power), axis=1)) / np.mean(power, axis=1)
+        return energy_db, zcr, flatness
+
+    def process(self, block) -> VadResult:
+        samples = np.frombuffer(block, dtype=np.int16).astype(np.float32)
+        if self._tail_len:
+            samples = np.concatenate((self._tail[:self._tail_len], samples))
+        n = samples.size // self.frame_len
+        rest = samples.size - n * self.frame_len
+        self._tail[:rest] = samples[n * self.frame_len:]
+        self._tail_len = rest
+        if n == 0:
+            return VadResult(self._in_speech, self.probability, False)
+
+        energy_db, zcr, flatness = self.features(samples[:n * self.frame_len].reshape(n, self.frame_len))
+
+        # шумовой фон: по кадрам (рекуррентно), но только скаляры — кадров в блоке единицы
+        noise = np.empty(n, dtype=np.float32)
+        floor = self.noise_db
+        for i in range(n):
+            floor = min(floor + self.noise_rise_db, float(energy_db[i]))
+            noise[i] = floor
+        self.noise_db = floor
+
+        snr = energy_db - noise
+        score = (0.45 * (snr - self.snr_mid_db)
+                 + 6.0 * (0.35 - flatness)
+                 - 8.0 * np.maximum(zcr - 0.3, 0.0))
+        frame_p = 1.0 / (1.0 + np.exp(-score))
+
+        speech_in_block = False
+        ended = False
+        p = self.probability
+        for fp in frame_p:
+            p += self.smoothing * (float(fp) - p)
+            if p >= self.speech_on:
+                self._in_speech = True
+                self._speech_seen = True
+                self._silence_evidence = 0.0
+            elif p <= self.speech_off:
+                self._in_speech = False
+            if self._in_speech:
+                speech_in_block = True
+            else:
+                self._silence_evidence += (1.0 - p) * self.frame_s
+            limit = self.end_silence_s if self._speech_seen else self.leading_silence_s
+            if self._silence_evidence >= limit:
+                ended = True
+        self.probability = p
+        return VadResult(speech_in_block, p, ended)
@@ -0,0 +1,234 @@
+import asyncio
+import math
+import sys
+from typing import Optional
+
+import numpy as np
+import sounddevice as sd
+
+from infrastructure.utils.metrics import METRICS
+
+
+class PlaybackEngine:
+    """
+    Неблокирующее воспроизведение PCM16 для asyncio.
+
+    Особенности:
+      - Поток вывода работает через колбэк PortAudio и забирает звук из кольцевого буфера
+        (один писатель — asyncio, один читатель — колбэк; каждый двигает только свой курсор,
+        поэтому блокировок на горячем пути нет).
+      - feed() только копирует чанк в кольцо и сразу возвращает управление: приём
+        websocket-кадров и воспроизведение идут параллельно. Если кольцо заполнено,
+        feed() ждёт через asyncio.sleep, не блокируя цикл событий.
+      - Джиттер-буфер: воспроизведение начинается (и возобновляется после опустошения),
+        когда накоплено prebuffer_ms звука или пришёл конец ответа.
+      - Опустошение буфера посреди ответа считается в underruns
+        (и в счётчике METRICS «playback_underruns»).
+      - Поток вывода открывается один раз и живёт между репликами.
+      - Уровень каждого выведенного блока запоминается (output_db) — по нему
+        EchoGate отличает эхо ответа в микрофоне от речи пользователя.
+    """
+
+    def __init__(
+        self,
+        samplerate: int = 24000,
+        channels: int = 1,
+        device_index: Optional[int] = None,
+        block_ms: float = 20.0,
+        prebuffer_ms: float = 120.0,
+        capacity_s: float = 30.0,
+    ):
+        self.samplerate = int(samplerate)
+        self.channels = int(channels)
+        self.device_index = device_index
+        self.blocksize = max(1, int(self.samplerate * block_ms / 1000))
+        self.prebuffer_frames = int(self.samplerate * prebuffer_ms / 1000)
+
+        self.capacity = int(self.samplerate * capacity_s) * self.channels  # в сэмплах
+        self._ring = np.zeros(self.capacity, dtype=np.int16)
+        self._write = 0  # сэмплов записано (двигает только feed)
+        self._read = 0   # сэмплов прочитано (двигает только колбэк)
+
+        self._playing = False   # False — набираем джиттер-буфер
+        self._eos = False       # весь ответ уже в кольце
+        self._flush_req = False
+        self.underruns = 0
+
+        # уровни последних выведенных блоков, дБ (≈1 с истории)
+        self._levels = np.zeros(max(1, int(1000 / block_ms)), dtype=np.float32)
+        self._level_idx = 0
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # одно событие на все ответы: begin() его сбрасывает, а не заменяет — play(), ещё ждущий
+        # прошлый ответ, проснётся вместе с новым, а не повиснет на забытом событии
+        self._drained = asyncio.Event()
+        self._stream: Optional[sd.RawOutputStream] = None
+
+    # ---------------------- API ----------------------
+
+    def start(self) -> None:
+        if self._stream is not None:
+            return
+        self._stream = sd.RawOutputStream(
+            samplerate=self.samplerate,
+            blocksize=self.blocksize,
+            dtype="int16",
+            channels=self.channels,
+            device=self.device_index,
+            latency="low",
+            callback=self._cb,
+        )
+        self._stream.start()
+
+    def stop(self) -> None:
+        stream, self._stream = self._stream, None
+        if stream is not None:
+            stream.stop()
+            stream.close()
+
+    def begin(self) -> None:
+        """Начать новый ответ (вызывать из asyncio-потока)."""
+        self.start()
+        self._loop = asyncio.get_running_loop()
+        self._drained.clear()
+        self._eos = False
+
+    async def feed(self, chunk) -> None:
+        """Положить чанк PCM16 в буфер воспроизведения."""
+        data = np.frombuffer(chunk, dtype=np.int16)
+        cap = self.capacity
+        while data.size:
+            free = cap - (self._write - self._read)
+            if free <= 0:
+                await asyncio.sleep(self.blocksize / self.samplerate)
+                continue
+            n = min(free, data.size)
+            start = self._write % cap
+            first = min(n, cap - start)
+            self._ring[start:start + first] = data[:first]
+            if first < n:
+                self._ring[:n - first] = data[first:n]
+            self._write += n
+            data = data[n:]
+        METRICS.gauge("playback_buffer_ms", round(self.buffered_ms(), 1))
+
+    async def drain(self) -> None:
+        """Ответ закончился: доиграть всё, что осталось в буфере."""
+        self._eos = True
+        if self._write != self._read:
+            await self._drained.wait()
+
+    async def play(self, pcm) -> None:
+        """Проиграть готовый звук целиком (локальные фразы): он уже весь в памяти — старт в ближайшем блоке."""
+        while self._flush_req:
+            # сброс прошлого ответа ещё не применён колбэком — иначе он заберёт и этот звук
+            await asyncio.sleep(self.blocksize / self.samplerate)
+        self.begin()
+        await self.feed(pcm)
+        await self.drain()
+
+    def flush(self) -> None:
+        """Сбросить недоигранный звук (потокобезопасно; применяется в ближайшем колбэке)."""
+        self._flush_req = True
+        self._eos = True
+
+    def buffered_ms(self) -> float:
+        return (self._write - self._read) / self.channels / self.samplerate * 1000.0
+
+    @property
+    def active(self) -> bool:
+        """Идёт ответ: звучит или ждёт в буфере."""
+        return self._playing or self._write != self._read
+
+    def output_db(self, window_ms: float = 300.0) -> float:
+        """Максимальный уровень вывода за последние window_ms (шкала как у FrameVad)."""
+        n = min(self._levels.size, max(1, int(window_ms * self.samplerate / 1000 / self.blocksize)))
+        idx = (self._level_idx - 1 - np.arange(n)) % self._levels.size
+        return float(self._levels[idx].max())
+
+    # ---------------------- колбэк PortAudio ----------------------
+
+    def _cb(self, outdata, frames, time_info, status):
+        if status:
+            METRICS.count("audio_output_status")
+            print(f"[PlaybackStatus] {status}", file=sys.stderr)
+        out = np.frombuffer(outdata, dtype=np.int16)
+        if self._flush_req:
+            self._flush_req = False
+            self._read = self._write
+            self._playing = False
+
+        avail = self._write - self._read
+        if not self._playing:
+            if avail and (avail >= self.prebuffer_frames * self.channels or self._eos):
+                self._playing = True
+            else:
+                out[:] = 0
+                self._store_level(out[:0])
+                if self._eos and not avail:
+                    self._signal_drained()
+                return
+
+        n = min(avail, out.size)
+        cap = self.capacity
+        start = self._read % cap
+        first = min(n, cap - start)
+        out[:first] = self._ring[start:start + first]
+        if first < n:
+            out[first:n] = self._ring[:n - first]
+        out[n:] = 0
+        self._read += n
+        self._store_level(out[:n])
+
+        if n < out.size or (self._eos and self._read == self._write):
+            self._playing = False
+            if self._eos:
+                self._signal_drained()
+            else:
+                # сеть не успела — снова набираем джиттер-буфер
+                self.underruns += 1
+                METRICS.count("playback_underruns")
+
+    def _store_level(self, block: np.ndarray) -> None:
+        f = block.astype(np.float32)
+        level = 10.0 * math.log10(float(np.dot(f, f)) / max(1, f.size) + 1.0)
+        self._levels[self._level_idx % self._levels.size] = level
+        self._level_idx += 1
+
+    def _signal_drained(self) -> None:
+        loop, event = self._loop, self._drained
+        if loop is not None and not event.is_set():
+            loop.call_soon_threadsafe(event.set)
+
+
+class EchoGate:
+    """
+    Гейт эха для распознавания во время ответа (barge-in).
+
+    Блок микрофона пропускается, только если он громче ожидаемого эха:
+    mic_db > output_db + coupling_db + margin_db. coupling_db — оценка затухания
+    «динамик → микрофон»: быстро опускается к наблюдаемой разнице уровней и медленно
+    поднимается (rise_db_s), как шумовой фон во FrameVad. Пока ответ не звучит,
+    пропускается всё. Непропущенный блок распознаватель заменяет тишиной.
+    """
+
+    def __init__(self, engine: PlaybackEngine, margin_db: float = 6.0, hold_ms: float = 300.0,
+                 rise_db_s: float = 3.0, silence_db: float = 30.0):
+        self.engine = engine
+        self.margin_db = float(margin_db)
+        self.hold_ms = float(hold_ms)
+        self.rise_db_s = float(rise_db_s)
+        self.silence_db = float(silence_db)
+        self.coupling_db = 0.0
+
+    def __call__(self, block, samplerate: int) -> bool:
+        a = np.frombuffer(block, dtype=np.int16).astype(np.float32)
+        if not a.size:
+            return False
+        mic_db = 10.0 * math.log10(float(np.dot(a, a)) / a.size + 1.0)
+        out_db = self.engine.output_db(self.hold_ms)
+        if out_db < self.silence_db:
+            return True
+        diff = mic_db - out_db
+        self.coupling_db = min(self.coupling_db + self.rise_db_s * a.size / samplerate, diff)
+        return diff > self.coupling_db + self.margin_db
@@ -0,0 +1,23 @@
+import json
+from typing import Iterable, Optional
+
+# Без sounddevice и vosk: модуль нужен и шлюзу на сервере, где PortAudio может не быть
+UNK = "[unk]"
+
+
+def grammar_words(phrases: Iterable[str]) -> list[str]:
+    """Фразы грамматики: нижний регистр, один пробел между словами, без пустых и повторов."""
+    words = {" ".join(p.lower().split()) for p in phrases}
+    words.discard("")
+    return sorted(words)
+
+
+def grammar_json(words: list[str]) -> str:
+    """Грамматика для KaldiRecognizer: фразы + [unk] (всё остальное)."""
+    return json.dumps(words + [UNK], ensure_ascii=False)
+
+
+def clean_text(raw: Optional[str]) -> str:
+    """Текст результата Vosk без [unk], в нижнем регистре."""
+    words = (raw or "").strip().lower().split()
+    return " ".join(w for w in words if w != UNK)
@@ -0,0 +1,440 @@
+import json
+import math
+import multiprocessing as mp
+from multiprocessing.connection import wait as wait_connections
+import queue
+import signal
+import sys
+import threading
+import time
+from typing import Callable, Iterable, Optional, Sequence
+
+import numpy as np
+
+from infrastructure.services.audio_bus.audio_bus import AudioCaptureBus
+from infrastructure.services.voice_recognition.grammar import clean_text, grammar_json, grammar_words
+from infrastructure.services.voice_recognition.voice_recognition import MODE_FULL, MODE_KEYWORDS
+from infrastructure.utils.metrics import METRICS
+from infrastructure.utils.startup import mark_startup
+
+# Политики выбора источника, когда фразу услышали несколько микрофонов
+POLICY_LOUDEST = "loudest"
+POLICY_FIRST = "first"
+
+# Управляющие сообщения воркеру (звук идёт отдельным каналом)
+_RESET = ("reset",)
+
+
+class MultiSourceRecognizer:
+    """
+    Несколько микрофонов (по одной AudioCaptureBus на устройство), у каждого —
+    свой декодер Vosk в отдельном процессе.
+
+    Особенности:
+      - Модель загружается один раз в родительском процессе, воркеры создаются через fork
+        и используют её только на чтение: страницы модели остаются общими (copy-on-write),
+        память не умножается на число микрофонов.
+      - Декодирование не делит GIL с основным процессом: в нём остаются только захват
+        (колбэки шин), ресемплинг до samplerate и пересылка блоков воркерам по Pipe.
+      - Результаты всех воркеров приходят в одну mp.Queue; поток-диспетчер объединяет
+        одну и ту же фразу с разных микрофонов и вызывает on_command(text) один раз.
+      - Арбитраж: policy="loudest" — ждём arbitration_ms и выбираем источник с наибольшим
+        уровнем речи; policy="first" — побеждает первый. Победитель — active_bus:
+        с этой шины и нужно записывать вопрос.
+      - Интерфейс как у VoiceStreamRecognizer: start(on_command), pause(flag),
+        wait_ready(), set_mode(...), barge_in(...), stats().
+      - В barge-in стоп-слова слушает только active_bus: пользователь говорит в тот же
+        микрофон, а гейт эха адаптируется к связи динамик → один микрофон.
+
+    fork при работающих потоках небезопасен (чужие блокировки копируются захваченными),
+    поэтому модель грузится и воркеры создаются прямо в __init__ — синхронно, до любых потоков:
+    объект нужно создавать до экспортёра метрик, RSS-монитора и шин. start() только запускает
+    захват, пересылку и диспетчер.
+
+    Режим, словарь, гейт и срок follow-up меняются из loop, колбэка воспроизведения (barge_in)
+    и потока-диспетчера — только под self._lock, и грамматика уходит воркерам под ним же:
+    возврат режима по сроку не перезапишет стоп-слова barge-in.
+    """
+
+    def __init__(
+        self,
+        model_path: str,
+        buses: Sequence[AudioCaptureBus],
+        samplerate: int = 16000,
+        block_ms: float = 40.0,
+        mode: str = MODE_FULL,
+        keywords: Iterable[str] = (),
+        wake_on_partial: bool = False,
+        partial_filter: Optional[Callable[[str], bool]] = None,
+        policy: str = POLICY_LOUDEST,
+        arbitration_ms: float = 150.0,
+        dedupe_s: float = 1.5,
+        registry=None,
+    ):
+        if not buses:
+            raise ValueError("Нужен хотя бы один источник звука")
+        if policy not in (POLICY_LOUDEST, POLICY_FIRST):
+            raise ValueError(f"Неизвестная политика арбитража: {policy}")
+        self.model_path = str(model_path)
+        self.buses = list(buses)
+        self.samplerate = int(samplerate)
+        self.blocksize = max(1, int(self.samplerate * block_ms / 1000))
+        self._lock = threading.Lock()  # mode, _base_mode, _mode_deadline, _keywords, _gate
+        self.mode = mode
+        self._base_mode = mode
+        self._mode_deadline: Optional[float] = None
+        self._registry = registry  # как у VoiceStreamRecognizer: версия сверяется в диспетчере
+        self._registry_version: Optional[int] = None
+        if registry is not None:
+            self._registry_version = registry.version
+            keywords = registry.phrases()
+        self._keywords = grammar_words(keywords)
+        self.wake_on_partial = wake_on_partial
+        self._partial_filter = partial_filter
+        self.policy = policy
+        self.arbitration_s = arbitration_ms / 1000.0
+        self.dedupe_s = float(dedupe_s)
+
+        self.active_bus: AudioCaptureBus = self.buses[0]
+        self.active_source = 0
+
+        self._ctx = mp.get_context("fork")
+        self._results = self._ctx.Queue()
+        self._audio: list = []    # родитель → воркер: PCM16 (send_bytes)
+        self._control: list = []  # родитель → воркер: сброс / смена грамматики
+        self._procs: list = []
+        self._control_lock = threading.Lock()
+        # уровни последних блоков по источникам, дБ (≈1 с истории)
+        self._levels = np.zeros((len(self.buses), max(1, int(1000 / block_ms))), dtype=np.float32)
+        self._level_idx = [0] * len(self.buses)
+        self._stats = [[0.0, 0.0] for _ in self.buses]  # [audio_s, cpu_s] от воркеров
+
+        self._gate: Optional[Callable[[bytes, int], bool]] = None
+        self._running = threading.Event()
+        self._paused = threading.Event()
+        self._ready = threading.Event()
+        self._error: Optional[BaseException] = None
+        self._on_command = None
+        self._fork_workers()
+
+    # ---------------------- API ----------------------
+
+    def start(self, on_command) -> None:
+        if self._running.is_set():
+            return
+        self._on_command = on_command
+        self._running.set()
+        if self._error is not None:
+            return
+        for i, bus in enumerate(self.buses):
+            bus.start()
+            threading.Thread(target=self._feed, args=(i,), name=f"multi-source-feed-{i}", daemon=True).start()
+        threading.Thread(target=self._dispatch, name="multi-source-dispatch", daemon=True).start()
+        mark_startup("listening")
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def pause(self, flag: bool = True) -> None:
+        if flag:
+            self._paused.set()
+            self._broadcast(_RESET)
+            print("⏸️ Распознавание приостановлено")
+        else:
+            self._broadcast(_RESET)
+            self._paused.clear()
+            print("▶️ Распознавание возобновлено")
+
+    def set_mode(self, mode: str, timeout: Optional[float] = None) -> None:
+        """Как VoiceStreamRecognizer.set_mode: грамматика меняется во всех воркерах; возврат — в диспетчере."""
+        if mode not in (MODE_FULL, MODE_KEYWORDS):
+            raise ValueError(f"Неизвестный режим распознавания: {mode}")
+        with self._lock:
+            if timeout is None:
+                self._base_mode = mode
+                self._mode_deadline = None
+            else:
+                self._mode_deadline = time.monotonic() + timeout
+            changed = self._switch_mode(mode)
+        if changed:
+            print(f"🔁 Режим распознавания: {mode}")
+
+    def set_keywords(self, keywords: Iterable[str]) -> None:
+        """Как VoiceStreamRecognizer.set_keywords: новая грамматика уходит во все воркеры."""
+        words = grammar_words(keywords)
+        with self._lock:
+            self._keywords = words
+            if self.mode == MODE_KEYWORDS and self._gate is None:  # в barge-in применится после
+                self._broadcast(("grammar", self._grammar(), False))
+
+    def barge_in(self, enable: bool, keywords: Iterable[str] = (),
+                 gate: Optional[Callable[[bytes, int], bool]] = None) -> None:
+        """Как VoiceStreamRecognizer.barge_in: только стоп-слова, гейт эха — на стороне захвата."""
+        if enable:
+            words = grammar_words(keywords)
+            with self._lock:
+                self._gate = gate
+                self._mode_deadline = None
+                self._broadcast(("grammar", words, True))
+            self.pause(False)
+        else:
+            with self._lock:
+                self._gate = None
+                self._broadcast(("grammar", self._grammar(), False))
+            self.pause(True)
+
+    def position_after(self, char_end: int) -> Optional[int]:
+        """
+        Как VoiceStreamRecognizer.position_after, но таймстемпы слов из воркеров не
+        передаются: всегда None, запись начинается с pre-roll активной шины.
+        """
+        return None
+
+    def stats(self) -> dict:
+        """CPU-время и real-time factor по каждому источнику."""
+        return {
+            f"source_{i}": {"audio_s": round(a, 3), "cpu_s": round(c, 3), "rtf": round(c / a, 4) if a else None}
+            for i, (a, c) in enumerate(self._stats)
+        }
+
+    def stop(self) -> None:
+        self._running.clear()
+        for conn in self._audio + self._control:
+            try:
+                conn.close()
+            except OSError:
+                pass
+        for proc in self._procs:
+            proc.join(timeout=2)
+            if proc.is_alive():
+                proc.terminate()
+        for bus in self.buses:
+            bus.stop()
+
+    # ---------------------- запуск ----------------------
+
+    def _fork_workers(self) -> None:
+        if threading.active_count() > 1:
+            names = ", ".join(t.name for t in threading.enumerate() if t is not threading.current_thread())
+            print(f"[MULTI-SOURCE] fork при работающих потоках ({names}) — создавайте распознаватель раньше",
+                  file=sys.stderr)
+        try:
+            from vosk import Model
+
+            model = Model(self.model_path)
+            mark_startup("vosk model loaded")
+            for i in range(len(self.buses)):
+                audio_recv, audio_send = self._ctx.Pipe(duplex=False)
+                control_recv, control_send = self._ctx.Pipe(duplex=False)
+                proc = self._ctx.Process(
+                    target=_worker_main, name=f"vosk-worker-{i}", daemon=True,
+                    args=(i, model, self.samplerate, audio_recv, control_recv,
+                          (audio_send, control_send, *self._audio, *self._control),
+                          self._results, self._grammar(), self.wake_on_partial, self._partial_filter),
+                )
+                proc.start()
+                audio_recv.close()  # читает только воркер
+                control_recv.close()
+                self._audio.append(audio_send)
+                self._control.append(control_send)
+                self._procs.append(proc)
+            print(f"🧩 Воркеров распознавания: {len(self._procs)} (модель общая, fork/COW)")
+        except BaseException as e:
+            self._error = e
+            print(f"[MODEL ERROR] {e}", file=sys.stderr)
+        finally:
+            self._ready.set()
+
+    # ---------------------- захват → воркеры ----------------------
+
+    def _feed(self, i: int) -> None:
+        bus = self.buses[i]
+        reader = bus.reader(samplerate=self.samplerate)
+        conn = self._audio[i]
+        was_paused = False
+        while self._running.is_set():
+            data = reader.read(self.blocksize, timeout=0.5)
+            if data is None:
+                continue
+            if self._paused.is_set():
+                was_paused = True
+                continue
+            if was_paused:
+                # звук, накопленный за время паузы, не распознаём
+                was_paused = False
+                reader.seek(bus.position)
+                continue
+            METRICS.gauge(f"multi_source_{i}_backlog_frames", reader.available())
+            self._store_level(i, data)
+            gate = self._gate
+            if gate is not None:
+                if i != self.active_source:
+                    continue  # barge-in слушает только активный микрофон
+                if not gate(data, self.samplerate):
+                    data = bytes(len(data))  # эхо ответа: декодеру — тишина той же длины
+            try:
+                conn.send_bytes(data)
+            except (OSError, ValueError):
+                return  # воркер остановлен
+
+    def _switch_mode(self, mode: str) -> bool:
+        # вызывается под self._lock; в barge-in грамматика — стоп-слова, режим применится после
+        if mode == self.mode:
+            return False
+        self.mode = mode
+        if self._gate is None:
+            self._broadcast(("grammar", self._grammar(), False))
+        return True
+
+    def _expire_mode(self) -> None:
+        with self._lock:
+            if self._mode_deadline is None or time.monotonic() < self._mode_deadline:
+                return
+            self._mode_deadline = None
+            mode = self._base_mode
+            changed = self._switch_mode(mode)
+        if changed:
+            print(f"🔁 Режим распознавания: {mode}")
+
+    def _grammar(self) -> Optional[list[str]]:
+        return self._keywords if self.mode == MODE_KEYWORDS and self._keywords else None
+
+    def _broadcast(self, msg: tuple) -> None:
+        with self._control_lock:
+            for conn in self._control:
+                try:
+                    conn.send(msg)
+                except (OSError, ValueError):
+                    pass
+
+    def _store_level(self, i: int, block) -> None:
+        a = np.frombuffer(block, dtype=np.int16).astype(np.float32)
+        row = self._levels[i]
+        row[self._level_idx[i] % row.size] = 10.0 * math.log10(float(np.dot(a, a)) / max(1, a.size) + 1.0)
+        self._level_idx[i] += 1
+
+    def _level(self, i: int) -> float:
+        return float(self._levels[i].max())
+
+    # ---------------------- воркеры → on_command ----------------------
+
+    def _dispatch(self) -> None:
+        pending: Optional[dict] = None   # фраза, собираемая с разных источников
+        recent: dict[str, float] = {}    # недавно отданные фразы → момент
+        while self._running.is_set():
+            timeout = 0.5 if pending is None else max(0.0, pending["deadline"] - time.monotonic())
+            try:
+                msg = self._results.get(timeout=timeout)
+            except queue.Empty:
+                msg = None
+            except (EOFError, OSError):
+                return
+
+            if msg is not None and msg[0] == "stats":
+                _, i, audio_s, cpu_s = msg
+                self._stats[i] = [audio_s, cpu_s]
+                msg = None
+
+            now = time.monotonic()
+            self._expire_mode()
+            registry = self._registry
+            if registry is not None and registry.version != self._registry_version:
+                self._registry_version = registry.version
+                self.set_keywords(registry.phrases())
+                print(f"🔁 Словарь команд обновлён (версия {self._registry_version})")
+            if msg is not None:
+                _, i, text = msg
+                if self._paused.is_set() or now - recent.get(text, float("-inf")) < self.dedupe_s:
+                    pass  # ту же фразу уже отдали с другого микрофона
+                elif pending is None:
+                    wait = 0.0 if self.policy == POLICY_FIRST else self.arbitration_s
+                    pending = {"deadline": now + wait, "first": i, "candidates": {i: (text, self._level(i))}}
+                else:
+                    pending["candidates"].setdefault(i, (text, self._level(i)))
+
+            if pending is not None and time.monotonic() >= pending["deadline"]:
+                cands = pending["candidates"]
+                if self.policy == POLICY_FIRST:
+                    winner = pending["first"]
+                else:
+                    winner = max(cands, key=lambda k: cands[k][1])
+                text = cands[winner][0]
+                pending = None
+                recent = {t: ts for t, ts in recent.items() if now - ts < self.dedupe_s}
+                for t, _level in cands.values():
+                    recent[t] = now
+                if len(cands) > 1:
+                    METRICS.count("multi_source_arbitrated")
+                self.active_source = winner
+                self.active_bus = self.buses[winner]
+                self._emit(text)
+
+    def _emit(self, text: str) -> None:
+        if not self._on_command:
+            return
+        try:
+            self._on_command(text)
+        except Exception as e:
+            print(f"[on_command error] {e}", file=sys.stderr)
+
+
+def _worker_main(index: int, model, samplerate: int, audio, control, parent_ends: tuple, results,
+                 grammar: Optional[list[str]], wake_on_partial: bool,
+                 partial_filter: Optional[Callable[[str], bool]]) -> None:
+    """Процесс-воркер: PCM16 из Pipe → Vosk → ("text", index, текст) в общую очередь."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C обрабатывает родитель
+    for conn in parent_ends:
+        conn.close()  # унаследованные через fork концы родителя: иначе EOF не придёт
+    from vosk import KaldiRecognizer
+
+    def make(words: Optional[list[str]]):
+        if words:
+            return KaldiRecognizer(model, samplerate, grammar_json(words))
+        return KaldiRecognizer(model, samplerate)
+
+    recognizer = make(grammar)
+    barge = False
+    fired = False
+    last_partial = ""
+    audio_s = cpu_s = 0.0
+    last_stats = time.monotonic()
+
+    while True:
+        ready = wait_connections([control, audio], timeout=1.0)
+        try:
+            if control in ready:
+                # управляющие сообщения — раньше звука: сброс или смена грамматики
+                msg = control.recv()
+                if msg[0] == "grammar":
+                    grammar, barge = msg[1], msg[2]
+                recognizer = make(grammar)
+                fired, last_partial = False, ""
+                continue
+            if audio not in ready:
+                continue
+            data = audio.recv_bytes()
+        except (EOFError, OSError):
+            return
+
+        started = time.thread_time()
+        final = recognizer.AcceptWaveform(data)
+        if final:
+            text = clean_text(json.loads(recognizer.Result() or "{}").get("text"))
+            was_fired, fired, last_partial = fired, False, ""
+            if text and not was_fired:
+                results.put(("text", index, text))
+        elif wake_on_partial and not fired:
+            partial = clean_text(json.loads(recognizer.PartialResult() or "{}").get("partial"))
+            if partial and partial != last_partial:
+                last_partial = partial
+                # в barge-in грамматика состоит только из стоп-слов — фильтр не нужен
+                if barge or partial_filter is None or partial_filter(partial):
+                    fired = True
+                    results.put(("text", index, partial))
+        audio_s += len(data) / (2 * samplerate)
+        cpu_s += time.thread_time() - started
+
+        now = time.monotonic()
+        if now - last_stats >= 2.0:
+            last_stats = now
+            results.put(("stats", index, audio_s, cpu_s))
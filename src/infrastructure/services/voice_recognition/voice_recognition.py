@@ -1,12 +1,25 @@
+import asyncio
 import queue
 import sys
 import json
 import threading
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import AsyncIterator, Callable, Iterable, Optional
+
 import sounddevice as sd
-from vosk import Model, KaldiRecognizer
+
+from infrastructure.services.audio_bus.audio_bus import SKIP_TO_LATEST, AudioCaptureBus, BusReader
+from infrastructure.services.voice_recognition.grammar import UNK, clean_text, grammar_json, grammar_words
+from infrastructure.utils.metrics import METRICS
+from infrastructure.utils.startup import mark_startup
 
 
+@lru_cache(maxsize=1)
 def get_input_device_index():
+    """Первое устройство с входными каналами; опрос делается один раз и кэшируется."""
     devices = sd.query_devices()
     for idx, dev in enumerate(devices):
         if dev["max_input_channels"] > 0:
@@ -15,8 +28,20 @@ def get_input_device_index():
     raise RuntimeError("❌ Нет доступного входного аудиоустройства.")
 
 
-DEVICE_INDEX = get_input_device_index()
-SAMPLERATE = int(sd.query_devices(DEVICE_INDEX)["default_samplerate"])
+@lru_cache(maxsize=None)
+def get_default_samplerate(device_index: int) -> int:
+    return int(sd.query_devices(device_index)["default_samplerate"])
+
+# Режимы декодирования
+MODE_FULL = "full"          # открытый словарь
+MODE_KEYWORDS = "keywords"  # грамматика: только фразы команд + [unk]
+
+
+@dataclass(frozen=True)
+class RecognizedWord:
+    word: str
+    start: int  # абсолютные позиции в кадрах шины захвата (как BusReader.pos)
+    end: int
 
 
 class VoiceStreamRecognizer:
@@ -25,24 +50,112 @@ class VoiceStreamRecognizer:
       - start(on_command) запускает микрофон и распознавание
       - pause(True) приостанавливает обработку (но микрофон остаётся открыт)
       - pause(False) возобновляет обработку
+
+    С общей шиной захвата (bus) собственный поток не открывается: распознавание
+    читает кольцевой буфер своим курсором, а пауза просто пропускает звук.
+
+    Режим keywords (keyword spotting): распознаватель строится с грамматикой Vosk
+    из фраз команд и [unk] — декодер перебирает несколько слов вместо всего словаря,
+    что заметно дешевле по CPU и даёт меньше ложных срабатываний.
+    set_mode(MODE_FULL, timeout=...) временно включает полное распознавание
+    (например, после ключевого слова), затем режим сам возвращается в keywords.
+    stats() — CPU-время и real-time factor по каждому режиму.
+
+    wake_on_partial: промежуточный результат (PartialResult) проверяется через
+    partial_filter после каждого блока, и on_command вызывается сразу, как только
+    фраза появилась, не дожидаясь конца высказывания. Срабатывание — одно на
+    высказывание; финальный результат того же высказывания уже не передаётся.
+    block_ms задаёт размер блока в миллисекундах (маленький блок — меньше задержка).
+
+    last_words: слова последнего результата, переданного в on_command, с позициями
+    в шине захвата (по таймстемпам Vosk, SetWords). position_after(char_end) — где
+    в шине кончается фраза команды: с этого места можно сразу записывать вопрос
+    («Шаня, какая завтра погода» одним высказыванием). Без шины позиции неизвестны.
+
+    barge_in(True, keywords, gate): распознавание во время ответа ассистента —
+    только по грамматике из keywords (стоп-слова), любой промежуточный результат
+    сразу уходит в on_command. gate(block, samplerate) отсекает эхо динамика:
+    отвергнутый блок подаётся в декодер тишиной. barge_in(False) возвращает
+    прежние словарь и режим и ставит распознавание на паузу.
+
+    commands() — то же без потока: async-итератор команд для event loop (только с шиной),
+    декодирование — в потоке-исполнителе, отставание сбрасывается к свежему звуку.
+
+    registry: реестр команд (.version, .phrases()) вместо keywords — когда его version
+    меняется, словарь грамматики пересобирается из phrases() перед следующим блоком.
+
+    pause/set_mode/set_keywords/barge_in зовутся из других потоков (loop, колбэк воспроизведения),
+    поэтому режим и словарь меняются под блокировкой, а распознаватель только помечается
+    устаревшим: пересоздаёт его поток декодирования перед следующим блоком, не посреди
+    AcceptWaveform.
+
+    Запуск не блокируется: устройство опрашивается лениво (только если не задано),
+    модель Vosk грузится в фоновом потоке, а микрофон открывается сразу —
+    звук копится в очереди/кольце и распознаётся, как только модель готова.
     """
 
-    def __init__(self, model_path: str, samplerate: int = SAMPLERATE, device_index: int = DEVICE_INDEX,
-                 blocksize: int = 8000, dtype: str = "int16", channels: int = 1):
-        self.model = Model(str(model_path))
-        self.recognizer = KaldiRecognizer(self.model, samplerate)
+    def __init__(self, model_path: str, samplerate: Optional[int] = None, device_index: Optional[int] = None,
+                 blocksize: int = 8000, dtype: str = "int16", channels: int = 1,
+                 bus: Optional[AudioCaptureBus] = None,
+                 mode: str = MODE_FULL, keywords: Iterable[str] = (),
+                 wake_on_partial: bool = False, partial_filter: Optional[Callable[[str], bool]] = None,
+                 block_ms: Optional[float] = None, registry=None):
+        if bus is not None:
+            # своя частота (например, 16 кГц для Vosk) — шина пересчитает; иначе частота шины
+            samplerate = samplerate or bus.samplerate
+            device_index, channels = bus.device_index, bus.channels
+        else:
+            if device_index is None:
+                device_index = get_input_device_index()
+            if samplerate is None:
+                samplerate = get_default_samplerate(device_index)
+        if block_ms is not None:
+            blocksize = max(1, int(samplerate * block_ms / 1000))
 
         self.samplerate = samplerate
         self.device_index = device_index
         self.blocksize = blocksize
         self.dtype = dtype
         self.channels = channels
+        self.bus = bus
 
-        self._audio_q: queue.Queue[bytes] = queue.Queue()
+        self._lock = threading.Lock()  # режим, словарь, гейт и пометка «распознаватель устарел»
+        self._registry = registry
+        self._registry_version: Optional[int] = None
+        if registry is not None:
+            self._registry_version = registry.version
+            keywords = registry.phrases()
+        self._keywords = grammar_words(keywords)
+        self.mode = mode
+        self._base_mode = mode
+        self._mode_deadline: Optional[float] = None
+        self._stats = {MODE_FULL: [0.0, 0.0], MODE_KEYWORDS: [0.0, 0.0]}  # [audio_s, cpu_s]
+
+        self.wake_on_partial = wake_on_partial
+        self._partial_filter = partial_filter
+        self._gate: Optional[Callable[[bytes, int], bool]] = None
+        self._saved_keywords: Optional[tuple[list[str], str, str]] = None
+        self._partial_fired = False
+        self._last_partial = ""
+        self.last_words: list[RecognizedWord] = []
+        self._fed_s = 0.0                     # звука подано текущему распознавателю, с
+        self._fed_end_pos: Optional[int] = None  # позиция шины на конце поданного звука
+
+        self.model_path = str(model_path)
+        self.model = None
+        self.recognizer = None
+        self._recognizer_stale = True  # распознаватель создаётся в потоке декодирования
+        self._model_ready = threading.Event()
+        self._model_error: Optional[BaseException] = None
+        threading.Thread(target=self._load_model, name="vosk-model-loader", daemon=True).start()
+
+        # своя очередь ограничена (~2 с звука): отстающий декодер теряет старые блоки, а не память
+        self._audio_q: queue.Queue[bytes] = queue.Queue(maxsize=max(4, int(2.0 * samplerate / blocksize)))
         self._running = threading.Event()
         self._paused = threading.Event()
         self._thread: threading.Thread | None = None
         self._stream: sd.RawInputStream | None = None
+        self._reader: BusReader | None = None
         self._on_command = None
 
     def start(self, on_command):
@@ -53,61 +166,353 @@ class VoiceStreamRecognizer:
         self._running.set()
         self._paused.clear()
 
-        self._stream = sd.RawInputStream(
-            samplerate=self.samplerate,
-            blocksize=self.blocksize,
-            dtype=self.dtype,
-            channels=self.channels,
-            device=self.device_index,
-            callback=self._audio_callback,
-        )
-        self._stream.start()
+        if self.bus is not None:
+            self.bus.start()
+            self._reader = self.bus.reader(samplerate=self.samplerate)
+        else:
+            self._stream = sd.RawInputStream(
+                samplerate=self.samplerate,
+                blocksize=self.blocksize,
+                dtype=self.dtype,
+                channels=self.channels,
+                device=self.device_index,
+                callback=self._audio_callback,
+            )
+            self._stream.start()
+
+        mark_startup("mic opened")
 
         self._thread = threading.Thread(target=self._loop, daemon=True)
         self._thread.start()
         print(f"▶️ Стрим запущен: device={self.device_index}, rate={self.samplerate}")
 
+    async def commands(self, executor: Optional[Executor] = None, max_lag_ms: float = 1000.0) -> AsyncIterator[str]:
+        """
+        Асинхронная стадия распознавания (только с шиной): команды — async-итератором.
+
+        Звук читается из кольца через AsyncBusReader в event loop, декодирование уходит
+        в executor (по умолчанию свой, в один поток: блоки идут строго по порядку).
+        Отстали больше чем на max_lag_ms — курсор прыгает к свежему звуку: для команд
+        старый звук бесполезен. pause()/barge_in() работают как с потоком;
+        отмена задачи-потребителя останавливает стадию. last_words — как в on_command.
+        """
+        if self.bus is None:
+            raise RuntimeError("Асинхронная стадия распознавания работает только с шиной захвата")
+        if self._running.is_set():
+            raise RuntimeError("Распознавание уже запущено через start()")
+        loop = asyncio.get_running_loop()
+        own_executor = executor is None
+        if own_executor:
+            executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vosk-decode")
+        self.bus.start()
+        reader = self.bus.async_reader(samplerate=self.samplerate, overflow=SKIP_TO_LATEST, max_lag_ms=max_lag_ms)
+        self._reader = reader  # pause(False) сдвигает курсор к свежему звуку
+        self._running.set()
+        self._paused.clear()
+        mark_startup("mic opened")
+        print(f"▶️ Асинхронное распознавание: device={self.device_index}, rate={self.samplerate}")
+        try:
+            # пока модель грузится, звук копится в кольце шины
+            await loop.run_in_executor(executor, self._model_ready.wait)
+            if self._model_error is not None:
+                return
+            mark_startup("listening")
+            while True:
+                data = await reader.read(self.blocksize)
+                if data is None:
+                    return
+                if self._paused.is_set():
+                    continue
+                hit = await loop.run_in_executor(executor, self._decode, data)
+                if hit is not None:
+                    text, words = hit
+                    self.last_words = self._word_spans(words)
+                    yield text
+        finally:
+            self._running.clear()
+            self._reader = None
+            reader.close()
+            if own_executor:
+                executor.shutdown(wait=False)
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """Дождаться загрузки модели."""
+        return self._model_ready.wait(timeout)
+
     def pause(self, flag: bool = True):
         """Управление паузой."""
         if flag:
             self._paused.set()
             self._reset_recognizer()
-            self._stream.stop()
+            if self._stream is not None:
+                self._stream.stop()
             print("⏸️ Распознавание приостановлено")
         else:
-            self._paused.clear()
             self._reset_recognizer()
-            self._stream.start()
+            if self._reader is not None:
+                # звук, накопленный за время паузы, не распознаём
+                self._reader.seek(self.bus.position)
+            if self._stream is not None:
+                self._stream.start()
+            self._paused.clear()
             print("▶️ Распознавание возобновлено")
 
+    def set_keywords(self, keywords: Iterable[str]) -> None:
+        """Обновить словарь грамматики (например, после регистрации новых команд)."""
+        words = grammar_words(keywords)
+        with self._lock:
+            if self._saved_keywords is not None:
+                # в barge-in грамматика — стоп-слова; новый словарь вернётся вместе с режимом
+                _, mode, base_mode = self._saved_keywords
+                self._saved_keywords = (words, mode, base_mode)
+                return
+            self._keywords = words
+            if self.mode == MODE_KEYWORDS:
+                self._recognizer_stale = True
+
+    def set_mode(self, mode: str, timeout: Optional[float] = None) -> None:
+        """
+        Переключить режим декодирования.
+        timeout — через сколько секунд вернуться в режим, заданный при создании.
+        """
+        if mode not in self._stats:
+            raise ValueError(f"Неизвестный режим распознавания: {mode}")
+        with self._lock:
+            if timeout is None:
+                self._base_mode = mode
+                self._mode_deadline = None
+            else:
+                self._mode_deadline = time.monotonic() + timeout
+            changed = self._switch_mode(mode)
+        if changed:
+            print(f"🔁 Режим распознавания: {mode}")
+
+    def barge_in(self, enable: bool, keywords: Iterable[str] = (),
+                 gate: Optional[Callable[[bytes, int], bool]] = None) -> None:
+        """Включить/выключить прослушивание стоп-слов во время ответа."""
+        if enable:
+            words = grammar_words(keywords)
+            with self._lock:
+                if self._saved_keywords is None:
+                    self._saved_keywords = (self._keywords, self.mode, self._base_mode)
+                self._keywords = words
+                self._gate = gate
+                self._mode_deadline = None
+                self.mode = MODE_KEYWORDS
+            self.pause(False)
+            print("🛑 Barge-in: слушаем стоп-слова во время ответа")
+        else:
+            with self._lock:
+                self._gate = None
+                if self._saved_keywords is not None:
+                    self._keywords, self.mode, self._base_mode = self._saved_keywords
+                    self._saved_keywords = None
+            self.pause(True)
+
+    @property
+    def active_bus(self) -> Optional[AudioCaptureBus]:
+        """Шина, с которой пришла последняя команда (как у MultiSourceRecognizer); здесь она одна."""
+        return self.bus
+
+    def position_after(self, char_end: int) -> Optional[int]:
+        """
+        Позиция шины на конце слова, в котором кончается текст [0, char_end) последнего
+        результата (char_end — как CommandMatch.end). None — позиции неизвестны.
+        """
+        offset = 0
+        for w in self.last_words:
+            offset += len(w.word)
+            if offset >= char_end:
+                return w.end
+            offset += 1  # пробел между словами
+        return None
+
+    def stats(self) -> dict:
+        """CPU-время и real-time factor (cpu_s / audio_s) по режимам."""
+        return {
+            mode: {"audio_s": round(audio_s, 3), "cpu_s": round(cpu_s, 3),
+                   "rtf": round(cpu_s / audio_s, 4) if audio_s else None}
+            for mode, (audio_s, cpu_s) in self._stats.items()
+        }
+
     # ===== Внутреннее =====
 
+    def _load_model(self) -> None:
+        try:
+            from vosk import Model  # тяжёлый импорт (libvosk) — тоже вне основного потока
+
+            self.model = Model(self.model_path)
+            mark_startup("vosk model loaded")
+        except BaseException as e:
+            self._model_error = e
+            print(f"[MODEL ERROR] {e}", file=sys.stderr)
+        finally:
+            self._model_ready.set()
+
+    def _make_recognizer(self, mode: str, keywords: list[str]) -> "KaldiRecognizer":
+        from vosk import KaldiRecognizer
+
+        if mode == MODE_KEYWORDS and keywords:
+            recognizer = KaldiRecognizer(self.model, self.samplerate, grammar_json(keywords))
+        else:
+            recognizer = KaldiRecognizer(self.model, self.samplerate)
+        if self.bus is not None:
+            # таймстемпы слов отсчитываются от создания распознавателя
+            recognizer.SetWords(True)
+            if hasattr(recognizer, "SetPartialWords"):  # vosk >= 0.3.45
+                recognizer.SetPartialWords(True)
+        self._fed_s = 0.0
+        return recognizer
+
     def _audio_callback(self, indata, frames, time, status):
         if status:
+            METRICS.count("audio_input_status")
             print(f"[AudioStatus] {status}", file=sys.stderr)
-        self._audio_q.put(bytes(indata))
+        block = bytes(indata)
+        try:
+            self._audio_q.put_nowait(block)
+        except queue.Full:
+            METRICS.count("recognizer_dropped_blocks")
+            try:
+                self._audio_q.get_nowait()  # старое — вон, свежее важнее для команд
+            except queue.Empty:
+                pass
+            self._audio_q.put_nowait(block)
+
+    def _next_block(self):
+        # ResampledReader отдаёт блок ~blocksize кадров на частоте распознавателя
+        if self._reader is not None:
+            METRICS.gauge("recognizer_backlog_frames", self._reader.available())
+            return self._reader.read(self.blocksize, timeout=0.5)
+        METRICS.gauge("recognizer_queue_depth", self._audio_q.qsize())
+        return self._audio_q.get()
 
     def _loop(self):
+        # пока модель грузится, звук копится в очереди/кольце шины
+        self._model_ready.wait()
+        if self._model_error is not None:
+            return
+        mark_startup("listening")
+
         while self._running.is_set():
-            data = self._audio_q.get()
+            data = self._next_block()
             if not self._running.is_set():
                 break
+            if data is None:
+                continue
 
             if self._paused.is_set():
                 continue
 
-            if self.recognizer.AcceptWaveform(data):
-                try:
-                    result = json.loads(self.recognizer.Result() or "{}")
-                except json.JSONDecodeError:
-                    continue
+            hit = self._decode(data)
+            if hit is not None:
+                self._emit(*hit)
+
+    def _decode(self, data) -> Optional[tuple[str, Optional[list[dict]]]]:
+        """Один блок через декодер; (текст, слова) — если есть что передать в on_command."""
+        registry = self._registry
+        if registry is not None and registry.version != self._registry_version:
+            self._registry_version = registry.version
+            self.set_keywords(registry.phrases())
+            print(f"🔁 Словарь команд обновлён (версия {self._registry_version})")
+        expired = rebuild = False
+        with self._lock:
+            if self._mode_deadline is not None and time.monotonic() >= self._mode_deadline:
+                self._mode_deadline = None
+                expired = self._switch_mode(self._base_mode)
+            mode, keywords, gate = self.mode, self._keywords, self._gate
+            if self._recognizer_stale:
+                self._recognizer_stale = False
+                rebuild = True
+        if expired:
+            print(f"🔁 Режим распознавания: {mode}")
+        if rebuild:
+            self.recognizer = self._make_recognizer(mode, keywords)
+            self._partial_fired = False
+            self._last_partial = ""
+
+        if gate is not None and not gate(data, self.samplerate):
+            data = bytes(len(data))  # эхо ответа: декодеру — тишина той же длины
+
+        recognizer = self.recognizer
+        cpu_started = time.thread_time()
+        final = recognizer.AcceptWaveform(data)
+        result_raw = recognizer.Result() if final else None
+        partial_raw = None
+        if not final and self.wake_on_partial and not self._partial_fired:
+            partial_raw = recognizer.PartialResult()
+        block_s = len(data) / (2 * self.channels * self.samplerate)
+        mode_stats = self._stats[mode]
+        mode_stats[0] += block_s
+        mode_stats[1] += time.thread_time() - cpu_started
+        if self._reader is not None:
+            self._fed_s += block_s
+            self._fed_end_pos = self._reader.pos
 
-                text = (result.get("text") or "").strip().lower()
-                if text and self._on_command:
-                    try:
-                        self._on_command(text)
-                    except Exception as e:
-                        print(f"[on_command error] {e}", file=sys.stderr)
+        if partial_raw is not None:
+            return self._check_partial(partial_raw, barge_in=gate is not None)
+
+        if final:
+            fired, self._partial_fired = self._partial_fired, False
+            self._last_partial = ""
+            try:
+                result = json.loads(result_raw or "{}")
+            except json.JSONDecodeError:
+                return None
+
+            text = clean_text(result.get("text"))
+            if text and not fired:
+                return text, result.get("result")
+        return None
+
+    def _check_partial(self, partial_raw: str, barge_in: bool = False) -> Optional[tuple[str, Optional[list[dict]]]]:
+        try:
+            result = json.loads(partial_raw or "{}")
+        except json.JSONDecodeError:
+            return None
+        partial = clean_text(result.get("partial"))
+        if not partial or partial == self._last_partial:
+            return None
+        self._last_partial = partial
+        # в barge-in грамматика состоит только из стоп-слов — фильтр не нужен
+        if barge_in or self._partial_filter is None or self._partial_filter(partial):
+            self._partial_fired = True
+            return partial, result.get("partial_result")
+        return None
+
+    def _word_spans(self, words: Optional[list[dict]]) -> list[RecognizedWord]:
+        # время слова (с от создания распознавателя) → позиция шины: отсчёт назад от конца поданного звука
+        end_pos = self._fed_end_pos
+        if not words or end_pos is None or self.bus is None:
+            return []
+        rate = self.bus.samplerate
+        fed_s = self._fed_s
+        return [
+            RecognizedWord(w["word"],
+                           start=end_pos - int((fed_s - w["start"]) * rate),
+                           end=end_pos - int((fed_s - w["end"]) * rate))
+            for w in words
+            if w.get("word") and w["word"] != UNK
+        ]
+
+    def _emit(self, text: str, words: Optional[list[dict]] = None) -> None:
+        self.last_words = self._word_spans(words)
+        if not self._on_command:
+            return
+        try:
+            self._on_command(text)
+        except Exception as e:
+            print(f"[on_command error] {e}", file=sys.stderr)
 
     def _reset_recognizer(self):
-        self.recognizer = KaldiRecognizer(self.model, self.samplerate)
+        # сам распознаватель пересоздаст поток декодирования перед следующим блоком
+        with self._lock:
+            self._recognizer_stale = True
+
+    def _switch_mode(self, mode: str) -> bool:
+        # вызывается под self._lock
+        if mode == self.mode:
+            return False
+        self.mode = mode
+        self._recognizer_stale = True
+        return True
@@ -0,0 +1,122 @@
+import mmap
+import tempfile
+from pathlib import Path
+from typing import IO, Optional, Union
+
+
+class RecordingBuffer:
+    """
+    Результат записи в памяти вместо файла send_audio.pcm.
+
+    Особенности:
+      - bytearray выделяется заранее (initial_s секунд звука) и растёт удвоением;
+        записанные байты не перемещаются внутри одного массива, поэтому write()
+        может отдать memoryview на только что записанный кусок без копии.
+      - Выше spill_bytes содержимое переносится во временный файл (tempfile, без имени
+        на диске), дальнейшие блоки дописываются туда — память на длинной фразе ограничена.
+      - view() — весь звук одним memoryview (из памяти или через mmap временного файла).
+      - trim(start, end) — оставить только кусок записи (например, речь без тишины
+        по краям); данные не копируются, меняются только границы view().
+    """
+
+    def __init__(self, samplerate: int, channels: int = 1, initial_s: float = 10.0,
+                 spill_bytes: int = 8 * 1024 * 1024):
+        self.samplerate = int(samplerate)
+        self.channels = int(channels)
+        self.spill_bytes = int(spill_bytes)
+        self._buf = bytearray(min(int(self.samplerate * self.channels * 2 * initial_s), self.spill_bytes))
+        self._len = 0
+        self._start = 0  # начало после trim()
+        self._file: Optional[IO[bytes]] = None
+        self._mmap: Optional[mmap.mmap] = None
+
+    # ---------------------- запись ----------------------
+
+    def write(self, data) -> Union[memoryview, bytes]:
+        """Дописать блок PCM16; возвращает записанный кусок (view в памяти или копию после spill)."""
+        n = len(data)
+        if self._file is None and self._len + n > self.spill_bytes:
+            self._spill()
+        if self._file is not None:
+            self._file.write(data)
+            self._len += n
+            return bytes(data)
+
+        if self._len + n > len(self._buf):
+            grown = bytearray(max(len(self._buf) * 2, self._len + n))
+            grown[:self._len] = memoryview(self._buf)[:self._len]
+            self._buf = grown
+        start = self._len
+        self._buf[start:start + n] = data
+        self._len += n
+        return memoryview(self._buf)[start:start + n]
+
+    # ---------------------- чтение ----------------------
+
+    def __len__(self) -> int:
+        return self._len - self._start
+
+    @property
+    def spilled(self) -> bool:
+        return self._file is not None
+
+    @property
+    def duration_s(self) -> float:
+        return len(self) / (2 * self.channels * self.samplerate)
+
+    def trim(self, start: int, end: int) -> None:
+        """Оставить байты [start, end) текущей записи (границы выравниваются по кадру)."""
+        frame = 2 * self.channels
+        size = len(self)
+        start = max(0, min(start, size))
+        end = max(start, min(end, size))
+        self._len = self._start + end - end % frame
+        self._start += start - start % frame
+
+    def view(self) -> memoryview:
+        """Весь записанный звук без копирования (освобождать через release() / with)."""
+        if self._file is None:
+            return memoryview(self._buf)[self._start:self._len]
+        if self._mmap is None or len(self._mmap) != self._len:
+            if self._mmap is not None:
+                try:
+                    self._mmap.close()
+                except BufferError:
+                    pass
+            self._file.flush()
+            self._mmap = mmap.mmap(self._file.fileno(), self._len, access=mmap.ACCESS_READ)
+        return memoryview(self._mmap)[self._start:]
+
+    def save(self, path: Union[str, Path]) -> Path:
+        """Сохранить в файл (для отладки)."""
+        path = Path(path)
+        with open(path, "wb") as f, self.view() as v:
+            f.write(v)
+        return path
+
+    def close(self) -> None:
+        self._buf = bytearray()
+        self._len = 0
+        self._start = 0
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                pass  # кто-то ещё держит view — отображение закроет сборщик мусора
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> "RecordingBuffer":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # ---------------------- внутренняя логика ----------------------
+
+    def _spill(self) -> None:
+        self._file = tempfile.TemporaryFile(prefix="appi-rec-")
+        self._file.write(memoryview(self._buf)[:self._len])
+        self._buf = bytearray()
@@ -0,0 +1,132 @@
+from typing import Union
+
+import numpy as np
+
+from infrastructure.utils.metrics import METRICS
+
+Chunk = Union[bytes, memoryview]
+
+
+def speech_span(
+    pcm,
+    samplerate: int,
+    channels: int = 1,
+    frame_ms: float = 10.0,
+    pad_ms: float = 200.0,
+    margin_db: float = 12.0,
+    min_level_db: float = 30.0,
+    min_speech_ms: float = 60.0,
+) -> tuple[int, int]:
+    """
+    Границы речи в записи PCM16 — (start, end) в байтах, с запасом pad_ms с каждой стороны.
+
+    Огибающая энергии считается разом по всем кадрам frame_ms (NumPy, без цикла по кадрам).
+    Порог — шумовой фон (10-й перцентиль кадров) + margin_db, но не ниже min_level_db.
+    Речью считаются только серии не короче min_speech_ms: щелчки и стуки границы не сдвигают.
+    Речь не найдена — возвращается вся запись (лучше отправить лишнее, чем потерять вопрос).
+    """
+    a = np.frombuffer(pcm, dtype=np.int16)
+    frame_bytes = 2 * channels
+    total = a.size * 2
+    frame = max(1, int(samplerate * frame_ms / 1000)) * channels
+    n = a.size // frame
+    if n == 0:
+        return 0, total
+
+    frames = a[:n * frame].reshape(n, frame).astype(np.float32)
+    level_db = 10.0 * np.log10(np.einsum("ij,ij->i", frames, frames) / frame + 1.0)
+    threshold = max(float(np.percentile(level_db, 10)) + margin_db, min_level_db)
+    loud = level_db > threshold
+
+    run = max(1, int(round(min_speech_ms / frame_ms)))
+    if run > 1:
+        # кадр — речь, если он начинает серию из run громких кадров подряд
+        counts = np.convolve(loud.astype(np.int32), np.ones(run, dtype=np.int32), mode="valid")
+        starts = np.flatnonzero(counts == run)
+        if starts.size == 0:
+            return 0, total
+        first, last = int(starts[0]), int(starts[-1]) + run - 1
+    else:
+        idx = np.flatnonzero(loud)
+        if idx.size == 0:
+            return 0, total
+        first, last = int(idx[0]), int(idx[-1])
+
+    pad = int(samplerate * pad_ms / 1000) * channels
+    start = max(0, first * frame - pad) * 2
+    end = min(a.size, (last + 1) * frame + pad) * 2
+    start -= start % frame_bytes
+    end -= end % frame_bytes
+    return start, end
+
+
+class SilenceHold:
+    """
+    Обрезка тишины для потоковой записи: решения «речь/не речь» приходят от VAD по блокам.
+
+      - До первой речи блоки копятся; с речью отдаются последние pad_ms из них.
+      - После речи тишина придерживается: вернулась речь — отдаётся вся, запись
+        закончилась — только первые pad_ms, остальное не отправляется.
+      - Речи так и не было — в finish() отдаётся всё (как без обрезки).
+    """
+
+    def __init__(self, samplerate: int, channels: int = 1, pad_ms: float = 200.0):
+        self.pad_bytes = int(samplerate * pad_ms / 1000) * 2 * channels
+        self._held: list[Chunk] = []
+        self._held_bytes = 0
+        self._speech_seen = False
+        self.total_bytes = 0
+        self.dropped_bytes = 0
+
+    def push(self, chunk: Chunk, speech: bool) -> list[Chunk]:
+        """Очередной блок и решение VAD по нему; возвращает блоки, которые можно отправлять."""
+        self.total_bytes += len(chunk)
+        if speech:
+            out = self._take_tail() if not self._speech_seen else self._take_all()
+            self._speech_seen = True
+            out.append(chunk)
+            return out
+        self._held.append(chunk)  # memoryview буфера записи — копий не держим
+        self._held_bytes += len(chunk)
+        return []
+
+    def finish(self) -> list[Chunk]:
+        """Конец записи: остаток после речи — не больше pad_ms."""
+        if not self._speech_seen:
+            return self._take_all()
+        out, size = [], 0
+        for chunk in self._held:
+            if size >= self.pad_bytes:
+                break
+            out.append(chunk)
+            size += len(chunk)
+        self.dropped_bytes += self._held_bytes - size
+        self._held, self._held_bytes = [], 0
+        return out
+
+    def _take_all(self) -> list[Chunk]:
+        out, self._held, self._held_bytes = self._held, [], 0
+        return out
+
+    def _take_tail(self) -> list[Chunk]:
+        self._drop_head()
+        return self._take_all()
+
+    def _drop_head(self) -> None:
+        # блоки целиком: отрезаем, пока без первого остаётся не меньше pad
+        while self._held and self._held_bytes - len(self._held[0]) >= self.pad_bytes:
+            chunk = self._held.pop(0)
+            self._held_bytes -= len(chunk)
+            self.dropped_bytes += len(chunk)
+
+
+def report_trim(total_bytes: int, dropped_bytes: int, samplerate: int, channels: int = 1,
+                debug: bool = True) -> None:
+    """Сколько байт и секунд не ушло в загрузку за реплику (метрики + лог)."""
+    bytes_per_s = 2 * channels * samplerate
+    METRICS.count("upload_trimmed_bytes", dropped_bytes)
+    METRICS.observe("upload_trimmed_ms", dropped_bytes * 1000.0 / bytes_per_s)
+    if debug:
+        sent = total_bytes - dropped_bytes
+        print(f"[TRIM] отправлено {sent / bytes_per_s:.2f} с из {total_bytes / bytes_per_s:.2f} с "
+              f"(−{dropped_bytes / 1024:.0f} КБ, −{dropped_bytes / bytes_per_s:.2f} с)")
@@ -2,24 +2,45 @@
 # requirements: sounddevice, numpy
 # pip install sounddevice numpy
 
+import asyncio
 import queue
 import threading
 import time
 from pathlib import Path
-from typing import Callable, Optional
+from typing import AsyncIterator, Callable, Optional, Union
 
 import numpy as np
 import sounddevice as sd
 
+from infrastructure.services.audio_bus.audio_bus import AudioCaptureBus, BusReader
+from infrastructure.services.vad.vad import IVad, RmsVad
+from infrastructure.services.voice_recording.recording_buffer import RecordingBuffer
+from infrastructure.services.voice_recording.trim import SilenceHold, report_trim, speech_span
+from infrastructure.utils.metrics import END_OF_SPEECH, METRICS, RECORDING_STARTED
+
 
 class VoiceRecording:
     """
     Запись в raw PCM16 (s16le) с автозавершением после N секунд тишины.
 
     Особенности:
-      - Файл send_audio.pcm сохраняется рядом с модулем и перезаписывается.
+      - Запись копится в памяти (RecordingBuffer) и передаётся в on_done без файла;
+        длинная фраза уходит во временный файл только выше spill_bytes.
+        filename — дополнительно сохранить запись в файл (для отладки).
       - Автокалибровка шумового фона (опционально).
       - Гистерезис порогов: voice_on_rms > voice_off_rms.
+      - Конец речи определяет подключаемый VAD (vad=...); по умолчанию — RmsVad
+        с порогами выше, либо, например, FrameVad с адаптивным шумовым фоном.
+      - Потоковый режим (record_stream): PCM-чанки отдаются по мере захвата,
+        не дожидаясь конца фразы; очередь в loop ограничена, при отставании — DROP_OLDEST.
+      - С общей шиной захвата (bus) устройство не переоткрывается, а запись может
+        начаться на pre_roll_ms в прошлом — начало фразы на стыке с ключевым словом не теряется.
+      - Асинхронный режим (stream, только с шиной): async-генератор чанков прямо в event loop,
+        без потока записи и очереди-посредника.
+      - trim_silence: тишина до речи (pre-roll, ожидание голоса) и после неё (таймер
+        тишины) не отправляется — остаётся речь с запасом trim_pad_ms с каждой стороны.
+        Запись целиком обрезается по огибающей энергии (speech_span), потоковая —
+        по решениям VAD: тишина придерживается и отдаётся, только если речь продолжилась.
     """
 
     def __init__(
@@ -36,10 +57,20 @@ class VoiceRecording:
         margin_on: float = 120.0,
         margin_off: float = 60.0,
         device_index: Optional[int] = None,
-        filename: str = "send_audio.pcm",
+        filename: Optional[str] = None,
         require_voice_first: bool = False,
         debug_rms: bool = True,
+        bus: Optional[AudioCaptureBus] = None,
+        pre_roll_ms: float = 0.0,
+        vad: Optional[IVad] = None,
+        spill_bytes: int = 8 * 1024 * 1024,
+        trim_silence: bool = True,
+        trim_pad_ms: float = 200.0,
     ):
+        if bus is not None:
+            # samplerate — частота записи; если у шины другая, она пересчитывается на чтении
+            channels, device_index = bus.channels, bus.device_index
+
         self.device_index = device_index
         self.samplerate = int(samplerate)
         self.channels = int(channels)
@@ -55,40 +86,151 @@ class VoiceRecording:
         self.margin_off = float(margin_off)
         self.require_voice_first = bool(require_voice_first)
         self.debug_rms = bool(debug_rms)
+        self.bus = bus
+        self.pre_roll_ms = float(pre_roll_ms)
+        self.vad = vad
+        self.spill_bytes = int(spill_bytes)
+        self.trim_silence = bool(trim_silence)
+        self.trim_pad_ms = float(trim_pad_ms)
 
         self.base_dir = Path(__file__).resolve().parent
-        self.outfile = self.base_dir / Path(filename).with_suffix(".pcm")
+        self.outfile = self.base_dir / Path(filename).with_suffix(".pcm") if filename else None
 
-        self._q: "queue.Queue[bytes]" = queue.Queue()
+        # своя очередь ограничена (~10 с звука, как кольцо шины): при зависшем потребителе
+        # теряются самые старые блоки, а память не растёт
+        self._q: "queue.Queue[bytes]" = queue.Queue(maxsize=max(8, int(10.0 * self.samplerate / self.blocksize)))
         self._running = threading.Event()
         self._worker: Optional[threading.Thread] = None
         self._stream: Optional[sd.RawInputStream] = None
-        self._on_done: Optional[Callable[[Path], None]] = None
+        self._reader: Optional[BusReader] = None
+        self._on_done: Optional[Callable[[RecordingBuffer], None]] = None
+        self._on_chunk: Optional[Callable[[Optional[Union[bytes, memoryview]]], None]] = None
         self._mic_lock = threading.Lock()
 
     # ---------------------- API ----------------------
 
-    def record_async(self, on_done: Callable[[Path], None]) -> None:
-        """Старт записи; on_done(path) вызовется после остановки по тишине."""
+    def record_async(
+        self,
+        on_done: Callable[[RecordingBuffer], None],
+        on_chunk: Optional[Callable[[Optional[Union[bytes, memoryview]]], None]] = None,
+        start_pos: Optional[int] = None,
+    ) -> None:
+        """
+        Старт записи; on_done(buffer) вызовется после остановки по тишине
+        (буфер закрывает получатель: buffer.close()).
+        on_chunk(data) (опционально) вызывается из потока записи на каждый блок,
+        on_chunk(None) — сигнал конца речи. data — кусок буфера записи, он не меняется.
+        start_pos — начать с этой позиции шины (например, с конца ключевого слова),
+        а не за pre_roll_ms до текущего момента: уже сказанный вопрос не теряется.
+        """
         if self._running.is_set():
             return
 
-        if self.outfile.exists():
-            try:
-                self.outfile.unlink()
-            except Exception:
-                pass
-
         self._on_done = on_done
+        self._on_chunk = on_chunk
         self._running.set()
 
-        with self._mic_lock:
-            self._open_stream_with_retry()
-        time.sleep(0.02)
-
+        if self.bus is not None:
+            self.bus.start()
+            self._reader = self.bus.reader(start_ms_ago=self.pre_roll_ms, samplerate=self.samplerate)
+            if start_pos is not None:
+                self._reader.seek(start_pos)
+        else:
+            with self._mic_lock:
+                self._open_stream_with_retry()
+            time.sleep(0.02)
+
+        METRICS.mark(RECORDING_STARTED)
         self._worker = threading.Thread(target=self._loop, name="pcm16-recorder", daemon=True)
         self._worker.start()
 
+    def record_stream(self, loop: asyncio.AbstractEventLoop,
+                      start_pos: Optional[int] = None) -> AsyncIterator[Union[bytes, memoryview]]:
+        """
+        Старт записи в потоковом режиме.
+        Возвращает async-итератор PCM16-чанков для loop; итератор завершается
+        по окончании речи (после silence_duration тишины).
+        Очередь в loop ограничена (~10 с звука, как кольцо шины): если потребитель отстал,
+        теряются самые старые чанки (DROP_OLDEST), сигнал конца речи — никогда.
+        """
+        if self._running.is_set():
+            raise RuntimeError("Запись уже идёт.")
+
+        q: "asyncio.Queue[Optional[Union[bytes, memoryview]]]" = asyncio.Queue(maxsize=self._q.maxsize)
+
+        def put(item: Optional[Union[bytes, memoryview]]) -> None:
+            if q.full():
+                q.get_nowait()
+                METRICS.count("recorder_stream_dropped_chunks")
+            q.put_nowait(item)
+
+        def push(item: Optional[Union[bytes, memoryview]]) -> None:
+            loop.call_soon_threadsafe(put, item)
+
+        self.record_async(on_done=lambda buffer: buffer.close(), on_chunk=push, start_pos=start_pos)
+
+        async def chunks() -> AsyncIterator[Union[bytes, memoryview]]:
+            while True:
+                chunk = await q.get()
+                if chunk is None:
+                    return
+                yield chunk
+
+        return chunks()
+
+    async def stream(self, start_pos: Optional[int] = None) -> AsyncIterator[Union[bytes, memoryview]]:
+        """
+        Асинхронная стадия записи (только с шиной): PCM16-чанки до конца речи, без потока записи.
+
+        Звук читается из кольца через AsyncBusReader (DROP_OLDEST: запись не теряет звук,
+        пока отставание меньше ёмкости кольца), VAD и обрезка тишины — прямо в loop
+        (numpy по блоку ~85 мс — доли миллисекунды). Отмена потребителя закрывает курсор.
+        Автокалибровки здесь нет — для неё нужен поток (record_async/record_stream).
+        """
+        if self.bus is None:
+            raise RuntimeError("Асинхронная стадия записи работает только с шиной захвата")
+        if self._running.is_set():
+            raise RuntimeError("Запись уже идёт.")
+        self._running.set()
+        self.bus.start()
+        reader = self.bus.async_reader(start_ms_ago=self.pre_roll_ms, samplerate=self.samplerate)
+        if start_pos is not None:
+            reader.seek(start_pos)
+        METRICS.mark(RECORDING_STARTED)
+
+        vad = self._make_vad()
+        buffer = RecordingBuffer(self.samplerate, self.channels, spill_bytes=self.spill_bytes)
+        hold = SilenceHold(self.samplerate, self.channels, pad_ms=self.trim_pad_ms) if self.trim_silence else None
+        state = "waiting_voice" if self.require_voice_first else "recording"
+        try:
+            while self._running.is_set():
+                data = await reader.read(self.blocksize)
+                if data is None:
+                    break
+                METRICS.gauge("recorder_backlog_frames", reader.available())
+                stored = buffer.write(data)
+                res = vad.process(data)
+                for chunk in (hold.push(stored, res.speech) if hold is not None else (stored,)):
+                    yield chunk
+                if state == "waiting_voice":
+                    if res.speech:
+                        state = "recording"
+                    continue
+                if res.end_of_speech:
+                    break
+
+            METRICS.mark(END_OF_SPEECH)
+            if hold is not None:
+                for chunk in hold.finish():
+                    yield chunk
+                report_trim(hold.total_bytes, hold.dropped_bytes, self.samplerate, self.channels, self.debug_rms)
+            if self.outfile is not None:
+                buffer.save(self.outfile)
+        finally:
+            reader.close()
+            self._running.clear()
+            buffer.close()
+
     def stop(self) -> None:
         """Принудительная остановка."""
         self._running.clear()
@@ -132,7 +274,27 @@ class VoiceRecording:
         raise last_err
 
     def _cb(self, indata, frames, time_info, status):
-        self._q.put(bytes(indata))
+        block = bytes(indata)
+        try:
+            self._q.put_nowait(block)
+        except queue.Full:
+            METRICS.count("recorder_dropped_blocks")
+            try:
+                self._q.get_nowait()
+            except queue.Empty:
+                pass
+            self._q.put_nowait(block)
+
+    def _next_block(self, timeout: float):
+        """Следующий блок PCM16: из общей шины или из собственной очереди; queue.Empty — нет данных."""
+        if self._reader is not None:
+            METRICS.gauge("recorder_backlog_frames", self._reader.available())
+            data = self._reader.read(self.blocksize, timeout=timeout)
+            if data is None:
+                raise queue.Empty
+            return data
+        METRICS.gauge("recorder_queue_depth", self._q.qsize())
+        return self._q.get(timeout=timeout)
 
     @staticmethod
     def _rms_int16(buf: bytes) -> float:
@@ -145,7 +307,7 @@ class VoiceRecording:
         rms_values = []
         while time.monotonic() < deadline and self._running.is_set():
             try:
-                data = self._q.get(timeout=0.2)
+                data = self._next_block(timeout=0.2)
             except queue.Empty:
                 continue
             rms = self._rms_int16(data)
@@ -166,45 +328,60 @@ class VoiceRecording:
         if self.debug_rms:
             print(f"[CALIB] noise={noise_rms:.1f}, on={on_new:.1f}, off={off_new:.1f}")
 
+    def _make_vad(self) -> IVad:
+        if self.vad is None:
+            vad: IVad = RmsVad(self.samplerate * self.channels, self.voice_on_rms, self.voice_off_rms,
+                               self.silence_duration)
+        else:
+            vad = self.vad  # свой VAD адаптируется сам, калибровка порогов RMS не нужна
+        vad.reset()
+        return vad
+
     def _loop(self):
         state = "waiting_voice" if self.require_voice_first else "recording"
         silence_started_at: float | None = None
 
-        if self.auto_calibrate:
+        if self.vad is None and self.auto_calibrate:
             self._calibrate_thresholds(deadline=time.monotonic() + self.calib_max_time)
+        vad = self._make_vad()
 
-        with open(self.outfile, "wb") as f:
-            while self._running.is_set():
-                try:
-                    data = self._q.get(timeout=0.5)
-                except queue.Empty:
-                    if state == "recording" and silence_started_at is not None:
-                        if time.monotonic() - silence_started_at >= self.silence_duration:
-                            break
-                    continue
-
-                f.write(data)
-
-                rms = self._rms_int16(data)
-
-                if state == "waiting_voice":
-                    if rms >= self.voice_on_rms:
-                        state = "recording"
-                        silence_started_at = None
-                    continue
+        buffer = RecordingBuffer(self.samplerate, self.channels, spill_bytes=self.spill_bytes)
+        hold = None
+        if self.trim_silence and self._on_chunk:
+            hold = SilenceHold(self.samplerate, self.channels, pad_ms=self.trim_pad_ms)
+        while self._running.is_set():
+            try:
+                data = self._next_block(timeout=0.5)
+            except queue.Empty:
+                if state == "recording" and silence_started_at is not None:
+                    if time.monotonic() - silence_started_at >= self.silence_duration:
+                        break
+                continue
 
-                if rms >= self.voice_on_rms:
+            # память шины переиспользуется — блок копируется один раз, в буфер записи
+            stored = buffer.write(data)
+            res = vad.process(data)
+            if hold is not None:
+                for chunk in hold.push(stored, res.speech):
+                    self._on_chunk(chunk)
+            elif self._on_chunk:
+                self._on_chunk(stored)
+
+            if state == "waiting_voice":
+                if res.speech:
+                    state = "recording"
                     silence_started_at = None
-                    continue
+                continue
 
-                if rms <= self.voice_off_rms:
-                    if silence_started_at is None:
-                        silence_started_at = time.monotonic()
-                    elif time.monotonic() - silence_started_at >= self.silence_duration:
-                        break
-                else:
-                    silence_started_at = None
+            if res.end_of_speech:
+                break
+            # часы тишины — на случай, если блоки перестанут приходить
+            if res.speech:
+                silence_started_at = None
+            elif silence_started_at is None:
+                silence_started_at = time.monotonic()
 
+        METRICS.mark(END_OF_SPEECH)
         with self._mic_lock:
             try:
                 if self._stream:
@@ -212,12 +389,33 @@ class VoiceRecording:
                     self._stream.close()
             finally:
                 self._stream = None
+                self._reader = None
                 self._running.clear()
 
+        chunk_cb = self._on_chunk
+        self._on_chunk = None
+        if chunk_cb:
+            if hold is not None:
+                for chunk in hold.finish():
+                    chunk_cb(chunk)
+                report_trim(hold.total_bytes, hold.dropped_bytes, self.samplerate, self.channels, self.debug_rms)
+            chunk_cb(None)
+        elif self.trim_silence and len(buffer) > 0:
+            total = len(buffer)
+            with buffer.view() as pcm:
+                start, end = speech_span(pcm, self.samplerate, self.channels, pad_ms=self.trim_pad_ms)
+            buffer.trim(start, end)
+            report_trim(total, total - len(buffer), self.samplerate, self.channels, self.debug_rms)
+
+        if self.outfile is not None:
+            buffer.save(self.outfile)
+
         cb = self._on_done
         self._on_done = None
-        if cb and self.outfile.exists() and self.outfile.stat().st_size > 0:
+        if cb and len(buffer) > 0:
             try:
-                cb(self.outfile)
+                cb(buffer)
             except Exception:
-                pass
\ No newline at end of file
+                buffer.close()
+        else:
+            buffer.close()
\ No newline at end of file
@@ -0,0 +1,27 @@
+import sqlite3
+from pathlib import Path
+from typing import Union
+
+DEFAULT_DB_PATH = Path(__file__).resolve().parents[1] / "commands.db"
+
+
+def connect(path: Union[str, Path] = DEFAULT_DB_PATH, cached_statements: int = 256) -> sqlite3.Connection:
+    """
+    Соединение SQLite, настроенное под частые короткие чтения с потока распознавания.
+
+      - WAL: чтения не блокируются записью, запись не делает fsync на каждую транзакцию.
+      - cached_statements: скомпилированные запросы переиспользуются по тексту SQL.
+      - check_same_thread=False: соединение общее, сериализация — на стороне вызывающего.
+    """
+    conn = sqlite3.connect(
+        str(path),
+        check_same_thread=False,
+        cached_statements=cached_statements,
+        isolation_level=None,  # транзакции — явно, через BEGIN/COMMIT
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA mmap_size=67108864")
+    conn.execute("PRAGMA foreign_keys=ON")
+    return conn
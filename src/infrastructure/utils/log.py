@@ -0,0 +1,37 @@
+import logging
+import threading
+
+from common.utils import get_env
+
+_configured = False
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Логгер приложения; уровень — из APPI_LOG_LEVEL (по умолчанию INFO)."""
+    global _configured
+    if not _configured:
+        logging.basicConfig(
+            level=get_env("APPI_LOG_LEVEL", "INFO").upper(),
+            format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+        )
+        _configured = True
+    return logging.getLogger(name)
+
+
+class Sampler:
+    """
+    Пропускает каждое every-е событие по ключу (первое — всегда).
+    Проверять после logger.isEnabledFor(...), чтобы при выключенном уровне
+    не тратить даже счётчик.
+    """
+
+    def __init__(self, every: int = 50):
+        self.every = max(1, int(every))
+        self._seen: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def take(self, key: str) -> bool:
+        with self._lock:
+            n = self._seen.get(key, 0)
+            self._seen[key] = n + 1
+        return n % self.every == 0
@@ -0,0 +1,105 @@
+import os
+import threading
+from typing import Optional
+
+from infrastructure.utils.metrics import METRICS
+
+IDLE = "idle"  # между репликами: распознавание ключевого слова
+
+_PAGE_KB = os.sysconf("SC_PAGE_SIZE") // 1024 if hasattr(os, "sysconf") else 4
+
+
+def rss_kb() -> Optional[int]:
+    """Текущий RSS процесса, КБ (/proc/self/statm — одна строка, дешевле status). None — не Linux."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_KB
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def peak_rss_kb() -> Optional[int]:
+    """Пиковый RSS за жизнь процесса (VmHWM), КБ."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def trim_heap() -> None:
+    """Вернуть ОС освободившуюся память кучи (glibc malloc_trim): после длинного ответа RSS опускается."""
+    try:
+        import ctypes
+
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass  # не glibc — память вернётся, когда аллокатор сочтёт нужным
+
+
+class RssMonitor:
+    """
+    Пиковый RSS по этапам реплики — чтобы видеть запас до OOM killer на плате с 512 МБ.
+
+    Фоновый поток раз в interval_s читает /proc/self/statm; этап — последняя метка
+    текущей реплики в METRICS (recording_started, upload_committed, first_audio...),
+    между репликами — idle. Пики по этапам и общий VmHWM уходят в gauges METRICS
+    (rss_peak_kb.<этап>) и в report(). Короткий всплеск между опросами может не попасть
+    в пик этапа, но попадёт в VmHWM.
+    """
+
+    def __init__(self, interval_s: float = 0.1):
+        self.interval_s = float(interval_s)
+        self._peaks: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self) -> None:
+        if self._thread is not None or rss_kb() is None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="rss-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+    def sample(self) -> Optional[int]:
+        """Один замер: текущий RSS засчитывается в пик текущего этапа."""
+        rss = rss_kb()
+        if rss is None:
+            return None
+        stage = METRICS.current_stage() or IDLE
+        with self._lock:
+            if rss <= self._peaks.get(stage, 0):
+                return rss
+            self._peaks[stage] = rss
+        METRICS.gauge(f"rss_peak_kb.{stage}", rss)
+        return rss
+
+    def peaks(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self._peaks)
+
+    def report(self) -> str:
+        lines = [f"[RSS] {stage:<20} пик {kb / 1024:6.1f} МБ" for stage, kb in self.peaks().items()]
+        hwm = peak_rss_kb()
+        if hwm is not None:
+            lines.append(f"[RSS] {'VmHWM':<20} пик {hwm / 1024:6.1f} МБ")
+        return "\n".join(lines)
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            rss = self.sample()
+            if rss is not None:
+                METRICS.gauge("rss_kb", rss)
+
+
+RSS = RssMonitor()
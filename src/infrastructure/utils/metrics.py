@@ -0,0 +1,194 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional, Union
+
+# Этапы реплики в порядке прохождения
+WAKE = "wake"
+RECORDING_STARTED = "recording_started"
+END_OF_SPEECH = "end_of_speech"
+WS_OPEN = "ws_open"
+UPLOAD_COMMITTED = "upload_committed"
+FIRST_AUDIO = "first_audio"
+PLAYBACK_FINISHED = "playback_finished"
+
+STAGES = (WAKE, RECORDING_STARTED, END_OF_SPEECH, WS_OPEN, UPLOAD_COMMITTED, FIRST_AUDIO, PLAYBACK_FINISHED)
+
+
+class RollingHistogram:
+    """Последние window значений (мс) и перцентили по ним."""
+
+    def __init__(self, window: int = 200):
+        self._values: deque[float] = deque(maxlen=window)
+
+    def add(self, value: float) -> None:
+        self._values.append(value)
+
+    def snapshot(self) -> dict:
+        values = sorted(self._values)
+        if not values:
+            return {"count": 0}
+        n = len(values)
+        return {
+            "count": n,
+            "mean": round(sum(values) / n, 1),
+            "p50": round(values[n // 2], 1),
+            "p90": round(values[min(n - 1, int(n * 0.9))], 1),
+            "p99": round(values[min(n - 1, int(n * 0.99))], 1),
+            "max": round(values[-1], 1),
+        }
+
+
+class Metrics:
+    """
+    Лёгкая трассировка реплики и счётчики.
+
+      - begin_turn() (по ключевому слову) открывает реплику, mark(stage) ставит
+        метку time.monotonic(); в гистограмму этапа идёт время от wake, в мс.
+      - count()/gauge() — счётчики и текущие значения (глубина очередей, пропуски блоков).
+      - snapshot() — всё одним dict; export_json() / serve() — наружу через файл или
+        локальный HTTP (/metrics — текст, /metrics.json — JSON).
+    Все методы потокобезопасны: вызываются из PortAudio-колбэков, потоков и asyncio.
+    """
+
+    def __init__(self, window: int = 200):
+        self._lock = threading.Lock()
+        self._window = window
+        self._hist: dict[str, RollingHistogram] = {}
+        self._counters: dict[str, int] = {}
+        self._gauges: dict[str, float] = {}
+        self._turn: dict[str, float] = {}
+        self._turns = 0
+        self._last_turn: dict[str, float] = {}
+
+    # ---------------------- трассировка реплики ----------------------
+
+    def begin_turn(self) -> None:
+        with self._lock:
+            self._turns += 1
+            self._turn = {WAKE: time.monotonic()}
+
+    def mark(self, stage: str) -> None:
+        """Метка этапа текущей реплики (повторная метка этапа игнорируется)."""
+        now = time.monotonic()
+        with self._lock:
+            t0 = self._turn.get(WAKE)
+            if t0 is None or stage in self._turn:
+                return
+            self._turn[stage] = now
+            self._hist_for(stage).add((now - t0) * 1000.0)
+
+    def current_stage(self) -> Optional[str]:
+        """Последний пройденный этап текущей реплики; None — реплики нет."""
+        with self._lock:
+            if not self._turn:
+                return None
+            return max(self._turn, key=self._turn.__getitem__)
+
+    def end_turn(self) -> None:
+        with self._lock:
+            t0 = self._turn.get(WAKE)
+            if t0 is not None:
+                self._last_turn = {k: round((v - t0) * 1000.0, 1) for k, v in self._turn.items()}
+            self._turn = {}
+
+    # ---------------------- счётчики ----------------------
+
+    def count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def gauge(self, name: str, value: float) -> None:
+        with self._lock:
+            self._gauges[name] = value
+            peak = name + "_max"
+            if value > self._gauges.get(peak, float("-inf")):
+                self._gauges[peak] = value
+
+    def observe(self, name: str, value_ms: float) -> None:
+        """Произвольное значение в гистограмму (мс)."""
+        with self._lock:
+            self._hist_for(name).add(value_ms)
+
+    # ---------------------- экспорт ----------------------
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            ordered = [s for s in STAGES if s in self._hist] + sorted(set(self._hist) - set(STAGES))
+            return {
+                "turns": self._turns,
+                "stages_ms_since_wake": {name: self._hist[name].snapshot() for name in ordered},
+                "last_turn_ms": dict(self._last_turn),
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+            }
+
+    def render_text(self) -> str:
+        snap = self.snapshot()
+        lines = [f"turns {snap['turns']}"]
+        for name, h in snap["stages_ms_since_wake"].items():
+            lines.append(f"stage {name} " + " ".join(f"{k}={v}" for k, v in h.items()))
+        for name, v in snap["counters"].items():
+            lines.append(f"counter {name} {v}")
+        for name, v in snap["gauges"].items():
+            lines.append(f"gauge {name} {v}")
+        return "\n".join(lines) + "\n"
+
+    def export_json(self, path: Union[str, Path]) -> None:
+        path = Path(path)
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_text(json.dumps(self.snapshot(), ensure_ascii=False, indent=2))
+        os.replace(tmp, path)  # атомарно: читатель не увидит полузаписанный файл
+
+    def start_exporter(self, path: Optional[Union[str, Path]] = None, port: Optional[int] = None,
+                       interval: float = 5.0) -> None:
+        """Периодическая выгрузка в JSON-файл и/или HTTP на 127.0.0.1:port."""
+        if port:
+            server = ThreadingHTTPServer(("127.0.0.1", int(port)), _handler_for(self))
+            threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+            print(f"[METRICS] http://127.0.0.1:{port}/metrics")
+        if path:
+            def _dump():
+                while True:
+                    time.sleep(interval)
+                    try:
+                        self.export_json(path)
+                    except OSError as e:
+                        print(f"[METRICS] Не удалось записать {path}: {e}")
+
+            threading.Thread(target=_dump, name="metrics-dump", daemon=True).start()
+
+    def _hist_for(self, name: str) -> RollingHistogram:
+        h = self._hist.get(name)
+        if h is None:
+            h = self._hist[name] = RollingHistogram(self._window)
+        return h
+
+
+def _handler_for(metrics: Metrics):
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.startswith("/metrics.json"):
+                body, ctype = json.dumps(metrics.snapshot(), ensure_ascii=False).encode(), "application/json"
+            elif self.path.startswith("/metrics"):
+                body, ctype = metrics.render_text().encode(), "text/plain; charset=utf-8"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return _Handler
+
+
+METRICS = Metrics()
@@ -0,0 +1,50 @@
+import os
+import threading
+import time
+from typing import Optional
+
+# Точка отсчёта — первый импорт модуля (обычно самое начало main.py)
+_T0 = time.monotonic()
+_marks: list[tuple[str, float, Optional[int]]] = []
+_lock = threading.Lock()
+
+
+def _process_age() -> float:
+    """Сколько секунд процесс уже жил к моменту импорта (интерпретатор + импорты до нас)."""
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, uptime - start_ticks / os.sysconf("SC_CLK_TCK") - (time.monotonic() - _T0))
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+_PRE_IMPORT = _process_age()
+
+
+def mark_startup(stage: str) -> None:
+    """Отметить этап запуска (потокобезопасно, повторная отметка этапа игнорируется); RSS — на момент метки."""
+    from infrastructure.utils.memory import rss_kb  # лениво: startup импортируется первым и сам ничего не тянет
+
+    now = time.monotonic() - _T0
+    rss = rss_kb()
+    with _lock:
+        if any(name == stage for name, _, _ in _marks):
+            return
+        _marks.append((stage, now, rss))
+
+
+def startup_report() -> str:
+    with _lock:
+        marks = list(_marks)
+    lines = [f"[STARTUP] до импорта main: {_PRE_IMPORT * 1000:.0f} мс"]
+    prev = 0.0
+    for stage, t, rss in marks:
+        line = f"[STARTUP] {stage:<24} +{(t - prev) * 1000:6.0f} мс  (итого {(t + _PRE_IMPORT) * 1000:.0f} мс)"
+        if rss is not None:
+            line += f"  RSS {rss / 1024:.1f} МБ"
+        lines.append(line)
+        prev = t
+    return "\n".join(lines)